@@ -3,11 +3,13 @@ certain pattern.
 """
 from pymudclient.matchers import BindingPlaceholder, NonbindingPlaceholder, \
                             ProtoMatcher, make_decorator, BaseMatchingRealm
+from pymudclient.matcher_index import mark_indexable
 import re
 
 class Alias(ProtoMatcher):
     """Matches on the user's input."""
 
+    @mark_indexable
     def match(self, line):
         """Check to see if the line matches against our criteria."""
         return list(re.finditer(self.regex, line))
@@ -55,7 +57,8 @@ class AliasMatchingRealm(BaseMatchingRealm):
         #matching -doesn't- nest like trigger matching, so the parent for any
         #AliasMatchingRealms created by an alias will be the same as ours.
         #Voila, magic.
-        self._match_generic(self.line, self.root.aliases)
+        self._match_generic(self.line, self.root.alias_index.candidates(
+                                               self.root.aliases, self.line))
 
         if self.send_to_mud:
             if self.echo:
@@ -1,10 +1,11 @@
 from pymudclient.escape_parser import EscapeParser
 from code import InteractiveConsole
-from textwrap import TextWrapper
+from pymudclient.wrapping import LineWrapper
 import time
 from pymudclient.colours import HexFGCode, bg_code, BLACK
 from pymudclient.metaline import simpleml, json_to_metaline, metaline_to_json
 from pymudclient.net.telnet import TelnetClientFactory
+from pymudclient.net.gmcp import GmcpStore, RawPayload
 import json
 from twisted.internet.protocol import ProcessProtocol
 from twisted.protocols.basic import LineReceiver
@@ -25,6 +26,9 @@ class ClientProtocol(ProcessProtocol, LineReceiver):
         self.messages_not_acknowledged = 0
         self.buffering = False
         self.buffer = ''
+        #the GMCP message types this processor has been sent in full, and
+        #so can be sent just what's changed.
+        self.gmcp_sent_in_full = set()
         
     def send_to_client(self, meth, params):
         line = json.dumps([meth, params])
@@ -150,8 +154,22 @@ class ClientProtocol(ProcessProtocol, LineReceiver):
             self.client_started_processing_at = time.time()
         self.messages_not_acknowledged += 1
     
-    def do_gmcp(self, gmcp_pair):
-        self.send_to_client("do_gmcp", [gmcp_pair])
+    def do_gmcp(self, gmcp_pair, delta = None):
+        gmcp_type, payload = gmcp_pair
+        if delta is not None and not delta.whole and not delta.merged and \
+           gmcp_type in self.gmcp_sent_in_full:
+            #the processor's got the rest already.
+            self.send_to_client("do_gmcp_delta", [gmcp_type, delta.changed,
+                                                  delta.removed])
+        else:
+            #either it's new to this processor (a reloaded one, say), or it
+            #only makes sense as the message the MUD sent.
+            self.gmcp_sent_in_full.add(gmcp_type)
+            if isinstance(payload, RawPayload):
+                #no need to decode it here just to encode it again.
+                self.send_to_client("do_gmcp_raw", [gmcp_type, payload.text])
+            else:
+                self.send_to_client("do_gmcp", [gmcp_pair])
         if not self.messages_not_acknowledged:
             self.client_started_processing_at = time.time()
         self.messages_not_acknowledged += 1
@@ -180,7 +198,7 @@ class Connector:
         self.client=None
         self._escape_parser=EscapeParser()
         self.console=InteractiveConsole()
-        self.wrapper = TextWrapper(width=100, drop_whitespace=False)
+        self.wrapper = LineWrapper(width=100)
         self._closing_down = False
         self.protocols = []
         self.extra_gui = None
@@ -190,7 +208,7 @@ class Connector:
         self._last_line_end = None
         self.active_channels=['main']
         self.gmcp_handler=None
-        self.gmcp={}
+        self.gmcp=GmcpStore()
         self.server_echo=False
         self.processor_exec = ''
         self.module_name = ''
@@ -356,8 +374,8 @@ class Connector:
     def setActiveChannels(self, channels):
         self.active_channels = channels
         
-    def gmcpReceived(self, gmcp_pair):
-        self.client.do_gmcp(gmcp_pair)
+    def gmcpReceived(self, gmcp_pair, delta = None):
+        self.client.do_gmcp(gmcp_pair, delta)
         
     def set_state(self, name, value):
         self.state[name]=value
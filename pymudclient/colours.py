@@ -34,48 +34,130 @@ bolded_colours = {BLACK: (0x80, 0x80, 0x80),
                   GREY: (0x80, 0x80, 0x80),
                   ORANGE: (0xFF, 0xA5, 0x00)}
 
+#the xterm 256 colour palette: the first sixteen are our usual colours, then
+#there's a 6x6x6 colour cube, then a ramp of greys.
+_cube_levels = (0x00, 0x5F, 0x87, 0xAF, 0xD7, 0xFF)
+xterm_colours = ([normal_colours[str(num)] for num in xrange(8)] +
+                 [bolded_colours[str(num)] for num in xrange(8)] +
+                 [(red, green, blue) for red in _cube_levels
+                                     for green in _cube_levels
+                                     for blue in _cube_levels] +
+                 [(level, level, level) for level in xrange(8, 248, 10)])
+_xterm_triples = frozenset(xterm_colours)
+
+def _nearest_level(value, levels):
+    """Return the member of levels that's closest to value."""
+    return min(levels, key = lambda level: abs(level - value))
+
+def nearest_xterm(red, green, blue):
+    """Return the closest colour in the xterm 256 colour cube or grey ramp
+    to the given one.
+    """
+    cube = tuple(_nearest_level(value, _cube_levels)
+                 for value in (red, green, blue))
+    grey_level = _nearest_level((red + green + blue) // 3,
+                                xrange(8, 248, 10))
+    grey = (grey_level, grey_level, grey_level)
+    def distance(other):
+        return sum((a - b) ** 2 for a, b in zip((red, green, blue), other))
+    return min(cube, grey, key = distance)
+
+def _triple_for(code, bold):
+    """Turn a colour code into its red, green and blue values.
+
+    The code can be one of our usual VT100 codes, an integer indexing the
+    xterm 256 colour palette, or a (red, green, blue) triple for truecolour.
+    Bold only matters to the VT100 codes.
+    """
+    if isinstance(code, tuple):
+        return code
+    if isinstance(code, (int, long)):
+        return xterm_colours[code]
+    if bold:
+        return bolded_colours[code]
+    return normal_colours[code]
+
 _fg_cache = {}
 def fg_code(code, bold):
-    """Wrapper to convert a VT100 colour code to a HexFGCode."""
+    """Wrapper to convert a colour code (see _triple_for) to a HexFGCode."""
     if (code, bold) in _fg_cache:
         return _fg_cache[(code, bold)]
-    if bold:
-        dictionary = bolded_colours
-    else:
-        dictionary = normal_colours
-    res = HexFGCode(*dictionary[code])
-    _fg_cache[(code, bold)] = res
+    res = HexFGCode(*_triple_for(code, bold))
+    #there are far too many truecolours to remember them all here, and the
+    #registry does that anyway.
+    if not isinstance(code, tuple):
+        _fg_cache[(code, bold)] = res
     return res
 
 _bg_cache = {}
 def bg_code(code):
-    """Wrapper to convert a VT100 colour code to a HexBGCode."""
+    """Wrapper to convert a colour code (see _triple_for) to a HexBGCode."""
     if code in _bg_cache:
         return _bg_cache[code]
-    res = HexBGCode(*normal_colours[code])
-    _bg_cache[code] = res
+    res = HexBGCode(*_triple_for(code, False))
+    if not isinstance(code, tuple):
+        _bg_cache[code] = res
     return res
 
+#every colour that's been made, by its kind and value, and by its id.
+_registry = {}
+_colours_by_id = []
+#once there are this many colours, any new ones that aren't in the xterm
+#palette are swapped for the nearest one that is. This stops truecolour from
+#making colours (and the GUI's tags for them) without end.
+MAX_COLOURS = 4096
+
+def colour_by_id(ident):
+    """Return the colour with the given registry id."""
+    return _colours_by_id[ident]
+
 class _HexCode(object):
     """Base class for hex colour codes.
     
     The colour attributes are in the range 0..255, where 0 is absent and 255
     is brightest.
+
+    Colours are interned: asking for the same colour twice gets the same
+    object back, so there's only ever one of each, however many lines use
+    it. Each one also has a small integer id, unique across foregrounds and
+    backgrounds, which colour_by_id turns back into the colour.
+
+    The number of colours is capped at MAX_COLOURS; after that, new colours
+    are approximated with the xterm palette.
     """
 
+    __slots__ = ['red', 'green', 'blue', 'triple', 'as_hex', 'id']
+
     ground = None
 
-    def __init__(self, red, green, blue):
-        self.red = red
-        self.green = green
-        self.blue = blue
-        self.triple = (red, green, blue)
-        #__hash__ gets called in an inner loop, so cache the value.
-        self.as_hex = ''.join(('%x' % num).zfill(2) for num in self.triple)
-        self._hashed = hash(self.ground) ^ hash(self.triple)
+    def __new__(cls, red, green, blue):
+        key = (cls, red, green, blue)
+        self = _registry.get(key)
+        if self is None:
+            if len(_registry) >= MAX_COLOURS and \
+               (red, green, blue) not in _xterm_triples:
+                return cls(*nearest_xterm(red, green, blue))
+            self = object.__new__(cls)
+            self.red = red
+            self.green = green
+            self.blue = blue
+            self.triple = (red, green, blue)
+            self.as_hex = ''.join(('%x' % num).zfill(2) for num in self.triple)
+            self.id = len(_colours_by_id)
+            _colours_by_id.append(self)
+            _registry[key] = self
+        return self
+
+    def __reduce__(self):
+        #go through __new__ when unpickling, so we're interned there, too.
+        return (type(self), self.triple)
 
     def __eq__(self, other):
-        return type(self) == type(other) and self.triple == other.triple
+        #there's only one of each colour, so this is enough.
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
 
 #ignore the unused arguments and could-be-a-function messages
 #pylint: disable-msg=W0613,R0201
@@ -92,13 +174,15 @@ class _HexCode(object):
         return "<%s %s>" % (type(self).__name__, self.as_hex)
 
     def __hash__(self):
-        return self._hashed
+        return self.id
 
 class HexBGCode(_HexCode):
     """A hex background colour."""
+    __slots__ = []
     ground = 'back'
 
 class HexFGCode(_HexCode):
     """A hex foreground colour."""
+    __slots__ = []
     ground = 'fore'
 
@@ -7,6 +7,105 @@ from pymudclient.matchers import make_decorator, NonbindingPlaceholder
 from pymudclient.matchers import BindingPlaceholder
 import traceback
 
+#what a tag ends with to take in a whole package: 'Char.*' gets 'Char.Vitals'
+#and 'Char.Items.List', and '*' on its own gets everything.
+WILDCARD = '*'
+
+def tag_matches(tag, gmcp_type):
+    """Does the tag (maybe a wildcard) cover messages of the given type?"""
+    if not isinstance(tag, basestring):
+        return False
+    if tag.endswith(WILDCARD):
+        return gmcp_type.startswith(tag[:-1])
+    return tag == gmcp_type
+
+def _wildcard_package(tag):
+    """Return the list of package names a wildcard tag covers everything
+    under, or None if it's not a wildcard.
+    """
+    if tag == WILDCARD:
+        return []
+    if tag.endswith('.' + WILDCARD):
+        return tag[:-2].split('.')
+    return None
+
+class _PackageNode(object):
+    """One package in the tree of wildcard subscriptions."""
+
+    __slots__ = ['children', 'positions']
+
+    def __init__(self):
+        self.children = {}
+        #where in the list the wildcard events for this package are.
+        self.positions = []
+
+class GmcpEventIndex(object):
+    """Picks out which of a sorted list of GMCP events want a given message
+    type, so each message only goes to its own handlers.
+
+    Plain tags are looked up in a dict. Wildcard tags hang off a tree of
+    package names, and every package a message type is inside is checked.
+    The answer for each message type is remembered until the list changes.
+    """
+
+    def __init__(self, events = ()):
+        self.rebuild(events)
+
+    def rebuild(self, events):
+        """Reindex the given list of events, in their current order."""
+        self._source = events
+        self._size = len(events)
+        self._events = list(events)
+        self._exact = {}
+        self._packages = _PackageNode()
+        self._resolved = {}
+        for pos, event in enumerate(self._events):
+            tag = getattr(event, 'tag', None)
+            if not isinstance(tag, basestring):
+                #inactive, so it can't match anything.
+                continue
+            package = _wildcard_package(tag)
+            if package is None:
+                if tag.endswith(WILDCARD):
+                    #some other sort of prefix, like 'Char.Vi*'. Rare enough
+                    #to just check against every message.
+                    package = []
+                else:
+                    self._exact.setdefault(tag, []).append(pos)
+                    continue
+            node = self._packages
+            for name in package:
+                node = node.children.setdefault(name, _PackageNode())
+            node.positions.append(pos)
+
+    def handlers(self, events, gmcp_type):
+        """Return the events that want messages of gmcp_type, in order.
+
+        events should be the list this index was built from; if it's not, or
+        it's been added to, we reindex first.
+        """
+        if events is not self._source or len(events) != self._size:
+            self.rebuild(events)
+        try:
+            return self._resolved[gmcp_type]
+        except KeyError:
+            pass
+        positions = list(self._exact.get(gmcp_type, ()))
+        node = self._packages
+        names = gmcp_type.split('.')
+        #the last name is the message itself, not a package.
+        for name in names[:-1]:
+            positions.extend(node.positions)
+            node = node.children.get(name)
+            if node is None:
+                break
+        else:
+            positions.extend(node.positions)
+        ordered = self._events
+        res = tuple(ordered[pos] for pos in sorted(positions)
+                    if tag_matches(ordered[pos].tag, gmcp_type))
+        self._resolved[gmcp_type] = res
+        return res
 
 class GmcpEvent:
     
@@ -20,7 +119,7 @@ class GmcpEvent:
         
     def match(self,gmcp_pair):
         gmcp_type,_=gmcp_pair
-        return self.tag==gmcp_type
+        return tag_matches(self.tag, gmcp_type)
     
     def func(self, gmcp_data, realm):
         """Default, do-nothing function."""
@@ -30,7 +129,7 @@ class GmcpEvent:
         realm.trace_thunk(lambda: "%s matched!" % self)
         try:
             gmcp_type,gmcp_data=gmcp_pair
-            if gmcp_type==self.tag:
+            if tag_matches(self.tag, gmcp_type):
                 self.func(gmcp_data, realm)
         except Exception: #don't catch KeyboardInterrupt etc
             traceback.print_exc()
@@ -44,7 +44,9 @@ class DisplayView(gtk.TextView):
 
         Returns the tag.
         """
-        #use our own tag table, because GTK's is too slow
+        #use our own tag table, because GTK's is too slow. There's a tag per
+        #colour, which is fine, as the number of colours is capped (see
+        #colours.MAX_COLOURS).
         if colour in self._tags:
             tag = self._tags[colour]
         else:
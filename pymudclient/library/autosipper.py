@@ -4,7 +4,7 @@ For: IRE MUDs.
 """
 from pymudclient.modules import EarlyInitialisingModule
 from pymudclient.aliases import binding_alias
-from pymudclient.triggers import binding_trigger
+from pymudclient.triggers import binding_trigger, TriggerChain
 
 class GenericAutosipper(EarlyInitialisingModule):
 
@@ -16,9 +16,19 @@ class GenericAutosipper(EarlyInitialisingModule):
         self.max_mana = max_mana
         self.health_threshold = 0
         self.mana_threshold = 0
-        self.state = 'sip balance'
+        #the prompt's only worth looking at when we can sip, and the balance
+        #message only when we can't.
+        self.sipping = TriggerChain('sip balance')
+        self.sipping.add('sip balance', self.prompt_seen)
+        self.sipping.add('off balance', self.got_balance,
+                         goto = 'sip balance')
         self.calculate_threshold()
 
+    @property
+    def state(self):
+        """Whether we've got sip balance or not."""
+        return self.sipping.state
+
 #pylint likes complaining about the unused arguments in the callbacks, which
 #are actually perfectly harmless.
 #pylint: disable-msg=W0613
@@ -31,37 +41,36 @@ class GenericAutosipper(EarlyInitialisingModule):
         mana = int(mana)
         #TODO: account for anorexia, pausing, etc
 
-        if self.state == 'sip balance':
-            if health <= self.health_threshold:
-                realm.send('drh')
-            elif mana <= self.mana_threshold:
-                realm.send('drm')
+        if health <= self.health_threshold:
+            realm.send('drh')
+        elif mana <= self.mana_threshold:
+            realm.send('drm')
 
     @binding_alias('^drh$')
     def sip_health(self, match, realm):
         """Sip from our health vial."""
-        self.state = 'off balance'
+        self.sipping.goto('off balance')
         realm.send('drink health')
         realm.send_to_mud = False
 
     @binding_alias("^drm$")
     def sip_mana(self, match, realm):
         """Sip from our mana vial."""
-        self.state = 'off balance'
+        self.sipping.goto('off balance')
         realm.send("drink mana")
         realm.send_to_mud = False
 
     @binding_trigger('^You may drink another healing elixir\.$')
     def got_balance(self, match, realm):
-        """We've gotten sip balance back."""
-        if self.state == 'off balance':
-            self.state = 'sip balance'
+        """We've gotten sip balance back. The chain moves us back to
+        'sip balance'.
+        """
 #pylint: enable-msg=W0613
 
     @property
     def triggers(self):
         """The triggers we want added."""
-        return [self.prompt_seen, self.got_balance]
+        return [self.sipping]
 
     @property
     def aliases(self):
@@ -1,9 +1,13 @@
 """A balance highlighter.
 
 For: Achaea.
+
+balance_highlight_rule does the same as the balance_highlight trigger, but
+as a rule for a module's rules, so it doesn't need a callback.
 """
 from pymudclient.colours import HexFGCode
 from pymudclient.triggers import non_binding_trigger
+from pymudclient.line_rules import Highlight
 
 #The unused arguments are harmless.
 #pylint: disable-msg=W0613
@@ -15,3 +19,7 @@ def balance_highlight(match, realm):
     realm.alterer.change_fore(0, match.end(), HexFGCode(0x80, 0xFF, 0x80))
 
 #pylint: enable-msg=W0613
+
+balance_highlight_rule = Highlight("^You have recovered (?:equilibrium|balance "
+                                   "on all limbs)\.$",
+                                   fore = HexFGCode(0x80, 0xFF, 0x80))
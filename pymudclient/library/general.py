@@ -1,6 +1,7 @@
 """Some general helpful stuff."""
 from pymudclient.aliases import non_binding_alias
 from pymudclient.gui.keychords import from_string
+from pymudclient.profiling import METRICS
 
 #pylint doesn't like that func is set in __init__ too, if the conditions are
 #right. Also, the unused arguments are harmless.
@@ -13,6 +14,31 @@ def repeat(match, realm):
         realm.send(match.group(2))
     realm.send_to_mud = False
 
+@non_binding_alias('^#profile(?: (on|off|reset))?(?: (\d+))?(?: (\w+))?$')
+def profile(match, realm):
+    """Control trigger and alias profiling.
+
+    '#profile on', '#profile off' and '#profile reset' do what they say on
+    the tin. '#profile [count] [metric]' shows the worst offenders.
+    """
+    realm.send_to_mud = False
+    command, count, metric = match.groups()
+    root = realm.root
+    if command == 'on':
+        root.profile_on()
+        realm.write("Profiling enabled!")
+    elif command == 'off':
+        root.profile_off()
+        realm.write("Profiling disabled!")
+    elif command == 'reset':
+        if root.profiler is not None:
+            root.profiler.reset()
+    elif metric is not None and metric not in METRICS:
+        realm.write("Unknown metric %s. Try one of: %s." %
+                    (metric, ', '.join(METRICS)))
+    else:
+        root.profile_report(int(count or 10), metric)
+
 #pylint: enable-msg=E0202
 
 def trace_toggle(realm):
@@ -22,6 +48,13 @@ def trace_toggle(realm):
     else:
         realm.trace_off()
 
+def profile_toggle(realm):
+    """Turn profiling on or off, depending on its current state."""
+    if realm.profiler is None:
+        realm.profile_on()
+    else:
+        realm.profile_off()
+
 def keypad_move(direction):
     """A wrapper to stop me having loads of different direction-moving
     functions.
@@ -89,7 +89,7 @@ class PlayerTracker(BaseModule):
         print(gmcp_data)
         print(self.players)
         #realm.root.debug('PlayerRemove: %s'%gmcp_data)
-        name=(str(gmcp_data)[1:-1]).lower()
+        name=str(gmcp_data).lower()
         #realm.root.debug('PlayerName: %s'%name)
         if realm.root.get_state('target').lower()==name.lower():
             realm.fireEvent('targetLeftRoomEvent', realm.root.get_state('target'))
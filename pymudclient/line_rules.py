@@ -0,0 +1,226 @@
+"""Declarative gags, highlights and substitutions.
+
+A lot of triggers do nothing but hide a line, or colour in a bit of it. Those
+don't need a realm, a Python callback and a LineAlterer each: as rules, they
+are applied by the engine in one go, just before the line is displayed.
+
+Rules see the line as the triggers left it. Gags are checked first, and a
+gagged line isn't looked at any further; then substitutions are made, in
+order of sequence; then the highlights are applied to the result.
+"""
+import re
+import sre_parse
+from sre_constants import LITERAL, AT, AT_BEGINNING, AT_BEGINNING_STRING, \
+                          AT_END, AT_END_STRING, MAX_REPEAT, ANY, \
+                          MAXREPEAT
+from operator import attrgetter
+from pymudclient.matcher_index import MatcherIndex, mark_indexable, \
+                                      required_literal
+from pymudclient.triggers import _alternation
+
+def _fast_test(pattern):
+    """Try to find a function that says whether pattern matches a line
+    without going anywhere near the regex engine.
+
+    Returns None if the pattern's too complicated for that.
+    """
+    if pattern.flags & ~re.UNICODE:
+        return None
+    try:
+        items = list(sre_parse.parse(pattern.pattern, pattern.flags))
+    except Exception:
+        return None
+    at_start = at_end = False
+    if items and items[0][0] is AT and \
+       items[0][1] in (AT_BEGINNING, AT_BEGINNING_STRING):
+        at_start = True
+        items.pop(0)
+    if items and items[-1][0] is AT and items[-1][1] in (AT_END,
+                                                         AT_END_STRING):
+        at_end = True
+        items.pop()
+    if len(items) == 1 and items[0][0] is MAX_REPEAT:
+        low, high, repeated = items[0][1]
+        if low == 0 and high == MAXREPEAT and list(repeated) == [(ANY, None)]:
+            #a catch-all like '^.*$'
+            return lambda line: True
+    if not all(op is LITERAL for op, av in items):
+        return None
+    text = u''.join(unichr(av) for op, av in items)
+    if at_start and at_end:
+        return lambda line: line == text
+    elif at_start:
+        return lambda line: line.startswith(text)
+    elif at_end:
+        return lambda line: line.endswith(text)
+    return lambda line: text in line
+
+def _compile(regex):
+    if isinstance(regex, basestring):
+        return re.compile(regex)
+    return regex
+
+class _Rule(object):
+    """Common code to all the rules."""
+
+    def __init__(self, regex, sequence = 0):
+        self.regex = _compile(regex)
+        self.sequence = sequence
+        #work this out now, rather than when the first line turns up.
+        required_literal(self.regex)
+
+    @mark_indexable
+    def match(self, metaline):
+        """Find where the rule applies in the line."""
+        return self.regex.finditer(metaline.line)
+
+    def __str__(self):
+        args = [type(self).__name__, repr(self.regex.pattern)]
+        if self.sequence != 0:
+            args.append('sequence = %d' % self.sequence)
+        return '<%s>' % ' '.join(args)
+
+class Gag(_Rule):
+    """Hide every line the regex matches."""
+
+    def __init__(self, regex, sequence = 0):
+        _Rule.__init__(self, regex, sequence)
+        self._fast = _fast_test(self.regex)
+
+    def test(self, line):
+        """Does the regex match the line?"""
+        #the fast tests don't know about '$' matching before a trailing
+        #newline, so leave those lines to the regex.
+        if self._fast is not None and '\n' not in line:
+            return self._fast(line)
+        return self.regex.search(line) is not None
+
+class Highlight(_Rule):
+    """Colour in the text the regex matches (or just one group of it) with a
+    new foreground and/or background.
+    """
+
+    def __init__(self, regex, fore = None, back = None, group = 0,
+                 sequence = 0):
+        _Rule.__init__(self, regex, sequence)
+        self.fore = fore
+        self.back = back
+        self.group = group
+
+    def apply(self, metaline, matches):
+        for match in matches:
+            start, end = match.span(self.group)
+            if start == end:
+                continue
+            if self.fore is not None:
+                metaline.change_fore(start, end, self.fore)
+            if self.back is not None:
+                metaline.change_back(start, end, self.back)
+
+class Substitute(_Rule):
+    """Replace the text the regex matches. The replacement can refer to
+    groups like re.sub's can.
+
+    The replacement text takes on the colours of the text just before it.
+    """
+
+    def __init__(self, regex, replacement, sequence = 0):
+        _Rule.__init__(self, regex, sequence)
+        self.replacement = replacement
+
+    def apply(self, metaline, matches):
+        #go backwards, so the earlier matches' indices stay good.
+        for match in reversed(matches):
+            start, end = match.span()
+            metaline.delete(start, end)
+            metaline.insert(start, match.expand(self.replacement))
+
+class LineRules(object):
+    """All the rules that are in effect, ready to be applied to lines."""
+
+    def __init__(self):
+        self.gags = []
+        self.substitutions = []
+        self.highlights = []
+        self._highlight_index = MatcherIndex(self.highlights)
+        self._compile_gags()
+
+    def _compile_gags(self):
+        """Sort the gags into those with a fast test, and the rest, which
+        are rolled into one regex if possible.
+        """
+        self._fast_gags = [gag._fast for gag in self.gags
+                           if gag._fast is not None]
+        self._slow_gags = [gag.regex for gag in self.gags
+                           if gag._fast is None]
+        combined = None
+        if len(self._slow_gags) > 1:
+            combined = _alternation(self._slow_gags)
+        if combined is not None:
+            self._slow_gags = [combined[0]]
+
+    def gagged(self, line):
+        """Should the line be gagged?"""
+        if '\n' in line:
+            return any(gag.test(line) for gag in self.gags)
+        for test in self._fast_gags:
+            if test(line):
+                return True
+        for regex in self._slow_gags:
+            if regex.search(line) is not None:
+                return True
+        return False
+
+    def extend(self, rules):
+        """Add some more rules."""
+        for rule in rules:
+            if isinstance(rule, Gag):
+                self.gags.append(rule)
+            elif isinstance(rule, Substitute):
+                self.substitutions.append(rule)
+            elif isinstance(rule, Highlight):
+                self.highlights.append(rule)
+            else:
+                raise TypeError("Not a rule: %r" % (rule,))
+        for rules in (self.gags, self.substitutions, self.highlights):
+            rules.sort(key = attrgetter('sequence'))
+        self._compile_gags()
+        self._highlight_index.rebuild(self.highlights)
+
+    def clear(self):
+        """Get rid of all the rules."""
+        self.gags[:] = []
+        self.substitutions[:] = []
+        self.highlights[:] = []
+        self._compile_gags()
+        self._highlight_index.rebuild(self.highlights)
+
+    def __nonzero__(self):
+        return bool(self.gags or self.substitutions or self.highlights)
+
+    def apply(self, metaline):
+        """Return the metaline as it should be displayed, or None if it's
+        been gagged.
+
+        The metaline is only copied if there's something to change.
+        """
+        if self.gags and self.gagged(metaline.line):
+            return None
+        copied = False
+        for rule in self.substitutions:
+            matches = list(rule.match(metaline))
+            if matches:
+                if not copied:
+                    metaline = metaline.copy()
+                    copied = True
+                rule.apply(metaline, matches)
+        if self.highlights:
+            for rule in self._highlight_index.candidates(self.highlights,
+                                                         metaline.line):
+                matches = list(rule.match(metaline))
+                if matches:
+                    if not copied:
+                        metaline = metaline.copy()
+                        copied = True
+                    rule.apply(metaline, matches)
+        return metaline
@@ -0,0 +1,403 @@
+"""An index over a list of triggers or aliases, so that each line only has to
+be tested against the matchers that could conceivably match it.
+
+Almost every regex has some literal text that any match must contain, so
+we pull that out of each pattern (when it's decorated, for the usual
+decorator-made triggers and aliases) and feed them all into one Aho-Corasick
+automaton, which finds every one of them in a single pass over the line.
+Matchers whose literal doesn't show up can't match, and are skipped without
+ever running their regex. Matchers we can't say anything about (no
+literal, or a custom match() method) are always tried.
+
+Patterns that are anchored to the start of the line and begin with some
+literal text are even simpler: they're bucketed by that leading text, and
+only the buckets matching the start of the line are looked at.
+"""
+import re
+import sre_parse
+from sre_constants import LITERAL, SUBPATTERN, AT, MAX_REPEAT, MIN_REPEAT, \
+                          AT_BEGINNING, AT_BEGINNING_STRING
+from collections import deque
+from weakref import WeakSet
+
+#how many patterns' worth of analysis to remember. Triggers made on the fly
+#(with a target's name in, say) would otherwise pile up forever.
+MAX_CACHED = 512
+
+def remember(cache, key, value):
+    """Put value in cache under key, emptying the cache first if it's full,
+    and return value.
+    """
+    if len(cache) >= MAX_CACHED:
+        cache.clear()
+    cache[key] = value
+    return value
+
+def _as_pattern(regex):
+    """Accept either strings or compiled patterns."""
+    if isinstance(regex, basestring):
+        return re.compile(regex)
+    return regex
+
+def _literal_runs(items, runs, current):
+    """Walk a parsed pattern, collecting runs of consecutive literal
+    characters that must appear in any match.
+
+    Returns the run that is still open at the end of items, so the caller can
+    carry on extending it.
+    """
+    for op, av in items:
+        if op is LITERAL:
+            current.append(unichr(av))
+        elif op is SUBPATTERN:
+            #a group's contents are matched inline, so literals can run
+            #straight through its boundaries
+            current = _literal_runs(av[1], runs, current)
+        elif op is AT:
+            #anchors are zero-width, so they don't split up the text.
+            pass
+        else:
+            runs.append(u''.join(current))
+            current = []
+            if op in (MAX_REPEAT, MIN_REPEAT) and av[0] >= 1:
+                #something repeated at least once still has to be there, but
+                #it's cut off from its neighbours.
+                runs.append(u''.join(_literal_runs(av[2], runs, [])))
+    return current
+
+_literal_cache = {}
+def required_literal(regex):
+    """Return the longest piece of literal text that every match of regex
+    must contain, or None if there's nothing useful to be had.
+    """
+    pattern = _as_pattern(regex)
+    key = (pattern.pattern, pattern.flags)
+    if key in _literal_cache:
+        return _literal_cache[key]
+    best = None
+    if not pattern.flags & re.IGNORECASE:
+        try:
+            parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+        except Exception:
+            parsed = None
+        if parsed is not None:
+            runs = []
+            runs.append(u''.join(_literal_runs(parsed, runs, [])))
+            best = max(runs, key = len) or None
+    return remember(_literal_cache, key, best)
+
+def _leading_run(items, current):
+    """Collect the literal characters at the very start of a parsed pattern.
+
+    Returns whether we got to the end of items without hitting anything that
+    wasn't literal.
+    """
+    for op, av in items:
+        if op is LITERAL:
+            current.append(unichr(av))
+        elif op is SUBPATTERN:
+            if not _leading_run(av[1], current):
+                return False
+        else:
+            return False
+    return True
+
+_leading_cache = {}
+def leading_literal(regex):
+    """If regex can only match at the start of the line, and must begin with
+    some literal text, return that text. Otherwise, return None.
+    """
+    pattern = _as_pattern(regex)
+    key = (pattern.pattern, pattern.flags)
+    if key in _leading_cache:
+        return _leading_cache[key]
+    res = None
+    if not pattern.flags & re.IGNORECASE:
+        try:
+            parsed = list(sre_parse.parse(pattern.pattern, pattern.flags))
+        except Exception:
+            parsed = []
+        #with MULTILINE, ^ can match after any newline, too.
+        anchors = [AT_BEGINNING_STRING]
+        if not pattern.flags & re.MULTILINE:
+            anchors.append(AT_BEGINNING)
+        if parsed and parsed[0][0] is AT and parsed[0][1] in anchors:
+            current = []
+            _leading_run(parsed[1:], current)
+            res = u''.join(current) or None
+    return remember(_leading_cache, key, res)
+
+def is_indexable(matcher):
+    """Can we reason about this matcher from its regex alone?
+
+    Only matchers that use the stock regex-searching match() can be
+    prefiltered; anything that overrides match() is on its own.
+    """
+    return getattr(getattr(type(matcher), 'match', None), 'indexable', False)
+
+def mark_indexable(func):
+    """Decorator for match() methods that do nothing but search the line with
+    self.regex (or each regex in a list of them).
+    """
+    func.indexable = True
+    return func
+
+class AhoCorasick(object):
+    """Finds every occurrence of a set of words in a piece of text, in one
+    pass, however many words there are.
+
+    Each word is associated with a set of values, and searching returns the
+    union of the values of all the words found.
+    """
+
+    def __init__(self, words):
+        #the trie's edges, each node's failure link, and what's been found
+        #when we're at that node.
+        goto = [{}]
+        fail = [0]
+        found = [set()]
+        for word, values in words.iteritems():
+            state = 0
+            for char in word:
+                if char not in goto[state]:
+                    goto.append({})
+                    fail.append(0)
+                    found.append(set())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            found[state].update(values)
+        #breadth first, so that failure links always point at nodes that
+        #have had their own sorted out already.
+        queue = deque(goto[0].itervalues())
+        while queue:
+            state = queue.popleft()
+            for char, child in goto[state].iteritems():
+                queue.append(child)
+                back = fail[state]
+                while back and char not in goto[back]:
+                    back = fail[back]
+                fail[child] = goto[back].get(char, 0) if state else 0
+                found[child].update(found[fail[child]])
+        self._goto = goto
+        self._fail = fail
+        self._found = [frozenset(values) for values in found]
+
+    def search(self, text):
+        """Return the values of every word that occurs in text."""
+        goto = self._goto
+        fail = self._fail
+        found = self._found
+        res = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if found[state]:
+                res.update(found[state])
+        return res
+
+#the ways we can find out if a matcher's worth trying
+ANCHORED = 'anchored'
+LITERAL_TEXT = 'literal'
+ALWAYS = 'always'
+NEVER = 'never'
+
+class MatcherIndex(object):
+    """Picks out which of a sorted list of matchers are worth trying on a
+    given line.
+
+    The index is rebuilt wholesale when the list is changed by loading or
+    clearing modules, or if the list is swapped out from under us. When a
+    matcher has its regex reassigned, only that matcher is reindexed.
+
+    Matchers can also be disabled, which takes them out of the running
+    entirely without touching the list or its order, and enabled again later.
+    """
+
+    def __init__(self, matchers = ()):
+        self._version = 0
+        #ids of the disabled matchers. This outlives rebuilds.
+        self._disabled = set()
+        self.rebuild(matchers)
+
+    def rebuild(self, matchers):
+        """Reindex the given list of matchers, in their current order."""
+        self._version += 1
+        self._source = matchers
+        self._size = len(matchers)
+        self._matchers = list(matchers)
+        self._positions = {}
+        self._routes = []
+        self._always = set()
+        self._anchored = {}
+        self._withdrawn = set()
+        #matchers that want to know when a new block of lines starts
+        self.block_watchers = [matcher for matcher in self._matchers
+                               if getattr(type(matcher), 'start_block', None)
+                                  is not None]
+        by_literal = {}
+        for pos, matcher in enumerate(self._matchers):
+            self._positions.setdefault(id(matcher), []).append(pos)
+            route = self._route_for(matcher)
+            self._routes.append(route)
+            disabled = id(matcher) in self._disabled
+            if route[0] is LITERAL_TEXT:
+                #disabled ones go in the automaton anyway, so they can be
+                #enabled later without having to rebuild it.
+                for literal in route[1]:
+                    by_literal.setdefault(literal, set()).add(pos)
+                if disabled:
+                    self._withdrawn.add(pos)
+            elif not disabled:
+                self._add_route(pos, route)
+        self._automaton = AhoCorasick(by_literal) if by_literal else None
+
+    def _route_for(self, matcher):
+        """Work out how to tell if the matcher could match a line.
+
+        This returns the kind of route, plus the literal texts that it needs
+        one of, if any.
+        """
+        if not is_indexable(matcher):
+            return (ALWAYS, None)
+        #keep an eye on the matcher, so we know if its regex changes.
+        watchers = getattr(matcher, '_indexes', None)
+        if watchers is None:
+            matcher._indexes = watchers = WeakSet()
+        watchers.add(self)
+        regex = matcher.regex
+        if regex is None:
+            return (NEVER, None)
+        if not isinstance(regex, list):
+            regex = [regex]
+        prefixes = set(leading_literal(pattern) for pattern in regex)
+        if None not in prefixes:
+            return (ANCHORED, prefixes)
+        literals = set(required_literal(pattern) for pattern in regex)
+        if None not in literals:
+            return (LITERAL_TEXT, literals)
+        return (ALWAYS, None)
+
+    def _add_route(self, pos, route):
+        """Hook a position into the structures that route doesn't need the
+        automaton for.
+        """
+        kind, texts = route
+        if kind is ANCHORED:
+            for prefix in texts:
+                bucket = self._anchored.setdefault(len(prefix), {})
+                bucket.setdefault(prefix, set()).add(pos)
+        elif kind is ALWAYS:
+            self._always.add(pos)
+
+    def _remove_route(self, pos, route):
+        """Undo _add_route, or take a position out of the automaton."""
+        kind, texts = route
+        if kind is ANCHORED:
+            for prefix in texts:
+                bucket = self._anchored[len(prefix)]
+                bucket[prefix].discard(pos)
+                if not bucket[prefix]:
+                    del bucket[prefix]
+                if not bucket:
+                    del self._anchored[len(prefix)]
+        elif kind is LITERAL_TEXT:
+            #can't take things out of the automaton, so just ignore it
+            #when it says this one's there.
+            self._withdrawn.add(pos)
+        elif kind is ALWAYS:
+            self._always.discard(pos)
+
+    def regex_changed(self, matcher):
+        """One of our matchers has had its regex reassigned, so reroute it."""
+        positions = self._our_positions(matcher)
+        if not positions:
+            return
+        route = self._route_for(matcher)
+        if route[0] is LITERAL_TEXT:
+            #the automaton's fixed until the next rebuild, so just try it
+            #every time until then.
+            route = (ALWAYS, None)
+        disabled = id(matcher) in self._disabled
+        for pos in positions:
+            if not disabled:
+                self._remove_route(pos, self._routes[pos])
+                self._add_route(pos, route)
+            self._routes[pos] = route
+        self._version += 1
+
+    def disable(self, matchers):
+        """Stop offering up any of the given matchers, until they're
+        enabled again.
+        """
+        for matcher in matchers:
+            if id(matcher) in self._disabled:
+                continue
+            self._disabled.add(id(matcher))
+            for pos in self._our_positions(matcher):
+                self._remove_route(pos, self._routes[pos])
+        self._version += 1
+
+    def enable(self, matchers):
+        """Undo disable()."""
+        for matcher in matchers:
+            if id(matcher) not in self._disabled:
+                continue
+            self._disabled.discard(id(matcher))
+            if getattr(type(matcher), 'start_block', None) is not None:
+                #whatever it was partway through matching is stale now.
+                matcher.start_block()
+            for pos in self._our_positions(matcher):
+                route = self._routes[pos]
+                if route[0] is LITERAL_TEXT:
+                    self._withdrawn.discard(pos)
+                else:
+                    self._add_route(pos, route)
+        self._version += 1
+
+    def is_enabled(self, matcher):
+        """Is the matcher being offered up?"""
+        return id(matcher) not in self._disabled
+
+    def _our_positions(self, matcher):
+        """Where the matcher is in our copy of the list, if it's there."""
+        positions = self._positions.get(id(matcher), ())
+        if positions and self._matchers[positions[0]] is not matcher:
+            return ()
+        return positions
+
+    def candidates(self, matchers, text):
+        """Yield the matchers that might match text, in order.
+
+        matchers should be the list this index was built from; if it's not,
+        or it's been altered, we reindex first.
+        """
+        if matchers is not self._source or len(matchers) != self._size:
+            self.rebuild(matchers)
+        found = set(self._always)
+        if self._automaton is not None:
+            hits = self._automaton.search(text)
+            if self._withdrawn:
+                hits -= self._withdrawn
+            found.update(hits)
+        for length, bucket in self._anchored.iteritems():
+            hits = bucket.get(text[:length])
+            if hits:
+                found.update(hits)
+        version = self._version
+        ordered = self._matchers
+        last = -1
+        for pos in sorted(found):
+            if self._version != version:
+                break
+            last = pos
+            yield ordered[pos]
+        if self._version != version:
+            #something's changed underneath us mid-line (a trigger reassigned
+            #another's regex, say), so our filtering is no good any more. Fall
+            #back to trying everything that's left.
+            disabled = self._disabled
+            for matcher in ordered[last + 1:]:
+                if id(matcher) not in disabled:
+                    yield matcher
@@ -6,6 +6,8 @@ using decorators around functions.
 import re
 import traceback
 from tagged_ml_parser import taggedml
+from pymudclient.matcher_index import required_literal
+from pymudclient.profiling import clock
 
 
 class ProtoMatcher(object):
@@ -24,6 +26,13 @@ class ProtoMatcher(object):
             self.regex = regex
         self.sequence = sequence
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name == 'regex':
+            #let any MatcherIndex we're in know it needs to take another look
+            for index in list(self.__dict__.get('_indexes', ())):
+                index.regex_changed(self)
+
 #pylint doesn't like that func is set in __init__ too, if the conditions are
 #right. Also, the unused arguments are harmless.
 #pylint: disable-msg=E0202,W0613
@@ -36,11 +45,16 @@ class ProtoMatcher(object):
         #simulate lazy evaluation, because __str__ is a bit too expensive in
         #here, as this is in an inner loop
         realm.trace_thunk(lambda: "%s matched!" % self)
+        profiler = getattr(realm.root, 'profiler', None)
+        if profiler is not None:
+            start = clock()
         try:
             self.func(match, realm)
         except Exception: #don't catch KeyboardInterrupt etc
             trace = traceback.format_exc()
             realm.root.handle_exception(trace)
+        if profiler is not None:
+            profiler.record_callback(self, clock() - start)
 
     def __cmp__(self, other):
         return cmp(self.sequence, other.sequence)
@@ -122,6 +136,18 @@ def make_decorator(class_, base, is_matching_regex):
                 matching_obj = matching_string
         elif isinstance(matching_string, list):
             matching_obj=[re.compile(m) for m in matching_string]
+        else:
+            #None (to be filled in later) or an already-compiled pattern
+            matching_obj = matching_string
+        if is_matching_regex and matching_obj is not None:
+            #work out what literal text each pattern needs now, rather than
+            #when the first line turns up.
+            if isinstance(matching_obj, list):
+                patterns = matching_obj
+            else:
+                patterns = [matching_obj]
+            for pattern in patterns:
+                required_literal(pattern)
         def fngrabber(func):
             return _PlaceholderClass(matching_obj, func, sequence)
         return fngrabber
@@ -132,6 +158,8 @@ class BaseMatchingRealm(object):
 
     """A realm representing the matching of triggers or aliases."""
 
+    __slots__ = ['root', 'parent', '_writing_after']
+
     def __init__(self, root, parent):
         self.root = root
         self.parent = parent
@@ -142,6 +170,16 @@ class BaseMatchingRealm(object):
         for noteline, sls in self._writing_after:
             self.parent.write(noteline, sls)
     
+    def _display(self, metaline):
+        """Write the line that's been matched against, after applying the
+        root's gags, highlights and substitutions.
+        """
+        if self.root.line_rules:
+            metaline = self.root.line_rules.apply(metaline)
+            if metaline is None:
+                return
+        self.parent.write(metaline)
+
     def cwrite(self, line, soft_line_start=False):
         ml=taggedml(line)
         self.write(ml, soft_line_start)
@@ -169,10 +207,28 @@ class BaseMatchingRealm(object):
         This is suitable for use with either triggers or aliases, because of
         the commonality of their APIs.
         """
+        profiler = getattr(self.root, 'profiler', None)
+        if profiler is not None:
+            self._match_profiled(line, matchers, profiler)
+            return
         for matcher in matchers:
             matches = matcher.match(line)
             for match in matches:
                 matcher(match, self)
+
+    def _match_profiled(self, line, matchers, profiler):
+        """As _match_generic, but keeping count of how long each matcher
+        spends matching.
+
+        The matches are all found up front, so that the time spent finding
+        them isn't muddled up with the callbacks' time.
+        """
+        for matcher in matchers:
+            start = clock()
+            matches = list(matcher.match(line))
+            profiler.record_match(matcher, clock() - start, len(matches))
+            for match in matches:
+                matcher(match, self)
                     
     
     def fireEvent(self, eventName, *args):
@@ -1,5 +1,5 @@
 """Utility for passing around lines with their colour information."""
-from itertools import imap
+from bisect import bisect_left, bisect_right
 from pymudclient.colours import HexFGCode, HexBGCode, fg_code, WHITE, bg_code,\
     BLACK
 
@@ -17,63 +17,195 @@ def iadjust(ind, start, adj):
         return start
     return ind + adj
 
-class _sorteddict(dict):
+class RunLengthList(object):
+    """A list represented by a value and its start point.
+    
+    Thus, the data is using run-length coding.
+
+    The start points and values are kept in two parallel lists, sorted by
+    start point, so lookups are a binary search and changes are splices,
+    rather than re-sorting everything each time. It looks enough like a dict
+    of start point to value for anything that used it as one.
+
+    Copies are copy-on-write: they share their lists with the original until
+    one of them changes.
+    """
+
+    __slots__ = ['_positions', '_values', '_shared', '_dirty']
+
+    def __init__(self, values, _normalised = False):
+        self._shared = False
+        #whether redundancies might have crept in anywhere, by setting items
+        #directly, rather than just around the last change.
+        self._dirty = False
+        if isinstance(values, RunLengthList):
+            self._positions = values._positions
+            self._values = values._values
+            self._shared = values._shared = True
+            self._dirty = values._dirty
+        else:
+            if isinstance(values, dict):
+                values = values.iteritems()
+            #later values for the same point win, like a dict's would.
+            values = dict(values)
+            self._positions = sorted(values)
+            self._values = [values[pos] for pos in self._positions]
+        if not _normalised:
+            self._normalise()
+
+    def _own(self):
+        """Make sure our lists are ours alone, before changing them."""
+        if self._shared:
+            self._positions = list(self._positions)
+            self._values = list(self._values)
+            self._shared = False
+
+    def _normalise(self):
+        """Remove redundancies."""
+        self._normalise_between(0, len(self._positions))
+        self._dirty = False
+
+    def _tidy(self, lo, hi):
+        """Remove the redundancies a change between lo and hi might have made,
+        or all of them if there might be others.
+        """
+        if self._dirty:
+            self._normalise()
+        else:
+            self._normalise_between(lo, hi)
+
+    def _normalise_between(self, lo, hi):
+        """Remove redundancies, only looking at the entries from lo up to
+        and including hi.
+        """
+        ind = max(lo, 1)
+        hi = min(hi, len(self._positions) - 1)
+        while ind <= hi:
+            if self._values[ind] == self._values[ind - 1]:
+                self._own()
+                del self._positions[ind]
+                del self._values[ind]
+                hi -= 1
+            else:
+                ind += 1
+
+    #The dict-like bits.
+
+    def __len__(self):
+        return len(self._positions)
 
     def __iter__(self):
-        return iter(self.keys())
+        return iter(list(self._positions))
     iterkeys = __iter__
 
     def keys(self):
-        return sorted(dict.keys(self))
-
-    def iteritems(self):
-        return ((k, self[k]) for k in self.keys())
+        return list(self._positions)
 
-    def items(self):
-        return [(k, self[k]) for k in self.keys()]
+    def values(self):
+        return list(self._values)
 
     def itervalues(self):
-        return imap(self.__getitem__, self.keys())
+        return iter(self.values())
 
-    def values(self):
-        return map(self.__getitem__, self.keys())
+    def items(self):
+        return zip(self._positions, self._values)
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def _find(self, ind):
+        """Return where ind is in our start points, or None."""
+        pos = bisect_left(self._positions, ind)
+        if pos < len(self._positions) and self._positions[pos] == ind:
+            return pos
+        return None
+
+    def __contains__(self, ind):
+        return self._find(ind) is not None
+    has_key = __contains__
+
+    def __getitem__(self, ind):
+        pos = self._find(ind)
+        if pos is None:
+            raise KeyError(ind)
+        return self._values[pos]
+
+    def get(self, ind, default = None):
+        pos = self._find(ind)
+        if pos is None:
+            return default
+        return self._values[pos]
+
+    def __setitem__(self, ind, value):
+        """Set the value starting at ind, without normalising."""
+        self._set(ind, value)
+        self._dirty = True
+
+    def _set(self, ind, value):
+        """Set the value starting at ind, and return where it is."""
+        self._own()
+        positions = self._positions
+        pos = bisect_left(positions, ind)
+        if pos < len(positions) and positions[pos] == ind:
+            self._values[pos] = value
+        else:
+            positions.insert(pos, ind)
+            self._values.insert(pos, value)
+        return pos
+
+    def __delitem__(self, ind):
+        pos = self._find(ind)
+        if pos is None:
+            raise KeyError(ind)
+        self._own()
+        del self._positions[pos]
+        del self._values[pos]
+        self._dirty = True
+
+    def update(self, items):
+        for ind, value in items:
+            self._set(ind, value)
+        self._dirty = True
+
+    def clear(self):
+        self._positions = []
+        self._values = []
+        self._shared = False
+        self._dirty = False
 
     def setitems(self, items):
         self.clear()
         self.update(items)
 
-class RunLengthList(_sorteddict):
-    """A list represented by a value and its start point.
-    
-    Thus, the data is using run-length coding.
-    """
+    def __eq__(self, other):
+        if isinstance(other, RunLengthList):
+            return self._positions == other._positions and \
+                   self._values == other._values
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
 
-    def __init__(self, values, _normalised = False):
-        _sorteddict.__init__(self, values)
-        if not _normalised:
-            self._normalise()
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        if res is NotImplemented:
+            return res
+        return not res
 
-    def _normalise(self):
-        """Remove redundancies."""
-        prev_val = object() #sentinel
-        for key, val in self.items():
-            if val == prev_val:
-                del self[key]
-            prev_val = val
+    __hash__ = None
+
+    #The run-length bits.
 
     def add_change(self, ind, value):
         """Add a value starting at a specific point."""
-        self[ind] = value
-        self._normalise()
+        pos = self._set(ind, value)
+        self._tidy(pos, pos + 1)
 
     def get_at(self, ind):
         """Return the colour at a given index."""
-        val = None
-        for key, new_val in self.items():
-            if key > ind:
-                break
-            val = new_val
-        return val
+        pos = bisect_right(self._positions, ind) - 1
+        if pos < 0:
+            return None
+        return self._values[pos]
 
     def _make_explicit(self, ind):
         """Make the implicit value at a point explicit.
@@ -82,18 +214,29 @@ class RunLengthList(_sorteddict):
         list is left in a non-normalised state - this method should only be
         used as an intermediate step to an end.
         """
-        value = self.get_at(ind)
-        self[ind] = value
+        return self._set(ind, self.get_at(ind))
  
     def index_adjust(self, start, change):
         """Move the values along a specific amount."""
-        new_items = [(iadjust(ind, start, change), val)
-                     for ind, val in self.items()]
-        self.setitems(new_items)
+        self._own()
+        positions = self._positions
+        pos = bisect_left(positions, start)
+        squashed = pos
         if change < 0:
-            #if the change moves things forwards, things may be made redundant
-            #thus we must normalise for this case
-            self._normalise()
+            #everything that'd be moved back past start ends up on start, and
+            #the last of them wins.
+            squashed = bisect_right(positions, start - change)
+            if squashed - pos > 1:
+                del positions[pos:squashed - 1]
+                del self._values[pos:squashed - 1]
+                squashed = pos + 1
+            if squashed > pos:
+                positions[pos] = start
+        positions[squashed:] = [ind + change for ind in positions[squashed:]]
+        if change < 0:
+            #if the change moves things forwards, things may be made
+            #redundant, but only where the squashing happened.
+            self._tidy(pos, pos + 1)
 
     def blank_between(self, start, end):
         """Delete a span of values between given indexes.
@@ -101,23 +244,28 @@ class RunLengthList(_sorteddict):
         If end is None, it blanks all the way to the end."""
         if start == 0:
             raise ValueError("The start of the list may not be blanked.")
-        self._clear_between(start, end)
-        self._normalise()
+        pos = self._clear_between(start, end)
+        self._tidy(pos, pos)
 
     def delete_between(self, start, end):
         """Hardcore value removal."""
         self.index_adjust(start, start - end)
 
     def _clear_between(self, start, end):
-        """This possibly leaves us in a non-normalised state."""
+        """This possibly leaves us in a non-normalised state.
+
+        Returns where the entries that were cleared used to start.
+        """
         if end is not None:
             #don't lose the ending colour information
-            self._make_explicit(end)
-        #could really do with slice deletion for sorteddicts :(
-        res = [val for val in self.items() if not (start <= val[0] and
-                                                   (val[0] < end or
-                                                    end is None))]
-        self.setitems(res)
+            stop = self._make_explicit(end)
+        else:
+            stop = len(self._positions)
+        self._own()
+        pos = bisect_left(self._positions, start)
+        del self._positions[pos:stop]
+        del self._values[pos:stop]
+        return pos
         
     def change_between(self, start, end, value):
         """Replace a whole span of values with a new one.
@@ -134,16 +282,23 @@ class RunLengthList(_sorteddict):
         """
         self.index_adjust(start, length)
         self._make_explicit(start + length)
-        self.update([(pos + start, val) for (pos, val) in rll.items()
-                     if pos < length])
-        self._normalise()
+        pos = bisect_left(self._positions, start)
+        #nothing's between start and start + length now, so the new values
+        #can just be spliced in.
+        inserted = [(ind + start, value) for (ind, value) in rll.items()
+                    if ind < length]
+        self._positions[pos:pos] = [ind for ind, value in inserted]
+        self._values[pos:pos] = [value for ind, value in inserted]
+        self._tidy(pos, pos + len(inserted) + 1)
 
     def __repr__(self):
         return 'RunLengthList(%r)' % (self.items(),)
     __str__ = __repr__
 
     def copy(self):
-        """Return a deep copy of ourselves."""
+        """Return a copy of ourselves, which shares our lists until one of
+        us changes.
+        """
         return RunLengthList(self, _normalised = True)
 
 def metaline_to_json(metaline):
@@ -174,6 +329,10 @@ class Metaline(object):
     an output or not.
     """
 
+    #there are an awful lot of these about, so keep them small.
+    __slots__ = ['line', 'fores', 'backs', 'soft_line_start', 'line_end',
+                 'wrap', 'channels']
+
     def __init__(self, line, fores, backs, channels=['main'], soft_line_start = False,
                  line_end = 'hard', wrap = False):
         self.line = line
@@ -216,7 +375,11 @@ class Metaline(object):
         self.backs.change_between(start, end, colour)
 
     def copy(self):
-        """Deeply copy the metaline."""
+        """Copy the metaline.
+
+        This is cheap: the text is immutable anyway, and the colours are only
+        really copied if one side changes them.
+        """
         return Metaline(self.line, self.fores.copy(), self.backs.copy(),
                         wrap = self.wrap, line_end = self.line_end,
                         soft_line_start = self.soft_line_start,
@@ -242,13 +405,20 @@ class Metaline(object):
         return res
 
     def wrapped(self, wrapper):
-        """Break outself up with newlines."""
+        """Break outself up with newlines.
+
+        wrapper is a LineWrapper, or anything with a TextWrapper-like fill().
+        """
         #this function does similar stuff to what LineAlterer does...
         #there's a very slight speedup by avoiding using fill and count('\n')
         #and instead iterating over the result of wrap, but it's not a big
         #enough win at the moment to justify the obfuscation
         if not self.wrap:
             return self
+        #LineWrappers know how to do it all in one go.
+        wrap_metaline = getattr(wrapper, 'wrap_metaline', None)
+        if wrap_metaline is not None:
+            return wrap_metaline(self)
         
         metaline = self.copy()
         line = wrapper.fill(self.line)
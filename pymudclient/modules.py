@@ -12,11 +12,104 @@ def load_file(name):
     pymod = __import__(name, globals(), locals(), ['MainModule'])
     return pymod.MainModule
 
+class MatcherGroups(object):
+    """Named groups of triggers and aliases, which can be switched on and off
+    as a whole.
+
+    Switching a group off takes its members out of the trigger and alias
+    indexes, so they cost nothing on each line while they're off, but they
+    keep their place in the sorted lists for when they're switched back on.
+    """
+
+    def __init__(self, trigger_index, alias_index):
+        self.trigger_index = trigger_index
+        self.alias_index = alias_index
+        self._groups = {}
+        self._disabled = set()
+
+    def add(self, name, triggers = (), aliases = (), enabled = True):
+        """Put some triggers and aliases into a group, creating it if need
+        be.
+        
+        The group is switched on or off according to enabled only if it's
+        new; adding to an existing group leaves it as it was.
+        """
+        if name not in self._groups:
+            self._groups[name] = ([], [])
+            if not enabled:
+                self._disabled.add(name)
+        group_triggers, group_aliases = self._groups[name]
+        group_triggers.extend(triggers)
+        group_aliases.extend(aliases)
+        if name in self._disabled:
+            self.trigger_index.disable(triggers)
+            self.alias_index.disable(aliases)
+
+    def enable(self, name):
+        """Switch a group on."""
+        triggers, aliases = self._groups[name]
+        if name in self._disabled:
+            self._disabled.remove(name)
+            self.trigger_index.enable(triggers)
+            self.alias_index.enable(aliases)
+
+    def disable(self, name):
+        """Switch a group off."""
+        triggers, aliases = self._groups[name]
+        if name not in self._disabled:
+            self._disabled.add(name)
+            self.trigger_index.disable(triggers)
+            self.alias_index.disable(aliases)
+
+    def is_enabled(self, name):
+        """Is the group switched on?"""
+        if name not in self._groups:
+            raise KeyError(name)
+        return name not in self._disabled
+
+    def names(self):
+        """All the groups we know about."""
+        return sorted(self._groups)
+
+    def clear(self):
+        """Forget every group, switching them all back on first so the
+        indexes don't keep hold of them.
+        """
+        for name in list(self._disabled):
+            self.enable(name)
+        self._groups.clear()
+
+def add_groups(module, manager):
+    """Add a module's trigger and alias groups to the manager, along with
+    their members.
+    """
+    names = set(module.trigger_groups) | set(module.alias_groups)
+    for name in sorted(names):
+        triggers = module.trigger_groups.get(name, [])
+        aliases = module.alias_groups.get(name, [])
+        manager.triggers.extend(triggers)
+        manager.aliases.extend(aliases)
+        manager.groups.add(name, triggers, aliases,
+                           enabled = name not in module.disabled_groups)
+
 class BaseModule(object):
-    """A base class for modules."""
+    """A base class for modules.
+    
+    As well as plain triggers and aliases, a module can have named groups of
+    them in trigger_groups and alias_groups (dicts of name to list). Groups
+    start off switched on unless they're named in disabled_groups, and are
+    switched with manager.groups.enable(name) and manager.groups.disable(name).
+
+    Gags, highlights and substitutions that don't need a callback can go in
+    rules instead; see line_rules.py.
+    """
 
     triggers = []
     aliases = []
+    trigger_groups = {}
+    alias_groups = {}
+    disabled_groups = ()
+    rules = []
     macros = {}
     modules = []
     gmcp_events=[]
@@ -28,6 +121,10 @@ class BaseModule(object):
         manager.aliases.extend(self.aliases)
         manager.macros.update(self.macros)
         manager.gmcp_events.extend(self.gmcp_events)
+        if self.trigger_groups or self.alias_groups:
+            add_groups(self, manager)
+        if self.rules:
+            manager.line_rules.extend(self.rules)
 
     def is_main(self, realm):
         """We're the main module; do funky main module initialisation.
@@ -57,6 +154,10 @@ class EarlyInitialisingModule(object):
         manager.aliases.extend(self.aliases)
         manager.macros.update(self.macros)
         manager.gmcp_events.extend(self.gmcp_events)
+        if self.trigger_groups or self.alias_groups:
+            add_groups(self, manager)
+        if self.rules:
+            manager.line_rules.extend(self.rules)
         return self
 
     def is_main(self, realm):
@@ -71,6 +172,10 @@ class EarlyInitialisingModule(object):
     macros = {}
     triggers = []
     aliases = []
+    trigger_groups = {}
+    alias_groups = {}
+    disabled_groups = ()
+    rules = []
     modules = []
     gmcp_events=[]
     encoding = "utf-8"
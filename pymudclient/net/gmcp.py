@@ -4,8 +4,9 @@ Created on Jul 16, 2015
 @author: Dmitry
 '''
 from twisted.internet.protocol import Protocol
+from pymudclient.gmcp_events import tag_matches
 import json
-import re
+import traceback
 import pymudclient
 
 
@@ -13,8 +14,258 @@ GMCP = chr(201)
 GMCP_PING='Core.Ping'
 
 
-decoder = re.compile('^([A-Za-z\.]*) (({|\[).*(}|\]))$')
-string_decoder = re.compile('^([A-Za-z\.]*) (\"\w+\")$')
+#payloads longer than this are kept as text until something wants them.
+LAZY_SIZE = 1024
+
+def decode_payload(text):
+    """Decode a GMCP payload, which can be any JSON value.
+
+    An empty payload is None, and one that isn't JSON at all is left as
+    it is.
+    """
+    if not text.strip():
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+_UNDECODED = object()
+
+class RawPayload(object):
+    """A GMCP payload that's still JSON text, decoded the first time its
+    value is asked for.
+    """
+
+    __slots__ = ['text', '_value']
+
+    def __init__(self, text):
+        self.text = text
+        self._value = _UNDECODED
+
+    @property
+    def value(self):
+        if self._value is _UNDECODED:
+            self._value = decode_payload(self.text)
+        return self._value
+
+    def __repr__(self):
+        return 'RawPayload(%r)' % self.text
+
+def payload_value(payload):
+    """Return what the payload decodes to."""
+    if isinstance(payload, RawPayload):
+        return payload.value
+    return payload
+
+def parse_frame(data):
+    """Split a GMCP message into its type and payload.
+
+    Big payloads come back as RawPayloads, so the likes of Room.Info aren't
+    decoded unless something actually looks at them.
+    """
+    message_type, _, text = data.partition(' ')
+    if len(text) > LAZY_SIZE:
+        return message_type, RawPayload(text)
+    return message_type, decode_payload(text)
+
+#message types that only ever say what's changed, so are merged into what
+#we've already got rather than replacing it.
+PARTIAL_TYPES = frozenset(['Char.Status'])
+
+class GmcpDelta(object):
+    """What one GMCP message changed.
+
+    Either the whole value was replaced (whole is true, and value is the
+    new value), or the fields in changed were set and those in removed went
+    away. merged is true if the message only had some of the fields in, and
+    was merged into what was there. A delta that changed nothing is false.
+
+    value can still be a RawPayload for a big message nobody's subscribed
+    to; use payload_value() on it if that might be the case.
+    """
+
+    __slots__ = ['whole', 'value', 'changed', 'removed', 'merged']
+
+    def __init__(self, changed = None, removed = (), merged = False):
+        self.whole = False
+        self.merged = merged
+        self.value = None
+        self.changed = changed if changed is not None else {}
+        self.removed = list(removed)
+
+    @classmethod
+    def replacing(cls, value):
+        """Make a delta that replaces the whole value."""
+        delta = cls()
+        delta.whole = True
+        delta.value = value
+        return delta
+
+    def __nonzero__(self):
+        return self.whole or bool(self.changed) or bool(self.removed)
+
+    def apply(self, old):
+        """Return a copy of old, brought up to date."""
+        if self.whole:
+            return self.value
+        res = dict(old) if isinstance(old, dict) else {}
+        res.update(self.changed)
+        for key in self.removed:
+            res.pop(key, None)
+        return res
+
+    def __repr__(self):
+        if self.whole:
+            return 'GmcpDelta.replacing(%r)' % (self.value,)
+        return 'GmcpDelta(%r, %r)' % (self.changed, self.removed)
+
+_MISSING = object()
+
+def diff(old, new, partial = False):
+    """Work out the GmcpDelta that takes the dict old to new.
+
+    If partial, new only has the fields that are being updated, and nothing
+    is removed.
+    """
+    changed = {}
+    for key, value in new.iteritems():
+        if old.get(key, _MISSING) != value:
+            changed[key] = value
+    if partial:
+        removed = ()
+    else:
+        removed = [key for key in old if key not in new]
+    return GmcpDelta(changed, removed, merged = partial)
+
+class GmcpStore(dict):
+    """The latest state of each type of GMCP message.
+
+    Messages are compared against what was there before, field by field, and
+    subscribers are only told about the ones that actually change something.
+    Payloads are decoded when they're looked up, if they haven't been
+    already. That goes for all the ways of getting values out except
+    dict(store) and calling dict's own methods, which see the RawPayloads;
+    use store.copy() for a plain, decoded dict.
+    """
+
+    def __init__(self, partial_types = PARTIAL_TYPES):
+        dict.__init__(self)
+        self.partial_types = set(partial_types)
+        self._subscribers = []
+        #which subscribers want each message type.
+        self._resolved = {}
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, RawPayload):
+            value = value.value
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default = None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def itervalues(self):
+        return (self[key] for key in self)
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def iteritems(self):
+        return ((key, self[key]) for key in self)
+
+    def copy(self):
+        return dict(self.iteritems())
+
+    def pop(self, key, *default):
+        return payload_value(dict.pop(self, key, *default))
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        return key, payload_value(value)
+
+    def setdefault(self, key, default = None):
+        if key not in self:
+            dict.__setitem__(self, key, default)
+        return self[key]
+
+    def subscribe(self, tag, callback):
+        """Call callback(gmcp_type, delta) whenever a message of a type that
+        tag covers changes something. tag can be a wildcard, as for
+        GmcpEvents. Big payloads of types with subscribers are decoded as
+        they come in, so delta.value is never a RawPayload here.
+        """
+        self._subscribers.append((tag, callback))
+        self._resolved.clear()
+
+    def unsubscribe(self, tag, callback):
+        """Undo subscribe()."""
+        self._subscribers.remove((tag, callback))
+        self._resolved.clear()
+
+    def unsubscribe_all(self):
+        del self._subscribers[:]
+        self._resolved.clear()
+
+    def update_message(self, gmcp_type, payload):
+        """Take in a message, and return the GmcpDelta of what it changed.
+
+        Big payloads that haven't been decoded yet aren't compared, but
+        taken to replace what was there; they're whole snapshots (Room.Info
+        and the like) anyway. That's only if nobody's subscribed to them,
+        though: subscribers get decoded values, and only real changes.
+        """
+        if isinstance(payload, RawPayload) and self._callbacks(gmcp_type):
+            payload = payload.value
+        if gmcp_type not in self or isinstance(payload, RawPayload):
+            delta = GmcpDelta.replacing(payload)
+        else:
+            old = self[gmcp_type]
+            if isinstance(old, dict) and isinstance(payload, dict):
+                delta = diff(old, payload, gmcp_type in self.partial_types)
+            elif old == payload:
+                delta = GmcpDelta()
+            else:
+                delta = GmcpDelta.replacing(payload)
+        self.apply_delta(gmcp_type, delta)
+        return delta
+
+    def apply_delta(self, gmcp_type, delta):
+        """Bring a message type up to date with a delta, which may have been
+        worked out elsewhere.
+        """
+        if not delta:
+            return
+        if delta.whole:
+            dict.__setitem__(self, gmcp_type, delta.value)
+        else:
+            dict.__setitem__(self, gmcp_type,
+                             delta.apply(self.get(gmcp_type)))
+        self._notify(gmcp_type, delta)
+
+    def _callbacks(self, gmcp_type):
+        """Return the subscribers that want to know about gmcp_type."""
+        try:
+            return self._resolved[gmcp_type]
+        except KeyError:
+            callbacks = [callback for tag, callback in self._subscribers
+                         if tag_matches(tag, gmcp_type)]
+            self._resolved[gmcp_type] = callbacks
+            return callbacks
+
+    def _notify(self, gmcp_type, delta):
+        """Tell the subscribers that want to know about a change."""
+        for callback in self._callbacks(gmcp_type):
+            try:
+                callback(gmcp_type, delta)
+            except Exception: #don't catch KeyboardInterrupt etc
+                traceback.print_exc()
 
 
 class GmcpHandler:
@@ -26,26 +277,12 @@ class GmcpHandler:
     @staticmethod
     def process(bytes,realm):
         data_string = ''.join(bytes)
-        result=decoder.match(data_string)
-        if not result == None:
-            
-            message_type = result.group(1)
-            message_data = result.group(2)
-            gmcp_data = json.loads(message_data)
-            realm.gmcp[message_type]=gmcp_data
-            
-            realm.gmcpReceived((message_type, gmcp_data))
-                    
-            
-        else: #the payload is just a string
-            result = string_decoder.match(data_string)
-            if not result == None:
-                message_type = result.group(1)
-                message_data = result.group(2)
-                realm.gmcp[message_type]=message_data
-                realm.gmcpReceived((message_type, message_data))
-            else:
-                print('Really unknown GMCP type %s'%data_string)
+        message_type, payload = parse_frame(data_string)
+        if not message_type:
+            print('Really unknown GMCP type %s'%data_string)
+            return
+        delta = realm.gmcp.update_message(message_type, payload)
+        realm.gmcpReceived((message_type, payload), delta)
         
         #structure = json.load(''.join(bytes))
         #print(structure)
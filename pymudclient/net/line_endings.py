@@ -0,0 +1,90 @@
+"""Fixing up the line endings of servers that send LF CR instead of CR LF.
+
+GodWars-derived MUDs are the usual culprits. Telnet takes the LF as the end
+of the line, but the CR gets stuck onto the front of the next line. So once
+we know a server does this, every CR that finishes off an LF CR pair is
+dropped.
+
+This is done on the stream of data as it arrives, so an LF at the end of
+one chunk and a CR at the start of the next are still recognised as a pair.
+"""
+import re
+
+#what the last byte seen leaves us waiting for.
+NOTHING = 'nothing'
+#a CR, which an LF would make into an ordinary line ending.
+AFTER_CR = 'cr'
+#an LF that wasn't part of a CR LF, which a CR would make into a broken one.
+AFTER_LF = 'lf'
+
+_line_ends_re = re.compile('[\r\n]+')
+#an LF CR that isn't just the end of a CR LF, as in a blank line.
+_broken_re = re.compile('(?<!\r)\n\r')
+
+class LineEndingFixer(object):
+    """Fixes up LF CR line endings in a stream of data, one chunk at a time.
+
+    enabled is True to always fix them, False to never fix them, or None to
+    start fixing them as soon as the server is seen sending one.
+    """
+
+    def __init__(self, enabled = None):
+        self.enabled = enabled
+        self._state = NOTHING
+
+    def feed(self, data):
+        """Return the chunk of data with its line endings fixed up."""
+        if self.enabled is False:
+            return data
+        if self.enabled is None and not _broken_re.search(data) and \
+           not (self._state is AFTER_LF and data.startswith('\r')):
+            #no broken line endings here, so just keep track of where we're
+            #up to.
+            self._skip(data)
+            return data
+        pieces = []
+        prev_end = 0
+        state = self._state
+        for match in _line_ends_re.finditer(data):
+            start = match.start()
+            if start != prev_end:
+                state = NOTHING
+            pieces.append(data[prev_end:start])
+            prev_end = match.end()
+            for char in match.group():
+                if char == '\r':
+                    if state is AFTER_LF:
+                        #that's a broken line ending, so this CR needs to
+                        #be got rid of.
+                        self.enabled = True
+                        state = NOTHING
+                        continue
+                    state = AFTER_CR
+                elif state is AFTER_CR:
+                    state = NOTHING
+                else:
+                    state = AFTER_LF
+                pieces.append(char)
+        if prev_end != len(data):
+            state = NOTHING
+        self._state = state
+        if not self.enabled:
+            #we were only looking.
+            return data
+        pieces.append(data[prev_end:])
+        return ''.join(pieces)
+
+    def _skip(self, data):
+        """Work out the state at the end of data, which has no broken LF
+        CRs in it.
+        """
+        if not data:
+            return
+        if data.endswith('\r'):
+            self._state = AFTER_CR
+        elif not data.endswith('\n'):
+            self._state = NOTHING
+        elif len(data) > 1:
+            self._state = NOTHING if data[-2] == '\r' else AFTER_LF
+        else:
+            self._state = NOTHING if self._state is AFTER_CR else AFTER_LF
@@ -5,21 +5,63 @@ See http://mccp.afkmud.com/protocol.html for the official definition.
 from twisted.internet.protocol import Protocol, connectionDone
 from twisted.conch.telnet import IAC, SE, ProtocolTransportMixin
 import zlib
+import time
 
 #we don't even make an effort to support COMPRESS (v1 of the protocol)
 #because of the pain that parsing unterminated subnegotiation sequences would
 #cause. MUD owners: if you want to save bandwidth, switch to COMPRESS2!
 COMPRESS2 = chr(86)
+#MCCP v3, for compressing what we send to the MUD. It's negotiated with
+#IAC WILL/DO like COMPRESS2, but it's us that then sends IAC SB COMPRESS3
+#IAC SE and starts compressing.
+COMPRESS3 = chr(87)
+
+#the most decompressed data that's passed on in one go. Anything past this
+#waits for the next turn of the reactor, so one huge burst (a who list, say)
+#can't stall everything else.
+MAX_DECOMPRESSED = 16384
 
 class MCCPTransport(Protocol, ProtocolTransportMixin):
     """A transport-cum-protocol that (sort of) invisibly handles MCCP."""
     
-    def __init__(self, protocol):
+    def __init__(self, protocol, clock = None):
         self.their_mccp_active = False
         self.our_mccp_active = False
-        self.later = ''
+        #bytes held back until the next chunk arrives.
+        self._pending = bytearray()
         self.decompressor = zlib.decompressobj()
+        #for what we send, once our_mccp_active is on.
+        self.compressor = None
+        #compressed data waiting for the next flush.
+        self._compressed = []
+        self._flush_call = None
         self.protocol = protocol
+        #the reactor, or something like it. Looked up when it's needed if
+        #not given, so that the right reactor has been installed by then.
+        self.clock = clock
+        #the call that'll pick up where we left off, if we're waiting.
+        self._resume_call = None
+        #whether the decompressor may have more output without more input.
+        self._draining = False
+        self._paused = False
+        #statistics for this session.
+        self.compressed_bytes = 0
+        self.decompressed_bytes = 0
+        self.decompression_time = 0.
+
+    @property
+    def compression_ratio(self):
+        """How many bytes each compressed byte received has turned into, or
+        0 if nothing's been decompressed yet.
+        """
+        if not self.compressed_bytes:
+            return 0.
+        return float(self.decompressed_bytes) / self.compressed_bytes
+
+    @property
+    def later(self):
+        """The data that's been received but not yet passed on."""
+        return str(self._pending)
 
     @property
     def disconnecting(self):
@@ -37,7 +79,15 @@ class MCCPTransport(Protocol, ProtocolTransportMixin):
 
     def connectionLost(self, reason = connectionDone):
         """We've lost the connection. Inform our protocol."""
+        if self._flush_call is not None:
+            self._flush_call.cancel()
+            self._flush_call = None
         #make sure nothing's trapped in our buffers
+        self._paused = False
+        while self._resume_call is not None:
+            #no time left to be spreading it out.
+            self._resume_call.cancel()
+            self._resume()
         if self.their_mccp_active:
             #this can occur if the last thing the MUD sent was compressed with
             #Z_FINISH as an option. Dunno what's so special about that that
@@ -48,14 +98,29 @@ class MCCPTransport(Protocol, ProtocolTransportMixin):
             #This primarily occurs when self.later is just an IAC. In fact, I
             #think that's the only condition that can lead to this.
             self.protocol.dataReceived(self.later)
+        self._pending = bytearray()
         self.protocol.connectionLost(reason)
 
     def dataReceived(self, data):
         """We've received some data. Process it."""
-        self.later += data
-        self._process()
+        if self._resume_call is not None:
+            #we're still working through an earlier burst, so this has to
+            #wait its turn.
+            self._pending.extend(data)
+            return
+        if self._pending:
+            #whatever was held back from the last chunk goes on the front.
+            self._pending.extend(data)
+            data = str(self._pending)
+            del self._pending[:]
+        self._process(data)
+        if self._resume_call is not None and self.transport is not None:
+            #we've fallen behind, so stop reading more in until we've caught
+            #up.
+            self._paused = True
+            self.transport.pauseProducing()
 
-    def _process(self):
+    def _process(self, data):
         """Depending on whether MCCP is active or not, this method does two
         things:
 
@@ -63,36 +128,154 @@ class MCCPTransport(Protocol, ProtocolTransportMixin):
             where each break occurs where COMPRESS2 could reasonably be turned
             on.
           - If compression is on, then the input is decoded.
+
+        The data is walked through by index rather than being chopped up as
+        we go, so the rest of a big chunk doesn't get copied over and over.
         """
-        while self.later:
+        pos = 0
+        draining = self._draining
+        self._draining = False
+        while pos < len(data) or draining:
+            draining = False
             if not self.their_mccp_active:
-            	#We need to break at IAC SE, because COMPRESS2 is activated by
-            	#a subnegotiation sequence. To see why we need to split it
-            	#here, consider this text sequence:
-            	# 'foo' + IAC + SB + COMPRESS2 + IAC + SE + compress('bar')
-            	#If we don't split our input up at IAC SEs, then the second,
-            	#compressed, part of the string will be treated as not being
-            	#compressed. This manifests itself as a unicode decoding error
-            	#amongst other things, but that's only a symptom.
-                first, sep, self.later = self.later.partition(IAC + SE)
-                #stop chopped IAC SE sequences being, well, chopped.
-                if not sep and first.endswith(IAC):
-                    self.later = IAC + self.later
-                    first = first[:-1]
-                self.protocol.dataReceived(first + sep)
-                if not sep:
-                    #need to break out here, else we'll loop infinitely when
-                    #we've re-atomicised a chopped sequence.
+                #We need to break at IAC SE, because COMPRESS2 is activated by
+                #a subnegotiation sequence. To see why we need to split it
+                #here, consider this text sequence:
+                # 'foo' + IAC + SB + COMPRESS2 + IAC + SE + compress('bar')
+                #If we don't split our input up at IAC SEs, then the second,
+                #compressed, part of the string will be treated as not being
+                #compressed. This manifests itself as a unicode decoding error
+                #amongst other things, but that's only a symptom.
+                end = data.find(IAC + SE, pos)
+                if end != -1:
+                    end += 2
+                elif data.endswith(IAC):
+                    #stop chopped IAC SE sequences being, well, chopped.
+                    self._pending.extend(IAC)
+                    if len(data) - 1 > pos:
+                        self.protocol.dataReceived(data[pos:-1])
                     break
+                else:
+                    end = len(data)
+                self.protocol.dataReceived(data[pos:end])
+                pos = end
             else:
-                first = self.decompressor.decompress(self.later)
-                #extract the data past the end of this particular compressed
-                #string.
-                self.later = self.decompressor.unused_data
-                if self.later:
+                #buffer avoids copying the rest of the data to pass it on.
+                started = time.time()
+                first = self.decompressor.decompress(buffer(data, pos),
+                                                     MAX_DECOMPRESSED)
+                self.decompression_time += time.time() - started
+                #the data past the end of this particular compressed string.
+                unused = self.decompressor.unused_data
+                if unused:
+                    #unconsumed_tail has the same data in it here, so it
+                    #mustn't be counted twice.
+                    end = len(data) - len(unused)
+                else:
+                    #the data we didn't get round to because of the limit.
+                    end = len(data) - len(self.decompressor.unconsumed_tail)
+                self.compressed_bytes += end - pos
+                self.decompressed_bytes += len(first)
+                pos = end
+                if unused:
                     #the MUD has ended the decompression. We've got a leftover
                     #bit of uncompressed data here still.
                     self.decompressor = zlib.decompressobj()
                     self.their_mccp_active = False
                 if first:
                     self.protocol.dataReceived(first)
+                if len(first) == MAX_DECOMPRESSED:
+                    #there's probably more where that came from, but give the
+                    #reactor a look in first.
+                    self._draining = self.their_mccp_active
+                    self._wait(data[pos:])
+                    return
+
+    def _call_soon(self, func):
+        """Call func once the reactor's had a turn."""
+        if self.clock is None:
+            from twisted.internet import reactor
+            self.clock = reactor
+        return self.clock.callLater(0, func)
+
+    def _wait(self, rest):
+        """Put off processing rest until the reactor's had a turn."""
+        self._pending.extend(rest)
+        self._resume_call = self._call_soon(self._resume)
+
+    def _resume(self):
+        """Carry on with the data that was put off."""
+        self._resume_call = None
+        data = str(self._pending)
+        del self._pending[:]
+        self._process(data)
+        if self._resume_call is None and self._paused:
+            #caught up, so let the data flow again.
+            self._paused = False
+            self.transport.resumeProducing()
+
+    def start_compressing(self):
+        """Compress everything sent from here on.
+
+        The IAC SB COMPRESS3 IAC SE that tells the MUD so should already
+        have been sent.
+        """
+        if self.our_mccp_active:
+            return
+        self.compressor = zlib.compressobj()
+        self.our_mccp_active = True
+
+    def stop_compressing(self):
+        """Finish off the compressed stream, and send uncompressed data from
+        here on.
+        """
+        if not self.our_mccp_active:
+            return
+        self._compressed.append(self.compressor.flush(zlib.Z_FINISH))
+        self.compressor = None
+        self.our_mccp_active = False
+        self.flush()
+
+    def write(self, data):
+        """Send some data to the MUD."""
+        if self.our_mccp_active:
+            self._compress([data.replace('\n', '\r\n')])
+        else:
+            ProtocolTransportMixin.write(self, data)
+
+    def writeSequence(self, seq):
+        """Send several bits of data to the MUD."""
+        if self.our_mccp_active:
+            self._compress(seq)
+        else:
+            ProtocolTransportMixin.writeSequence(self, seq)
+
+    def _compress(self, seq):
+        """Compress seq, to be sent at the next flush.
+
+        Everything written in one turn of the reactor (a batch of commands,
+        usually) goes out together, so we don't pay for a zlib flush for
+        every line.
+        """
+        compress = self.compressor.compress
+        self._compressed.extend(compress(data) for data in seq)
+        if self._flush_call is None:
+            self._flush_call = self._call_soon(self.flush)
+
+    def flush(self):
+        """Send off the data compressed since the last flush."""
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        if self.compressor is not None:
+            self._compressed.append(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        data = ''.join(self._compressed)
+        self._compressed = []
+        if data:
+            self.transport.write(data)
+
+    def loseConnection(self):
+        """Close the connection, after sending anything still waiting."""
+        self.stop_compressing()
+        ProtocolTransportMixin.loseConnection(self)
@@ -15,10 +15,17 @@ BG_FLAG = '4'
 
 GROUND_RESET = '8'
 
+#38 and 48 on their own reset the colours, but followed by 5 and a number,
+#they set an xterm 256 colour, or followed by 2 and three numbers, a
+#truecolour.
+EXTENDED_FG = '38'
+EXTENDED_BG = '48'
+EXTENDED_KINDS = frozenset(['5', '05', '2', '02'])
+
 colour_pattern = re.compile( "\x1b" + #ESC
                             r"\[" #open square bracket
                             r"(\d+" #open group, initial digits
-                            r"(?:;\d{1,2})*" #following digits
+                            r"(?:;\d{1,3})*" #following digits
                             r")" #close the group
                              "m" #just an 'm'
                              )
@@ -33,23 +40,135 @@ BS = '\010'
 HT = '\011' #AKA '\t' and tab.
 HT_replacement = '    ' #four spaces
 
+_control_re = re.compile('[%s]' % ''.join(toremove | set([BS, HT])))
+_toremove_re = re.compile('[%s]' % ''.join(toremove))
+_backspaces_re = re.compile('(%s+)' % BS)
+
+def _backspace(string):
+    """Make each backspace rub out the character before it, in one pass.
+
+    Backspaces can't rub out newlines, or anything before them.
+    """
+    res = []
+    #this alternates between text and runs of backspaces.
+    for ind, piece in enumerate(_backspaces_re.split(string)):
+        if not ind % 2:
+            if piece:
+                res.append(piece)
+            continue
+        count = len(piece)
+        while count and res:
+            last = res.pop()
+            keep = max(len(last) - count, last.rfind('\n') + 1)
+            count -= len(last) - keep
+            if keep:
+                #either that's all the backspaces used up, or we've hit a
+                #newline.
+                res.append(last[:keep])
+                break
+    return string[:0].join(res)
+
 def make_string_sane(string):
     """Process (in most cases, this means 'ignore') the NVT characters in the
     input string.
     """
+    #most lines don't have any of them at all.
+    if _control_re.search(string) is None:
+        return string
     #simple characters don't need any special machinery.
-    for char in toremove:
-        string = string.replace(char, '')
-    #do it backspace by backspace because otherwise, if there were multiple 
-    #backspaces in a row, it gets confused and backspaces over backspaces.
-    while BS in string:
-        #take off leading backspaces so that the following regex doesn't get 
-        #confused.
-        string = string.lstrip(BS)
-        string = re.sub('.' + BS, '', string, 1)
+    string = _toremove_re.sub('', string)
+    if BS in string:
+        string = _backspace(string)
     #swap tabs for four whitespaces.
-    string = string.replace(HT, HT_replacement)
-    return string
+    return string.replace(HT, HT_replacement)
+
+def _extended_colour(codes, ind):
+    """Read the xterm 256 colour or truecolour that follows a 38 or 48 at
+    codes[ind - 1].
+
+    Returns the colour (an integer palette index, or a (red, green, blue)
+    triple), or None if it's not valid, and where to carry on from.
+    """
+    if ind < len(codes) and codes[ind] in ('5', '05'):
+        if ind + 1 < len(codes) and codes[ind + 1]:
+            value = int(codes[ind + 1])
+            return (value if value < 256 else None), ind + 2
+        return None, ind + 2
+    if ind < len(codes) and codes[ind] in ('2', '02'):
+        values = codes[ind + 1:ind + 4]
+        if len(values) == 3 and all(values):
+            values = tuple(int(value) for value in values)
+            if max(values) < 256:
+                return values, ind + 4
+        return None, ind + 4
+    return None, ind
+
+def _decode_sgr(codes):
+    """Work out what a semicolon-separated list of SGR parameters does.
+
+    This returns a threeple of the foreground, background and bold that the
+    parameters leave set; any of them that aren't touched are None.
+    """
+    fore = back = bold = None
+    codes = codes.split(';')
+    ind = 0
+    while ind < len(codes):
+        code = codes[ind].lstrip('0') #normalisation.
+        ind += 1
+        if not code:
+            #leading zeroes been stripped from ALL_RESET
+            fore, back, bold = WHITE, BLACK, False
+        elif code == BOLDON:
+            bold = True
+        elif code == BOLDOFF:
+            bold = False
+        elif code == EXTENDED_FG and ind < len(codes) and \
+             codes[ind] in EXTENDED_KINDS:
+            colour, ind = _extended_colour(codes, ind)
+            if colour is not None:
+                fore = colour
+        elif code == EXTENDED_BG and ind < len(codes) and \
+             codes[ind] in EXTENDED_KINDS:
+            colour, ind = _extended_colour(codes, ind)
+            if colour is not None:
+                back = colour
+        elif code.startswith(FG_FLAG):
+            code = code[1:]
+            if code == GROUND_RESET:
+                code = WHITE
+            if code in NORMAL_CODES:
+                fore = code
+        elif code.startswith(BG_FLAG):
+            code = code[1:]
+            if code == GROUND_RESET:
+                code = BLACK
+            if code in NORMAL_CODES:
+                back = code
+    return (fore, back, bold)
+
+#what each list of SGR parameters does, worked out up front for the single
+#parameters, and remembered for the others as they turn up.
+_sgr_table = {}
+for _num in xrange(100):
+    for _codes in (str(_num), '%02d' % _num):
+        _sgr_table[_codes] = _decode_sgr(_codes)
+MAX_SGR_TABLE = 1024
+
+def _sgr_transition(codes):
+    """Look up what a list of SGR parameters does."""
+    try:
+        return _sgr_table[codes]
+    except KeyError:
+        res = _decode_sgr(codes)
+        if len(_sgr_table) < MAX_SGR_TABLE:
+            _sgr_table[codes] = res
+        return res
+
+#the colour objects for every colour state, so we needn't go through fg_code
+#and bg_code for each change.
+_fg_colours = dict(((code, bold), fg_code(code, bold))
+                   for code in NORMAL_CODES for bold in (True, False))
+_bg_colours = dict((code, bg_code(code)) for code in NORMAL_CODES)
 
 class ColourCodeParser(object):
 
@@ -63,11 +182,9 @@ class ColourCodeParser(object):
     def _parseline(self, line):
         """Feed it lines of VT100-infested text, and it splits it all up.
         
-        This returns a threeple: a string, the foreground colours, and the
-        background colours. The string is simple enough. The background list
-        is a list of integers corresponding to WHITE, GREEN, etc. The
-        foreground list is made up of two-ples: the first is the integer
-        colour, and the second is whether bold is on or off.
+        This returns a threeple: the foreground changes, the background
+        changes, and the string. The changes are lists of (index, colour),
+        with the colours as HexFGCodes and HexBGCodes.
 
         The lists of fore and back changes isn't redundant -- there are no
         changes that could be removed without losing colour information.
@@ -77,64 +194,55 @@ class ColourCodeParser(object):
         fore = self.fore
         bold = self.bold
         back = self.back
+        fg_colours = _fg_colours
+        bg_colours = _bg_colours
+        transitions = _sgr_table
         
-        backs = [(0, back)]
-        fores = [(0, (fore, bold))]
-        text = ''
-        prev_end = 0
+        backs = [(0, bg_code(back))]
+        fores = [(0, fg_code(fore, bold))]
+        #this alternates between the text and the escape codes' parameters.
+        pieces = colour_pattern.split(line)
+        length = 0
         
-        for match in colour_pattern.finditer(line):
-            text += line[prev_end:match.start()]
-            prev_end = match.end()
-            codes = match.group(1)
-
-            for code in codes.split(';'):
-                code = code.lstrip('0') #normalisation.
-                if not code:
-                    #leading zeroes been stripped from ALL_RESET
-                    if fore != WHITE or bold:
-                        fore = WHITE
-                        bold = False
-                        fores.append((len(text), (fore, bold)))
-                    if back != BLACK:
-                        back = BLACK
-                        backs.append((len(text), back))
-                elif code == BOLDON and not bold:
-                    bold = True
-                    fores.append((len(text), (fore, bold)))
-                elif code == BOLDOFF and bold:
-                    bold = False
-                    fores.append((len(text), (fore, bold)))
-
-                elif code.startswith(FG_FLAG):
-                    code = code[1:]
-                    if code == GROUND_RESET:
-                        code = WHITE
-                    if code in NORMAL_CODES and code != fore:
-                        fore = code
-                        fores.append((len(text), (fore, bold)))
-
-                elif code.startswith(BG_FLAG):
-                    code = code[1:]
-                    if code == GROUND_RESET:
-                        code = BLACK
-                    if code in NORMAL_CODES and code != back:
-                        back = code
-                        backs.append((len(text), back))
+        for ind in xrange(1, len(pieces), 2):
+            length += len(pieces[ind - 1])
+            codes = pieces[ind]
+            if codes in transitions:
+                new_fore, new_back, new_bold = transitions[codes]
+            else:
+                new_fore, new_back, new_bold = _sgr_transition(codes)
+
+            if new_fore is None:
+                new_fore = fore
+            if new_bold is None:
+                new_bold = bold
+            if new_fore != fore or new_bold != bold:
+                fore = new_fore
+                bold = new_bold
+                if (fore, bold) in fg_colours:
+                    _add_change(fores, length, fg_colours[(fore, bold)])
+                else:
+                    _add_change(fores, length, fg_code(fore, bold))
+            if new_back is not None and new_back != back:
+                back = new_back
+                if back in bg_colours:
+                    _add_change(backs, length, bg_colours[back])
+                else:
+                    _add_change(backs, length, bg_code(back))
         
         #We don't really care about chopped colour codes. This class is
         #actually going to be tossed whole lines (ie, \r\n or similar
         #terminated), and any escape code of the form "\x1b[\r\n30m" or
         #similar is broken anyway. I'll probably be proved wrong somehow
         #on this one...
-        if len(line) - 1 > prev_end:
-            text += line[prev_end:]
+        if len(pieces[-1]) <= 1:
+            pieces[-1] = ''
 
         self.fore = fore
         self.back = back
         self.bold = bold
 
-        return (fores, backs, text)
+        return (fores, backs, ''.join(pieces[::2]))
 
     def parseline(self, line):
         """Interpret the VT100 codes in line and returns a Metaline, replete
@@ -142,11 +250,16 @@ class ColourCodeParser(object):
         into three separate channels.
         """
         fores, backs, cleanline = self._parseline(line)
-        rlfores = RunLengthList(((length, fg_code(colour, bold))
-                                 for (length, (colour, bold)) in fores),
-                                _normalised = True)
-        rlbacks = RunLengthList(((length, bg_code(colour))
-                                 for (length, colour) in backs),
-                                _normalised = True)
-        return Metaline(cleanline, rlfores, rlbacks)
+        return Metaline(cleanline, RunLengthList(fores, _normalised = True),
+                        RunLengthList(backs, _normalised = True))
 
+def _add_change(changes, ind, colour):
+    """Add a colour change at ind, replacing any other change made there by
+    a previous escape code.
+    """
+    if changes[-1][0] == ind:
+        changes.pop()
+        if changes and changes[-1][1] == colour:
+            #we're back to how it was, so there's no change after all.
+            return
+    changes.append((ind, colour))
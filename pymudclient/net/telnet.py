@@ -3,13 +3,11 @@ from twisted.conch.telnet import Telnet, GA, IAC, ECHO, WILL
 from twisted.protocols.basic import LineOnlyReceiver
 from twisted.internet.protocol import ClientFactory
 from pymudclient.net.nvt import ColourCodeParser, make_string_sane
-from pymudclient.net.mccp import MCCPTransport, COMPRESS2
+from pymudclient.net.mccp import MCCPTransport, COMPRESS2, COMPRESS3
+from pymudclient.net.line_endings import LineEndingFixer
 from pymudclient.realms import RootRealm
-import re
 from pymudclient.net.gmcp import GMCP, GmcpHandler
 
-broken_line_ending_pattern = re.compile("([^\r]|^)\n\r")
-
 #pylint doesn't like Twisted naming conventions
 #pylint: disable-msg= C0103
 
@@ -27,11 +25,23 @@ class TelnetClient(Telnet, LineOnlyReceiver):
         #LineOnlyReceiver doesn't have an __init__ method, weirdly.
         self.factory = factory
         self.allowing_compress = False
+        self.allowing_outbound_compress = False
         self._colourparser = ColourCodeParser()
-        self.fix_broken_godwars_line_endings = True
+        self._line_endings = LineEndingFixer()
         self.block_builder=[]
        
 
+    @property
+    def fix_broken_godwars_line_endings(self):
+        """True to always fix LF CR line endings, False to never fix them,
+        or None to start fixing them once the server is seen using them.
+        """
+        return self._line_endings.enabled
+
+    @fix_broken_godwars_line_endings.setter
+    def fix_broken_godwars_line_endings(self, value):
+        self._line_endings.enabled = value
+
     def negotiate(self, bytes):
         
         command, bytes = bytes[0], bytes[1:]
@@ -57,6 +67,12 @@ class TelnetClient(Telnet, LineOnlyReceiver):
         if argument==GMCP and command == WILL:
             for msg in self.factory.gmcp_handshakes:
                 self.requestNegotiation(GMCP, msg)
+        if argument == COMPRESS3 and command == WILL and \
+           self.allowing_outbound_compress and \
+           not self.transport.our_mccp_active:
+            #our DO has gone out, so tell the MUD we're starting.
+            self.requestNegotiation(COMPRESS3, '')
+            self.transport.start_compressing()
             
             
         
@@ -65,6 +81,9 @@ class TelnetClient(Telnet, LineOnlyReceiver):
         if option == COMPRESS2:
             self.allowing_compress = True
             return True
+        if option == COMPRESS3:
+            self.allowing_outbound_compress = self.factory.use_mccp3
+            return self.allowing_outbound_compress
         if option == GMCP:
             
             self.allow_gmcp = True
@@ -82,6 +101,9 @@ class TelnetClient(Telnet, LineOnlyReceiver):
         """Allow MCCP to be turned off."""
         if option == COMPRESS2:
             self.allowing_compress = False
+        if option == COMPRESS3:
+            self.allowing_outbound_compress = False
+            self.transport.stop_compressing()
         if option == GMCP:
             self.allow_gmcp = False
         elif option == ECHO:
@@ -103,9 +125,7 @@ class TelnetClient(Telnet, LineOnlyReceiver):
         print("Unhandled subnegotiation %d"%ord(command))
 
     def dataReceived(self, data):
-        if self.fix_broken_godwars_line_endings:
-            while broken_line_ending_pattern.match(data):
-                data = re.sub(broken_line_ending_pattern, "\\1\r\n", data, 1)
+        data = self._line_endings.feed(data)
         try:
             Telnet.dataReceived(self, data)
         except ValueError as e:
@@ -207,6 +227,10 @@ class TelnetClientFactory(ClientFactory):
     def to_enable(self):
         return getattr(self.realm.mod, "to_enable", ["Char", "Char.Vitals"])
 
+    @property
+    def use_mccp3(self):
+        return getattr(self.realm.mod, "use_mccp3", True)
+
     @property
     def gmcp_handshakes(self):
         if hasattr(self.realm.mod, 'gmcp_handshakes'):
@@ -0,0 +1,319 @@
+from pymudclient.net import gmcp
+from pymudclient.net.gmcp import parse_frame, RawPayload, GmcpStore, \
+                                 GmcpHandler, payload_value, LAZY_SIZE, \
+                                 GmcpDelta, diff
+from pymudclient.gmcp_events import binding_gmcp_event
+from pymudclient.realms import RootRealm
+from pymudclient.client import ClientProtocol
+from mock import Mock
+import json
+
+def test_parse_object():
+    assert parse_frame('Char.Vitals {"hp": "10"}') == ('Char.Vitals',
+                                                       {'hp': '10'})
+
+def test_parse_list():
+    assert parse_frame('Room.Players [{"name": "Bob"}]') == \
+           ('Room.Players', [{'name': 'Bob'}])
+
+def test_parse_string():
+    assert parse_frame('Room.RemovePlayer "Bob"') == ('Room.RemovePlayer',
+                                                      'Bob')
+
+def test_parse_number_and_booleans():
+    assert parse_frame('Foo.Bar 42') == ('Foo.Bar', 42)
+    assert parse_frame('Foo.Bar true') == ('Foo.Bar', True)
+    assert parse_frame('Foo.Bar false') == ('Foo.Bar', False)
+
+def test_parse_empty_payload():
+    assert parse_frame('Core.Ping') == ('Core.Ping', None)
+    assert parse_frame('Core.Ping ') == ('Core.Ping', None)
+
+def test_parse_payload_with_spaces_in():
+    assert parse_frame('Comm.Channel.Text {"text": "a b c"}') == \
+           ('Comm.Channel.Text', {'text': 'a b c'})
+
+def test_parse_not_JSON_left_alone():
+    assert parse_frame('Core.Goodbye Bye now') == ('Core.Goodbye', 'Bye now')
+
+def test_big_payloads_are_lazy():
+    text = '{"exits": "%s"}' % ('x' * LAZY_SIZE)
+    gmcp_type, payload = parse_frame('Room.Info ' + text)
+    assert gmcp_type == 'Room.Info'
+    assert isinstance(payload, RawPayload)
+    assert payload.text == text
+    assert payload.value == {'exits': 'x' * LAZY_SIZE}
+
+def test_raw_payload_decodes_once():
+    payload = RawPayload('{"a": 1}')
+    assert payload.value is payload.value
+
+def test_payload_value():
+    assert payload_value(RawPayload('[1]')) == [1]
+    assert payload_value([1]) == [1]
+
+class Test_GmcpStore:
+
+    def setUp(self):
+        self.store = GmcpStore()
+        self.store['Room.Info'] = RawPayload('{"num": 1}')
+        self.store['Char.Vitals'] = {'hp': '10'}
+
+    def test_decoded_on_lookup(self):
+        assert self.store['Room.Info'] == {'num': 1}
+        assert self.store.get('Room.Info') == {'num': 1}
+        assert self.store.get('Room.Players') is None
+
+    def test_decoded_value_is_kept(self):
+        assert self.store['Room.Info'] is self.store['Room.Info']
+
+    def test_others_not_decoded(self):
+        self.store['Char.Vitals']
+        assert isinstance(dict.__getitem__(self.store, 'Room.Info'),
+                          RawPayload)
+
+    def test_items_and_values(self):
+        assert sorted(self.store.items()) == [('Char.Vitals', {'hp': '10'}),
+                                              ('Room.Info', {'num': 1})]
+        assert {'num': 1} in self.store.values()
+
+    def test_copy_is_decoded(self):
+        res = self.store.copy()
+        assert res == {'Room.Info': {'num': 1}, 'Char.Vitals': {'hp': '10'}}
+        assert type(res) is dict
+
+    def test_pop_and_popitem_decode(self):
+        assert self.store.pop('Room.Info') == {'num': 1}
+        assert self.store.pop('Room.Info', None) is None
+        self.store['Room.Info'] = RawPayload('{"num": 2}')
+        del self.store['Char.Vitals']
+        assert self.store.popitem() == ('Room.Info', {'num': 2})
+
+    def test_setdefault_decodes(self):
+        assert self.store.setdefault('Room.Info', {}) == {'num': 1}
+        assert self.store.setdefault('Room.Players', []) == []
+        assert self.store['Room.Players'] == []
+
+    def test_gmcpToString(self):
+        res = GmcpHandler.gmcpToString(self.store, 'Room.Info')
+        assert res == '{\n  "num":1\n}', repr(res)
+        assert '"num":1' in GmcpHandler.gmcpToString(self.store)
+
+class WithHandler(object):
+
+    def __init__(self, realm):
+        realm.gmcp_events.append(self.room_info)
+
+    modules = []
+
+    @binding_gmcp_event('Room.Info')
+    def room_info(self, gmcp_data, realm):
+        realm.seen.append(gmcp_data)
+
+class Test_process:
+
+    def setUp(self):
+        self.realm = RootRealm(None)
+        self.realm.seen = []
+        self.realm.load_module(WithHandler)
+        self.big = '{"name": "%s"}' % ('x' * LAZY_SIZE)
+
+    def test_handlers_get_decoded_data(self):
+        GmcpHandler.process(list('Room.Info ' + self.big), self.realm)
+        assert self.realm.seen == [{'name': 'x' * LAZY_SIZE}]
+        assert self.realm.gmcp['Room.Info'] == {'name': 'x' * LAZY_SIZE}
+
+    def test_unwanted_messages_not_decoded(self):
+        GmcpHandler.process(list('Comm.Channel.List ' + self.big),
+                            self.realm)
+        payload = dict.__getitem__(self.realm.gmcp, 'Comm.Channel.List')
+        assert isinstance(payload, RawPayload)
+        assert payload._value is gmcp._UNDECODED
+
+    def test_no_message_type(self):
+        GmcpHandler.process(list(' {}'), self.realm)
+        assert not self.realm.gmcp
+
+def test_big_payloads_sent_to_the_processor_as_text():
+    prot = ClientProtocol(None)
+    prot.send_to_client = Mock()
+    prot.do_gmcp(('Room.Info', RawPayload('{"num": 1}')))
+    prot.do_gmcp(('Char.Vitals', {'hp': '10'}))
+    calls = [args for args, kwargs in prot.send_to_client.call_args_list]
+    assert calls == [('do_gmcp_raw', ['Room.Info', '{"num": 1}']),
+                     ('do_gmcp', [('Char.Vitals', {'hp': '10'})])], calls
+
+def test_diff():
+    delta = diff({'hp': 1, 'mp': 2, 'blind': 1}, {'hp': 1, 'mp': 3})
+    assert delta.changed == {'mp': 3}
+    assert delta.removed == ['blind']
+    assert not delta.whole
+
+def test_diff_partial():
+    delta = diff({'hp': 1, 'mp': 2}, {'mp': 3}, partial = True)
+    assert delta.changed == {'mp': 3}
+    assert delta.removed == []
+
+def test_empty_delta_is_false():
+    assert not GmcpDelta()
+    assert not diff({'hp': 1}, {'hp': 1})
+    assert GmcpDelta.replacing(None)
+
+def test_delta_apply_copies():
+    old = {'hp': 1, 'mp': 2}
+    assert GmcpDelta({'hp': 3}, ['mp']).apply(old) == {'hp': 3}
+    assert old == {'hp': 1, 'mp': 2}
+
+class Test_GmcpStore_updates:
+
+    def setUp(self):
+        self.store = GmcpStore()
+        self.seen = []
+        self.store.subscribe('Char.Vitals', self.callback)
+
+    def callback(self, gmcp_type, delta):
+        self.seen.append((gmcp_type, delta))
+
+    def test_first_message_replaces(self):
+        delta = self.store.update_message('Char.Vitals', {'hp': 1})
+        assert delta.whole and delta.value == {'hp': 1}
+        assert self.store['Char.Vitals'] == {'hp': 1}
+        assert self.seen == [('Char.Vitals', delta)]
+
+    def test_changed_fields_recorded(self):
+        self.store.update_message('Char.Vitals', {'hp': 1, 'mp': 2})
+        delta = self.store.update_message('Char.Vitals', {'hp': 1, 'mp': 3})
+        assert delta.changed == {'mp': 3} and delta.removed == []
+        assert self.store['Char.Vitals'] == {'hp': 1, 'mp': 3}
+
+    def test_snapshots_drop_missing_fields(self):
+        self.store.update_message('Char.Vitals', {'hp': 1, 'blind': '1'})
+        delta = self.store.update_message('Char.Vitals', {'hp': 1})
+        assert delta.removed == ['blind']
+        assert self.store['Char.Vitals'] == {'hp': 1}
+
+    def test_partial_types_are_merged(self):
+        self.store.update_message('Char.Status', {'name': 'Bob',
+                                                  'level': '1'})
+        delta = self.store.update_message('Char.Status', {'level': '2'})
+        assert delta.changed == {'level': '2'} and delta.removed == []
+        assert self.store['Char.Status'] == {'name': 'Bob', 'level': '2'}
+
+    def test_subscribers_only_told_about_real_changes(self):
+        self.store.update_message('Char.Vitals', {'hp': 1})
+        self.store.update_message('Char.Vitals', {'hp': 1})
+        self.store.update_message('Char.Vitals', {'hp': 2})
+        assert len(self.seen) == 2, self.seen
+        assert self.seen[1][1].changed == {'hp': 2}
+
+    def test_unchanged_non_dicts(self):
+        self.store.update_message('Room.RemovePlayer', 'Bob')
+        assert not self.store.update_message('Room.RemovePlayer', 'Bob')
+        assert self.store.update_message('Room.RemovePlayer', 'Jim').whole
+
+    def test_wildcard_subscriptions(self):
+        seen = []
+        self.store.subscribe('Room.*', lambda t, d: seen.append(t))
+        self.store.update_message('Room.Info', {'num': 1})
+        self.store.update_message('Char.Vitals', {'hp': 1})
+        assert seen == ['Room.Info']
+
+    def test_unsubscribe(self):
+        self.store.unsubscribe('Char.Vitals', self.callback)
+        self.store.update_message('Char.Vitals', {'hp': 1})
+        assert self.seen == []
+
+    def test_raw_payloads_replace_without_decoding(self):
+        #nobody's subscribed to Room.Info, so there's no need to look.
+        self.store.update_message('Room.Info', {'num': 1})
+        payload = RawPayload('{"num": 2}')
+        delta = self.store.update_message('Room.Info', payload)
+        assert delta.whole and delta.value is payload
+        assert payload._value is gmcp._UNDECODED
+        assert self.store['Room.Info'] == {'num': 2}
+
+    def test_raw_payloads_decoded_for_subscribers(self):
+        self.store.subscribe('Room.Info', self.callback)
+        self.store.update_message('Room.Info', RawPayload('{"num": 1}'))
+        delta = self.store.update_message('Room.Info',
+                                          RawPayload('{"num": 2}'))
+        assert self.seen[0][1].value == {'num': 1}
+        assert delta.changed == {'num': 2}
+        assert not self.store.update_message('Room.Info',
+                                             RawPayload('{"num": 2}'))
+        assert len(self.seen) == 2, self.seen
+
+    def test_deltas_rebuild_the_same_state_elsewhere(self):
+        other = GmcpStore()
+        messages = [('Char.Vitals', {'hp': 1, 'mp': 2, 'blind': '1'}),
+                    ('Char.Vitals', {'hp': 1, 'mp': 3}),
+                    ('Char.Status', {'name': 'Bob', 'level': '1'}),
+                    ('Char.Status', {'level': '2'}),
+                    ('Room.RemovePlayer', 'Bob'),
+                    ('Char.Vitals', {'hp': 1, 'mp': 3})]
+        for gmcp_type, payload in messages:
+            delta = self.store.update_message(gmcp_type, payload)
+            if delta.whole:
+                other.update_message(gmcp_type, delta.value)
+            else:
+                #as it'd go over the pipe to the processor.
+                changed, removed = json.loads(json.dumps([delta.changed,
+                                                          delta.removed]))
+                other.apply_delta(gmcp_type, GmcpDelta(changed, removed))
+            assert other == self.store, (other, self.store)
+
+def test_process_passes_the_delta_on():
+    realm = Mock()
+    realm.gmcp = GmcpStore()
+    GmcpHandler.process(list('Char.Vitals {"hp": 1}'), realm)
+    GmcpHandler.process(list('Char.Vitals {"hp": 2}'), realm)
+    (pair, delta), kwargs = realm.gmcpReceived.call_args
+    assert pair == ('Char.Vitals', {'hp': 2})
+    assert delta.changed == {'hp': 2}
+
+def protocol_calls(prot):
+    return [args for args, kwargs in prot.send_to_client.call_args_list]
+
+def test_deltas_sent_to_the_processor():
+    prot = ClientProtocol(None)
+    prot.send_to_client = Mock()
+    prot.do_gmcp(('Char.Vitals', {'hp': 1, 'mp': 1, 'blind': '1'}),
+                 GmcpDelta.replacing({'hp': 1, 'mp': 1, 'blind': '1'}))
+    prot.do_gmcp(('Char.Vitals', {'hp': 2, 'mp': 1}),
+                 GmcpDelta({'hp': 2}, ['blind']))
+    prot.do_gmcp(('Char.Vitals', {'hp': 2}), GmcpDelta.replacing({'hp': 2}))
+    calls = protocol_calls(prot)
+    assert calls[1:] == [('do_gmcp_delta', ['Char.Vitals', {'hp': 2},
+                                            ['blind']]),
+                         ('do_gmcp', [('Char.Vitals', {'hp': 2})])], calls
+
+def test_partial_types_sent_as_the_message():
+    store = GmcpStore()
+    prot = ClientProtocol(None)
+    prot.send_to_client = Mock()
+    for payload in [{'name': 'Bob', 'level': '1'}, {'level': '2'}]:
+        delta = store.update_message('Char.Status', payload)
+        prot.do_gmcp(('Char.Status', payload), delta)
+    assert protocol_calls(prot)[1] == ('do_gmcp', [('Char.Status',
+                                                    {'level': '2'})])
+
+def test_reloaded_processor_gets_whole_values():
+    connector = Mock()
+    connector.gmcp = GmcpStore()
+    prot = ClientProtocol(connector)
+    prot.send_to_client = Mock()
+    def receive(message):
+        gmcp_type, payload = parse_frame(message)
+        delta = connector.gmcp.update_message(gmcp_type, payload)
+        prot.do_gmcp((gmcp_type, payload), delta)
+    receive('Char.Vitals {"hp": "10", "mp": "10"}')
+    receive('Char.Vitals {"hp": "9", "mp": "10"}')
+    #the reload: a new processor, with nothing in its store.
+    prot = ClientProtocol(connector)
+    prot.send_to_client = Mock()
+    receive('Char.Vitals {"hp": "8", "mp": "10"}')
+    receive('Char.Vitals {"hp": "8", "mp": "9"}')
+    assert protocol_calls(prot) == \
+           [('do_gmcp', [('Char.Vitals', {'hp': '8', 'mp': '10'})]),
+            ('do_gmcp_delta', ['Char.Vitals', {'mp': '9'}, []])], \
+           protocol_calls(prot)
@@ -0,0 +1,69 @@
+from pymudclient.net.line_endings import LineEndingFixer
+from mock import Mock
+
+class Test_auto_detection:
+
+    def setUp(self):
+        self.fixer = LineEndingFixer()
+
+    def test_normal_CR_LF_is_left_alone(self):
+        data = "foo\r\nbar\r\n"
+        assert self.fixer.feed(data) is data
+        assert self.fixer.enabled is None
+
+    def test_repeated_CR_LF_is_left_alone(self):
+        assert self.fixer.feed("foo\r\n\r\n") == "foo\r\n\r\n"
+        assert self.fixer.enabled is None
+
+    def test_blank_lines_stay_on_the_fast_path(self):
+        self.fixer._skip = Mock(wraps = self.fixer._skip)
+        for data in ["foo\r\n\r\nbar\r\n", "\r\n\r\n", "baz\r"]:
+            assert self.fixer.feed(data) is data
+        assert self.fixer._skip.call_count == 3
+        assert self.fixer.feed("\n\r\nquux") == "\n\r\nquux"
+        assert self.fixer.enabled is None
+
+    def test_LF_CR_is_fixed_and_turns_fixing_on(self):
+        assert self.fixer.feed("foo\n\rbar") == "foo\nbar"
+        assert self.fixer.enabled is True
+
+    def test_LF_CR_at_start(self):
+        assert self.fixer.feed("\n\r") == "\n"
+
+    def test_consecutive_LF_CRs(self):
+        assert self.fixer.feed("foo\n\r\n\rbar\n\r") == "foo\n\nbar\n"
+
+    def test_LF_CR_in_the_middle_of_a_chunk(self):
+        res = self.fixer.feed("foo\r\nbar\r\nbaz\n\rquux")
+        assert res == "foo\r\nbar\r\nbaz\nquux", repr(res)
+
+    def test_LF_CR_split_across_chunks(self):
+        assert self.fixer.feed("foo\n") == "foo\n"
+        assert self.fixer.feed("\rbar") == "bar"
+        assert self.fixer.enabled is True
+
+    def test_CR_LF_split_across_chunks(self):
+        assert self.fixer.feed("foo\r") == "foo\r"
+        assert self.fixer.feed("\nbar\r") == "\nbar\r"
+        assert self.fixer.feed("\n") == "\n"
+        assert self.fixer.enabled is None
+
+    def test_lone_LF_then_CR_in_next_chunk(self):
+        self.fixer.feed("foo\r\n")
+        self.fixer.feed("\n")
+        assert self.fixer.feed("\r") == ""
+
+    def test_keeps_fixing_once_on(self):
+        self.fixer.feed("foo\n\r")
+        assert self.fixer.feed("bar\n") == "bar\n"
+        assert self.fixer.feed("\rbaz") == "baz"
+
+def test_disabled_passes_everything_through():
+    fixer = LineEndingFixer(enabled = False)
+    assert fixer.feed("foo\n\rbar") == "foo\n\rbar"
+    assert fixer.enabled is False
+
+def test_enabled_fixes_split_pairs():
+    fixer = LineEndingFixer(enabled = True)
+    assert fixer.feed("foo\n") == "foo\n"
+    assert fixer.feed("\r\n\r") == "\n"
@@ -1,5 +1,7 @@
-from pymudclient.net.mccp import MCCPTransport
+from pymudclient.net.mccp import MCCPTransport, MAX_DECOMPRESSED
 from twisted.internet.protocol import Protocol
+from twisted.internet.task import Clock
+from mock import Mock
 from twisted.conch.telnet import IAC, SE
 from zlib import compress, Z_FINISH
 
@@ -117,3 +119,104 @@ class TestMCCPTransport:
         self.t.dataReceived("foo" + IAC)
         self.t.connectionLost(None)
         assert self.p.data_received == 'foo' + IAC
+
+class MockProtocolRecordingCalls(Protocol):
+
+    def __init__(self):
+        self.calls = []
+
+    def dataReceived(self, data):
+        self.calls.append(data)
+
+class TestMCCPTransportSplitting:
+
+    def setUp(self):
+        self.t = MCCPTransport(MockProtocolRecordingCalls())
+        self.t.connectionMade()
+        self.p = self.t.protocol
+
+    def test_splits_after_each_IAC_SE(self):
+        self.t.dataReceived('foo' + IAC + SE + 'bar' + IAC + SE + 'baz')
+        assert self.p.calls == ['foo' + IAC + SE, 'bar' + IAC + SE, 'baz'], \
+               self.p.calls
+
+    def test_unsplit_data_is_passed_on_as_is(self):
+        data = 'foo\r\nbar\r\n'
+        self.t.dataReceived(data)
+        assert self.p.calls[0] is data
+
+    def test_chopped_IAC_is_held_back(self):
+        self.t.dataReceived('foo' + IAC)
+        assert self.t.later == IAC
+        self.t.dataReceived(SE)
+        assert self.p.calls == ['foo', IAC + SE], self.p.calls
+        assert self.t.later == ''
+
+    def test_compressed_data_after_IAC_SE_in_the_same_chunk(self):
+        self.t.dataReceived('foo' + IAC + SE)
+        self.t.their_mccp_active = True
+        self.t.dataReceived(compress('bar', Z_FINISH) + 'baz' + IAC + SE)
+        assert self.p.calls == ['foo' + IAC + SE, 'bar', 'baz' + IAC + SE], \
+               self.p.calls
+
+class TestMCCPTransportBursts:
+
+    def setUp(self):
+        self.clock = Clock()
+        self.t = MCCPTransport(MockProtocolRecordingCalls(), self.clock)
+        self.t.transport = Mock(spec = ['pauseProducing', 'resumeProducing'])
+        self.t.connectionMade()
+        self.p = self.t.protocol
+        self.t.their_mccp_active = True
+        self.text = 'x' * (MAX_DECOMPRESSED * 3 + 10)
+
+    def run_reactor(self):
+        while self.clock.getDelayedCalls():
+            self.clock.advance(0)
+
+    def test_big_burst_is_passed_on_in_pieces(self):
+        self.t.dataReceived(compress(self.text))
+        assert self.p.calls == [self.text[:MAX_DECOMPRESSED]]
+        self.run_reactor()
+        assert ''.join(self.p.calls) == self.text
+        assert max(len(call) for call in self.p.calls) <= MAX_DECOMPRESSED
+
+    def test_transport_is_paused_until_caught_up(self):
+        self.t.dataReceived(compress(self.text))
+        assert self.t.transport.pauseProducing.called
+        assert not self.t.transport.resumeProducing.called
+        self.run_reactor()
+        assert self.t.transport.resumeProducing.called
+
+    def test_small_data_does_not_pause(self):
+        self.t.dataReceived(compress('foo'))
+        assert self.p.calls == ['foo']
+        assert not self.clock.getDelayedCalls()
+        assert not self.t.transport.pauseProducing.called
+
+    def test_data_received_while_waiting_comes_after(self):
+        s = compress(self.text, Z_FINISH)
+        self.t.dataReceived(s)
+        self.t.dataReceived('bar')
+        self.run_reactor()
+        assert ''.join(self.p.calls) == self.text + 'bar'
+        assert not self.t.their_mccp_active
+
+    def test_connection_lost_passes_everything_on(self):
+        self.t.dataReceived(compress(self.text))
+        self.t.connectionLost(None)
+        assert ''.join(self.p.calls) == self.text
+        assert not self.clock.getDelayedCalls()
+        assert not self.t.transport.resumeProducing.called
+
+    def test_counters(self):
+        s = compress(self.text)
+        self.t.dataReceived(s)
+        self.run_reactor()
+        assert self.t.compressed_bytes == len(s), self.t.compressed_bytes
+        assert self.t.decompressed_bytes == len(self.text)
+        assert self.t.compression_ratio == float(len(self.text)) / len(s)
+        assert self.t.decompression_time >= 0
+
+    def test_no_compression_ratio_before_any_compression(self):
+        assert MCCPTransport(MockProtocol()).compression_ratio == 0
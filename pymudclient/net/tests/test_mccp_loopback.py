@@ -0,0 +1,127 @@
+"""Checks MCCP v3 end to end, against a pretend MUD over a fake connection."""
+from pymudclient.net.mccp import MCCPTransport, COMPRESS3
+from pymudclient.net.telnet import TelnetClient, TelnetClientFactory
+from twisted.conch.telnet import IAC, SB, SE, WILL, WONT, DO, DONT
+from twisted.internet.protocol import Protocol
+from twisted.internet.task import Clock
+from twisted.test import iosim
+from mock import Mock
+import zlib
+
+START = IAC + SB + COMPRESS3 + IAC + SE
+
+class FakeMUD(Protocol):
+    """Just enough of a MUD to offer MCCP v3 and read what comes back."""
+
+    def __init__(self, offer = WILL):
+        self.offer = offer
+        self.raw = ''
+
+    def connectionMade(self):
+        self.transport.write(IAC + self.offer + COMPRESS3)
+
+    def dataReceived(self, data):
+        self.raw += data
+
+    @property
+    def before(self):
+        """What was sent before the client started compressing."""
+        return self.raw.partition(START)[0]
+
+    @property
+    def compressed(self):
+        """What was sent after the client started compressing."""
+        return self.raw.partition(START)[2]
+
+    def decompressed(self):
+        return zlib.decompressobj().decompress(self.compressed)
+
+class FakeMod(object):
+    encoding = 'ascii'
+
+class TestLoopback:
+
+    def connect(self, mud):
+        self.mud = mud
+        realm = Mock()
+        realm.mod = self.mod
+        self.telnet = TelnetClient(TelnetClientFactory(realm))
+        self.clock = Clock()
+        self.mccp = MCCPTransport(self.telnet, self.clock)
+        self.pump = iosim.connect(mud, iosim.makeFakeServer(mud),
+                                  self.mccp, iosim.makeFakeClient(self.mccp))
+
+    def run(self):
+        self.clock.advance(0)
+        self.pump.flush()
+
+    def setUp(self):
+        self.mod = FakeMod()
+
+    def test_negotiation(self):
+        self.connect(FakeMUD())
+        assert self.mud.before == IAC + DO + COMPRESS3, repr(self.mud.raw)
+        assert START in self.mud.raw
+        assert self.mccp.our_mccp_active
+
+    def test_lines_are_sent_compressed(self):
+        self.connect(FakeMUD())
+        for command in ['look', 'score', 'look']:
+            self.telnet.sendLine(command)
+        self.run()
+        assert 'look' not in self.mud.compressed
+        res = self.mud.decompressed()
+        assert res == 'look\r\nscore\r\nlook\r\n', repr(res)
+
+    def test_lines_are_batched_until_the_reactor_turns(self):
+        self.connect(FakeMUD())
+        self.telnet.sendLine('look')
+        self.telnet.sendLine('score')
+        self.pump.flush()
+        assert self.mud.compressed == ''
+        self.run()
+        assert self.mud.decompressed() == 'look\r\nscore\r\n'
+
+    def test_several_batches(self):
+        self.connect(FakeMUD())
+        self.telnet.sendLine('look')
+        self.run()
+        self.telnet.sendLine('score')
+        self.run()
+        assert self.mud.decompressed() == 'look\r\nscore\r\n'
+
+    def test_closing_finishes_the_stream(self):
+        self.connect(FakeMUD())
+        self.telnet.sendLine('quit')
+        self.telnet.close()
+        self.pump.flush()
+        assert zlib.decompress(self.mud.compressed) == 'quit\r\n'
+
+    def test_refused_when_turned_off(self):
+        self.mod.use_mccp3 = False
+        self.connect(FakeMUD())
+        self.telnet.sendLine('look')
+        self.run()
+        assert self.mud.raw == IAC + DONT + COMPRESS3 + 'look\r\n', \
+               repr(self.mud.raw)
+        assert not self.mccp.our_mccp_active
+
+    def test_MUD_turning_it_off_finishes_the_stream(self):
+        self.connect(FakeMUD())
+        self.telnet.sendLine('look')
+        self.mud.transport.write(IAC + WONT + COMPRESS3)
+        self.pump.flush()
+        self.telnet.sendLine('score')
+        self.run()
+        assert not self.mccp.our_mccp_active
+        decompressor = zlib.decompressobj()
+        assert decompressor.decompress(self.mud.compressed) == 'look\r\n'
+        assert decompressor.unused_data == IAC + DONT + COMPRESS3 + \
+                                           'score\r\n', \
+               repr(decompressor.unused_data)
+
+    def test_not_offered(self):
+        self.connect(FakeMUD(offer = WONT))
+        self.telnet.sendLine('look')
+        self.run()
+        assert self.mud.raw == 'look\r\n', repr(self.mud.raw)
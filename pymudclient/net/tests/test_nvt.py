@@ -55,6 +55,22 @@ def test_FF_removal():
     s = 'foo\014bar'
     assert make_string_sane(s) == 'foobar'
 
+def test_no_control_characters_is_left_alone():
+    s = 'You see a rat.'
+    assert make_string_sane(s) is s
+
+def test_spinner():
+    s = 'Loading' + '|\010/\010-\010\\\010' * 1000 + 'done'
+    assert make_string_sane(s) == 'Loadingdone'
+
+def test_backspace_stops_at_newline():
+    s = 'foo\nba\010\010\010\010r'
+    assert make_string_sane(s) == 'foo\nr'
+
+def test_unicode():
+    s = u'caf\xe9\010e\011!'
+    assert make_string_sane(s) == u'cafe    !'
+
 from pymudclient.net.nvt import colour_pattern
 
 def test_colour_pattern_matching_single():
@@ -64,7 +80,8 @@ def test_colour_pattern_matching_multiple():
     assert colour_pattern.search('\x1b[37;41m')
 
 from pymudclient.net.nvt import ColourCodeParser 
-from pymudclient.colours import BLACK, CYAN, WHITE, fg_code, bg_code, YELLOW
+from pymudclient.colours import BLACK, CYAN, WHITE, fg_code, bg_code, YELLOW, \
+                               RED, BLUE, GREEN, HexFGCode, HexBGCode
 
 def test_ColourCodeParser_fg_change():
     ccp = ColourCodeParser()
@@ -205,3 +222,66 @@ def test_ColOurCodeParser_redundant_back_reset():
     inline = "foo\x1b[48m"
     ml = ccp.parseline(inline)
     assert ml.backs == {0: bg_code(BLACK)}
+
+from pymudclient.net.nvt import _sgr_transition, _sgr_table
+
+def test_sgr_transition_single_codes():
+    assert _sgr_transition('31') == (RED, None, None)
+    assert _sgr_transition('0') == (WHITE, BLACK, False)
+    assert _sgr_transition('5') == (None, None, None)
+
+def test_sgr_transition_last_change_wins():
+    assert _sgr_transition('1;31;0;44') == (WHITE, BLUE, False)
+    assert '1;31;0;44' in _sgr_table
+
+def test_ColourCodeParser_escapes_back_to_back_are_merged():
+    ccp = ColourCodeParser()
+    inline = 'foo\x1b[31m\x1b[1m\x1b[44mbar'
+    ml = ccp.parseline(inline)
+    assert ml.fores.items() == [(0, fg_code(WHITE, False)),
+                                (3, fg_code(RED, True))], ml.fores
+    assert ml.backs.items() == [(0, bg_code(BLACK)),
+                                (3, bg_code(BLUE))], ml.backs
+
+def test_ColourCodeParser_escapes_that_cancel_out_leave_no_change():
+    ccp = ColourCodeParser()
+    inline = 'foo\x1b[31m\x1b[37mbar'
+    ml = ccp.parseline(inline)
+    assert ml.fores.items() == [(0, fg_code(WHITE, False))], ml.fores
+
+def test_ColourCodeParser_colours_carry_over_to_next_line():
+    ccp = ColourCodeParser()
+    ccp.parseline('foo\x1b[1;32mbar')
+    ml = ccp.parseline('baz')
+    assert ml.fores.items() == [(0, fg_code(GREEN, True))], ml.fores
+
+def test_ColourCodeParser_xterm_256_colours():
+    ccp = ColourCodeParser()
+    inline = 'foo\x1b[38;5;196mbar\x1b[48;5;21mbaz'
+    ml = ccp.parseline(inline)
+    assert ml.fores.items() == [(0, fg_code(WHITE, False)),
+                                (3, fg_code(196, False))], ml.fores
+    assert ml.backs.items() == [(0, bg_code(BLACK)),
+                                (6, bg_code(21))], ml.backs
+
+def test_ColourCodeParser_truecolour():
+    ccp = ColourCodeParser()
+    inline = '\x1b[1;38;2;255;128;0mfoo\x1b[48;2;1;2;3mbar'
+    ml = ccp.parseline(inline)
+    assert ml.fores.items() == [(0, HexFGCode(255, 128, 0))], ml.fores
+    assert ml.backs.items() == [(0, bg_code(BLACK)),
+                                (3, HexBGCode(1, 2, 3))], ml.backs
+
+def test_ColourCodeParser_bad_extended_colours_are_ignored():
+    ccp = ColourCodeParser()
+    inline = 'foo\x1b[38;5;300;31mbar\x1b[38;2;1;2m'
+    ml = ccp.parseline(inline)
+    assert ml.fores.items() == [(0, fg_code(WHITE, False)),
+                                (3, fg_code(RED, False))], ml.fores
+
+def test_ColourCodeParser_38_alone_still_resets():
+    ccp = ColourCodeParser()
+    inline = '\x1b[31mfoo\x1b[38;1mbar'
+    ml = ccp.parseline(inline)
+    assert ml.fores.items() == [(0, fg_code(RED, False)),
+                                (3, fg_code(WHITE, True))], ml.fores
@@ -11,6 +11,13 @@ from pymudclient.colours import fg_code, WHITE, bg_code, BLACK
 from pymudclient.aliases import AliasMatchingRealm
 import traceback
 from pymudclient.tagged_ml_parser import taggedml
+from pymudclient.matcher_index import MatcherIndex
+from pymudclient.gmcp_events import GmcpEventIndex
+from pymudclient.net.gmcp import GmcpStore, GmcpDelta, RawPayload, \
+                                 payload_value
+from pymudclient.line_rules import LineRules
+from pymudclient.modules import MatcherGroups
+from pymudclient.profiling import MatcherProfiler, METRICS
 
 
 class MudProcessor(LineReceiver):
@@ -29,12 +36,18 @@ class MudProcessor(LineReceiver):
         self.settings_directory=''
         self.server_echo = True
         self.triggers = []
+        self.trigger_index = MatcherIndex(self.triggers)
         self.aliases = []
+        self.alias_index = MatcherIndex(self.aliases)
+        self.groups = MatcherGroups(self.trigger_index, self.alias_index)
+        self.line_rules = LineRules()
         self.gmcp_events = []
-        self.gmcp={}
+        self.gmcp_index = GmcpEventIndex(self.gmcp_events)
+        self.gmcp=GmcpStore()
         self.last_command_sent = ''
         self.root=self
         self.tracing = False
+        self.profiler = None
         self.active_channels = ['main']
         self.state={}
         self.event_handlers={}
@@ -142,11 +155,22 @@ class MudProcessor(LineReceiver):
             echo = bool(rest[2])
             self.parseSend(line, echo)
         elif meth == 'do_gmcp':
-            pair = rest[0]
-            gmcp_key,gmcp_data = pair
-            self.gmcp[gmcp_key]=gmcp_data
-            for gmcp_event in self.gmcp_events:
-                gmcp_event(pair, self)
+            gmcp_key,gmcp_data = rest[0]
+            self.gmcp.update_message(gmcp_key, gmcp_data)
+            self.gmcpReceived(gmcp_key, gmcp_data)
+        elif meth == 'do_gmcp_raw':
+            #a big payload, sent on as JSON text.
+            gmcp_key,text = rest
+            payload = RawPayload(text)
+            self.gmcp.update_message(gmcp_key, payload)
+            self.gmcpReceived(gmcp_key, payload)
+        elif meth == 'do_gmcp_delta':
+            #just the fields that have changed since the last one. These are
+            #only sent for whole snapshots, so the updated value is what the
+            #MUD sent.
+            gmcp_key,changed,removed = rest
+            self.gmcp.apply_delta(gmcp_key, GmcpDelta(changed, removed))
+            self.gmcpReceived(gmcp_key, self.gmcp.get(gmcp_key))
         else:
             raise ValueError("bad line: %s" % line)
         #self.transport.write(json.dumps(["ack", [meth,rest]]) + "\n")
@@ -154,6 +178,16 @@ class MudProcessor(LineReceiver):
     
     
     
+    def gmcpReceived(self, gmcp_key, payload):
+        """Run the GMCP events that want this message. As with RootRealm,
+        they get the message as the MUD sent it, not what's in self.gmcp.
+        """
+        handlers = self.gmcp_index.handlers(self.gmcp_events, gmcp_key)
+        if handlers:
+            pair = (gmcp_key, payload_value(payload))
+            for gmcp_event in handlers:
+                gmcp_event(pair, self)
+
     def load_module(self, cls, _sort = True):
         """Load the triggers, aliases, macros and other modules of the given
         module.
@@ -165,6 +199,9 @@ class MudProcessor(LineReceiver):
             self.triggers.sort(key = attrgetter("sequence"))
             self.gmcp_events.sort(key = attrgetter("sequence"))
             self.aliases.sort(key = attrgetter("sequence"))
+            self.trigger_index.rebuild(self.triggers)
+            self.alias_index.rebuild(self.aliases)
+            self.gmcp_index.rebuild(self.gmcp_events)
         return robmod
     
     def registerEventHandler(self, eventName, eventHandler):
@@ -193,10 +230,10 @@ class MudProcessor(LineReceiver):
         self.send_to_client('set_state', [name,value])
         
     def metalineReceived(self, metaline, display_line):
-        realm = TriggerMatchingRealm(metaline, parent = self, root = self,
-                                     display_line = display_line)
         try:
-            realm.process()
+            TriggerMatchingRealm.match_line(metaline, parent = self,
+                                            root = self,
+                                            display_line = display_line)
         except:
             self.handle_exception(traceback.format_exc())
     
@@ -268,7 +305,26 @@ class MudProcessor(LineReceiver):
         """
         if self.tracing:
             self.write("TRACE: " + thunk())
-            
+
+    def profile_on(self):
+        """Start keeping count of how long each trigger and alias takes."""
+        if self.profiler is None:
+            self.profiler = MatcherProfiler()
+
+    def profile_off(self):
+        """Stop profiling, throwing away what's been counted so far."""
+        self.profiler = None
+
+    def profile_report(self, count = 10, metric = None):
+        """Write the worst count matchers by each metric (or just the one
+        given) to the client.
+        """
+        if self.profiler is None:
+            self.write("Profiling is off.")
+            return
+        metrics = METRICS if metric is None else [metric]
+        for line in self.profiler.report(count, metrics):
+            self.write(line)
             
 class TimerRealm(object):
 
@@ -0,0 +1,75 @@
+"""Per-trigger and per-alias profiling, to find out which matchers are eating
+all the time.
+
+Profiling is off until a MatcherProfiler is hung off the root realm's
+.profiler attribute; until then, the matching code only pays for checking
+that it's None.
+"""
+from timeit import default_timer as clock
+
+METRICS = ('attempts', 'hits', 'match_time', 'callback_time')
+
+class MatcherProfiler(object):
+    """Keeps running totals of how often each matcher was tried, how often
+    it matched, and how long its regex and its callback took.
+    """
+
+    def __init__(self):
+        self._stats = {}
+
+    def _stats_for(self, matcher):
+        """Return the list of totals for a matcher, creating it if needed.
+
+        The list is [matcher, attempts, hits, match_time, callback_time].
+        """
+        #matchers compare equal if their sequences are equal, so key by
+        #identity instead.
+        key = id(matcher)
+        if key not in self._stats:
+            self._stats[key] = [matcher, 0, 0, 0.0, 0.0]
+        return self._stats[key]
+
+    def record_match(self, matcher, elapsed, hits):
+        """A matcher's been tried against a line."""
+        stats = self._stats_for(matcher)
+        stats[1] += 1
+        stats[2] += hits
+        stats[3] += elapsed
+
+    def record_callback(self, matcher, elapsed):
+        """A matcher's callback has been run."""
+        self._stats_for(matcher)[4] += elapsed
+
+    def reset(self):
+        """Forget everything we've counted."""
+        self._stats.clear()
+
+    def top(self, metric, count = 10):
+        """Return the worst count matchers by the given metric, as a list of
+        (matcher, attempts, hits, match_time, callback_time).
+        """
+        if metric not in METRICS:
+            raise ValueError("Unknown metric %r." % metric)
+        ind = METRICS.index(metric) + 1
+        ordered = sorted(self._stats.itervalues(), key = lambda s: s[ind],
+                         reverse = True)
+        return [tuple(stats) for stats in ordered[:count]]
+
+    def report(self, count = 10, metrics = METRICS):
+        """Return a list of lines, listing the top count offenders for each
+        of the metrics given.
+        """
+        if not self._stats:
+            return ["No matchers have been profiled yet."]
+        lines = []
+        for metric in metrics:
+            lines.append("Top %d by %s:" % (count, metric.replace('_', ' ')))
+            lines.append("  %8s %8s %12s %12s  %s" % ('attempts', 'hits',
+                                                     'match ms', 'callback ms',
+                                                     'matcher'))
+            for matcher, attempts, hits, match_time, callback_time \
+                                            in self.top(metric, count):
+                lines.append("  %8d %8d %12.3f %12.3f  %s" %
+                             (attempts, hits, match_time * 1000,
+                              callback_time * 1000, matcher))
+        return lines
@@ -5,10 +5,15 @@ from pymudclient.colours import fg_code, bg_code, BLACK, WHITE, HexFGCode
 from pymudclient.metaline import Metaline, simpleml
 from pymudclient.triggers import TriggerMatchingRealm, TriggerBlockMatchingRealm
 from pymudclient.aliases import AliasMatchingRealm
-from pymudclient.modules import load_file
+from pymudclient.modules import load_file, MatcherGroups
+from pymudclient.matcher_index import MatcherIndex
+from pymudclient.gmcp_events import GmcpEventIndex
+from pymudclient.net.gmcp import GmcpStore, payload_value
+from pymudclient.line_rules import LineRules
+from pymudclient.profiling import MatcherProfiler, METRICS
 from pymudclient.gui.bindings import gui_macros
 from pymudclient.tagged_ml_parser import taggedml
-from textwrap import TextWrapper
+from pymudclient.wrapping import LineWrapper
 from operator import attrgetter
 import traceback
 import time
@@ -27,25 +32,30 @@ class RootRealm(object):
         self.root=self
         self.telnet = None
         self.triggers = []
+        self.trigger_index = MatcherIndex(self.triggers)
         self.aliases = []
+        self.alias_index = MatcherIndex(self.aliases)
+        self.groups = MatcherGroups(self.trigger_index, self.alias_index)
+        self.line_rules = LineRules()
         self.baked_in_macros = gui_macros.copy()
         self.macros = self.baked_in_macros.copy()
         self.modules_loaded = set()
         self._escape_parser = EscapeParser()
         self.tracing = False
+        self.profiler = None
         self.server_echo = False
         self.console_ns = {'realm': self}
         self.console = InteractiveConsole(self.console_ns)
         self._last_line_end = None
-        self.wrapper = TextWrapper(width = 100, 
-                                   drop_whitespace = False)
+        self.wrapper = LineWrapper(width = 100)
 
         self.protocols = []
         self._closing_down = False
         self.gmcp_handler = None
         self.gmcp_events=[]
+        self.gmcp_index = GmcpEventIndex(self.gmcp_events)
         self.block_handlers=[]
-        self.gmcp={}
+        self.gmcp=GmcpStore()
         self.state={}
         self.module_settings_dir=''
         
@@ -88,9 +98,15 @@ class RootRealm(object):
         """Restore our state to a pristine (ie, blank) condition.
         """
         #keep in place so references to these still work
+        self.groups.clear()
+        self.line_rules.clear()
         self.triggers[:] = []
+        self.trigger_index.rebuild(self.triggers)
         self.aliases[:] = []
+        self.alias_index.rebuild(self.aliases)
         self.gmcp_events[:]=[]
+        self.gmcp_index.rebuild(self.gmcp_events)
+        self.gmcp.unsubscribe_all()
         self.macros.clear()
         self.macros.update(self.baked_in_macros)
         self.modules_loaded = set()
@@ -119,6 +135,9 @@ class RootRealm(object):
                 self.triggers.sort(key = attrgetter("sequence"))
                 self.aliases.sort(key = attrgetter("sequence"))
                 self.gmcp_events.sort(key = attrgetter("sequence"))
+                self.trigger_index.rebuild(self.triggers)
+                self.alias_index.rebuild(self.aliases)
+                self.gmcp_index.rebuild(self.gmcp_events)
         except:
             self.modules_loaded.remove(cls)
             raise
@@ -182,6 +201,26 @@ class RootRealm(object):
             self.trace("Tracing disabled!")
             self.tracing = False
 
+    def profile_on(self):
+        """Start keeping count of how long each trigger and alias takes."""
+        if self.profiler is None:
+            self.profiler = MatcherProfiler()
+
+    def profile_off(self):
+        """Stop profiling, throwing away what's been counted so far."""
+        self.profiler = None
+
+    def profile_report(self, count = 10, metric = None):
+        """Write the worst count matchers by each metric (or just the one
+        given) to the screen.
+        """
+        if self.profiler is None:
+            self.write("Profiling is off.")
+            return
+        metrics = METRICS if metric is None else [metric]
+        for line in self.profiler.report(count, metrics):
+            self.write(line)
+
     def maybe_do_macro(self, chord):
         """Try and run a macro against the given keychord.
 
@@ -202,15 +241,25 @@ class RootRealm(object):
 
     #Going towards the screen
 
-    def gmcpReceived(self, gmcp_pair):
-        """Take GMCP data and do something with it"""
-        for gmcp_event in self.gmcp_events:
+    def gmcpReceived(self, gmcp_pair, delta = None):
+        """Take GMCP data and do something with it.
+
+        The GMCP events get the message as the MUD sent it. For the types
+        in PARTIAL_TYPES, that's only the fields that changed; the merged
+        whole is in self.gmcp.
+        """
+        gmcp_type, payload = gmcp_pair
+        handlers = self.gmcp_index.handlers(self.gmcp_events, gmcp_type)
+        if not handlers:
+            #nobody wants it, so don't bother decoding it.
+            return
+        gmcp_pair = (gmcp_type, payload_value(payload))
+        for gmcp_event in handlers:
             gmcp_event(gmcp_pair, self)
 
     def blockReceived(self, block):
         if len(block) > 0:
-            realm = TriggerBlockMatchingRealm(block, parent = self, root = self,    
-                                          send_line_to_mud = self.telnet.sendLine)
+            realm = TriggerBlockMatchingRealm(block, parent = self, root = self)
             realm.process()
      
     def setActiveChannels(self, channels):
@@ -219,9 +268,7 @@ class RootRealm(object):
     def metalineReceived(self, metaline):
         """Match a line against the triggers and perhaps display it on screen.
         """
-        realm = TriggerMatchingRealm(metaline, parent = self,  root = self,
-                                     send_line_to_mud = self.telnet.sendLine)
-        realm.process()
+        TriggerMatchingRealm.match_line(metaline, parent = self, root = self)
 
     def cwrite(self, line, soft_line_start=False):
         ml=taggedml(line)
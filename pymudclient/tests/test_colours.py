@@ -1,4 +1,8 @@
-from pymudclient.colours import HexFGCode, HexBGCode
+from pymudclient.colours import HexFGCode, HexBGCode, colour_by_id, \
+                               xterm_colours, fg_code, bg_code, RED, \
+                               nearest_xterm
+from pymudclient import colours
+import pickle
 
 def test_different_HexFGCodes_hash_differently():
     assert hash(HexFGCode(3, 5, 7)) != hash(HexFGCode(59, 1, 42))
@@ -18,3 +22,50 @@ def test_HexFGCode_ground_is_fore():
 def test_as_hex():
     c = HexFGCode(10, 26, 255)
     assert c.as_hex.lower() == "0a1aff", c.as_hex
+
+def test_colours_are_interned():
+    assert HexFGCode(1, 2, 3) is HexFGCode(1, 2, 3)
+    assert HexFGCode(1, 2, 3) is not HexBGCode(1, 2, 3)
+
+def test_colour_by_id():
+    c = HexBGCode(4, 5, 6)
+    assert colour_by_id(c.id) is c
+    assert HexFGCode(4, 5, 6).id != c.id
+
+def test_unpickled_colours_are_interned():
+    c = HexFGCode(7, 8, 9)
+    for protocol in range(3):
+        assert pickle.loads(pickle.dumps(c, protocol)) is c
+
+def test_colours_have_no_dict():
+    assert not hasattr(HexFGCode(0, 0, 0), '__dict__')
+
+def test_xterm_palette():
+    assert len(xterm_colours) == 256
+    assert fg_code(1, False) is fg_code(RED, False)
+    assert fg_code(9, False) is fg_code(RED, True)
+    assert fg_code(196, False).triple == (0xFF, 0, 0)
+    assert bg_code(232).triple == (8, 8, 8)
+
+def test_truecolour_codes():
+    assert fg_code((1, 2, 3), True) is HexFGCode(1, 2, 3)
+    assert bg_code((1, 2, 3)) is HexBGCode(1, 2, 3)
+
+def test_nearest_xterm():
+    assert nearest_xterm(250, 10, 10) == (0xFF, 0, 0)
+    assert nearest_xterm(100, 101, 99) == (98, 98, 98)
+
+class Test_colour_cap:
+
+    def setUp(self):
+        self.max_colours = colours.MAX_COLOURS
+        colours.MAX_COLOURS = len(colours._registry)
+
+    def tearDown(self):
+        colours.MAX_COLOURS = self.max_colours
+
+    def test_new_colours_are_approximated_when_full(self):
+        assert HexFGCode(250, 11, 12) is HexFGCode(0xFF, 0, 0)
+
+    def test_existing_colours_are_still_found(self):
+        assert fg_code(RED, False).triple == (0x80, 0, 0)
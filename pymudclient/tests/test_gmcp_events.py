@@ -0,0 +1,107 @@
+from pymudclient.gmcp_events import GmcpEvent, GmcpEventIndex, tag_matches, \
+                                    binding_gmcp_event
+from pymudclient.realms import RootRealm
+from mock import Mock
+
+def test_tag_matches_exact():
+    assert tag_matches('Char.Vitals', 'Char.Vitals')
+    assert not tag_matches('Char.Vitals', 'Char.Vitals2')
+
+def test_tag_matches_wildcard():
+    assert tag_matches('Char.*', 'Char.Vitals')
+    assert tag_matches('Char.*', 'Char.Items.List')
+    assert not tag_matches('Char.*', 'Charm.Vitals')
+    assert not tag_matches('Char.*', 'Char')
+    assert tag_matches('*', 'Room.Info')
+
+def test_tag_matches_inactive():
+    assert not tag_matches(None, 'Char.Vitals')
+
+class Test_GmcpEventIndex:
+
+    def setUp(self):
+        self.vitals = GmcpEvent('Char.Vitals')
+        self.char = GmcpEvent('Char.*')
+        self.items = GmcpEvent('Char.Items.*')
+        self.everything = GmcpEvent('*')
+        self.room = GmcpEvent('Room.Info')
+        self.inactive = GmcpEvent()
+        self.events = [self.everything, self.vitals, self.room, self.char,
+                       self.inactive, self.items]
+        self.index = GmcpEventIndex(self.events)
+
+    def handlers(self, gmcp_type):
+        return list(self.index.handlers(self.events, gmcp_type))
+
+    def test_exact_and_wildcards_in_order(self):
+        assert self.handlers('Char.Vitals') == [self.everything, self.vitals,
+                                                self.char]
+
+    def test_nested_packages(self):
+        assert self.handlers('Char.Items.List') == [self.everything,
+                                                    self.char, self.items]
+
+    def test_other_packages_left_out(self):
+        assert self.handlers('Room.Info') == [self.everything, self.room]
+        assert self.handlers('Comm.Channel.Text') == [self.everything]
+
+    def test_package_name_alone_is_not_in_the_package(self):
+        assert self.handlers('Char') == [self.everything]
+
+    def test_other_prefixes(self):
+        self.events.append(GmcpEvent('Room.I*'))
+        assert self.handlers('Room.Info') == [self.everything, self.room,
+                                              self.events[-1]]
+        assert self.handlers('Room.Players') == [self.everything]
+
+    def test_results_are_remembered(self):
+        res = self.index.handlers(self.events, 'Char.Vitals')
+        assert self.index.handlers(self.events, 'Char.Vitals') is res
+
+    def test_added_events_are_picked_up(self):
+        self.index.handlers(self.events, 'Room.Info')
+        new = GmcpEvent('Room.Info')
+        self.events.append(new)
+        assert self.handlers('Room.Info') == [self.everything, self.room, new]
+
+    def test_new_list_is_picked_up(self):
+        self.events = [self.room]
+        assert self.handlers('Room.Info') == [self.room]
+        assert self.handlers('Char.Vitals') == []
+
+class WithGmcpEvents(object):
+
+    def __init__(self, realm):
+        realm.gmcp_events.extend([self.all_char, self.vitals])
+
+    modules = []
+
+    @binding_gmcp_event('Char.Vitals', sequence = 2)
+    def vitals(self, gmcp_data, realm):
+        realm.seen.append(('vitals', gmcp_data))
+
+    @binding_gmcp_event('Char.*', sequence = 1)
+    def all_char(self, gmcp_data, realm):
+        realm.seen.append(('char', gmcp_data))
+
+class Test_dispatch:
+
+    def setUp(self):
+        self.realm = RootRealm(None)
+        self.realm.seen = []
+        self.realm.load_module(WithGmcpEvents)
+
+    def test_handlers_called_in_sequence_order(self):
+        self.realm.gmcpReceived(('Char.Vitals', {'hp': 1}))
+        assert self.realm.seen == [('char', {'hp': 1}),
+                                   ('vitals', {'hp': 1})], self.realm.seen
+
+    def test_only_wanted_handlers_called(self):
+        self.realm.gmcpReceived(('Char.Name', 'Bob'))
+        self.realm.gmcpReceived(('Room.Info', {}))
+        assert self.realm.seen == [('char', 'Bob')], self.realm.seen
+
+    def test_cleared_modules_are_forgotten(self):
+        self.realm.clear_modules()
+        self.realm.gmcpReceived(('Char.Vitals', {}))
+        assert self.realm.seen == []
@@ -0,0 +1,127 @@
+from pymudclient.line_rules import Gag, Highlight, Substitute, LineRules, \
+                                   _fast_test
+from pymudclient.metaline import simpleml, RunLengthList
+from pymudclient.colours import fg_code, bg_code, WHITE, BLACK, RED, GREEN
+from pymudclient.triggers import TriggerMatchingRealm
+from pymudclient.matcher_index import MatcherIndex
+import re
+
+def test_catch_all_is_a_predicate():
+    test = _fast_test(re.compile('^.*$'))
+    assert test is not None
+    assert test('anything')
+    assert test('')
+
+def test_empty_line_gag_is_not_a_catch_all():
+    assert _fast_test(re.compile('^$'))('')
+    assert not _fast_test(re.compile('^$'))('foo')
+
+def test_literal_predicates():
+    assert _fast_test(re.compile('^foo$'))('foo')
+    assert not _fast_test(re.compile('^foo$'))('foo bar')
+    assert _fast_test(re.compile('^foo'))('foo bar')
+    assert _fast_test(re.compile('bar$'))('foo bar')
+    assert _fast_test(re.compile(r'o\.b'))('foo.bar')
+    assert not _fast_test(re.compile(r'o\.b'))('fooxbar')
+
+def test_no_predicate_for_real_regexes():
+    assert _fast_test(re.compile(r'^\d+$')) is None
+    assert _fast_test(re.compile('foo', re.IGNORECASE)) is None
+
+def test_gag_with_trailing_newline_follows_regex():
+    assert Gag('^foo$').test('foo\n')
+
+class Test_LineRules:
+
+    def setUp(self):
+        self.rules = LineRules()
+
+    def test_empty_rules_are_false(self):
+        assert not self.rules
+        self.rules.extend([Gag('^$')])
+        assert self.rules
+
+    def test_gags(self):
+        self.rules.extend([Gag('^$'), Gag(r'^\d+ gold$'),
+                           Gag(r'^You see (\w+)\.$')])
+        assert self.rules.apply(simpleml('', None, None)) is None
+        assert self.rules.apply(simpleml('12 gold', None, None)) is None
+        assert self.rules.apply(simpleml('You see Bob.', None, None)) is None
+        ml = simpleml('You see Bob and Jim.', None, None)
+        assert self.rules.apply(ml) is ml
+
+    def test_slow_gags_are_combined(self):
+        self.rules.extend([Gag(r'^\d+ gold$'), Gag(r'^You see (\w+)\.$')])
+        assert len(self.rules._slow_gags) == 1
+
+    def test_untouched_lines_arent_copied(self):
+        self.rules.extend([Highlight('spam', fore = fg_code(RED, False))])
+        ml = simpleml('eggs', fg_code(WHITE, False), bg_code(BLACK))
+        assert self.rules.apply(ml) is ml
+
+    def test_highlight(self):
+        self.rules.extend([Highlight(r'(\w+) tells you', fg_code(RED, True),
+                                     bg_code(GREEN), group = 1)])
+        ml = simpleml('Bob tells you, "hi"', fg_code(WHITE, False),
+                      bg_code(BLACK))
+        res = self.rules.apply(ml)
+        assert res.fores == RunLengthList([(0, fg_code(RED, True)),
+                                           (3, fg_code(WHITE, False))])
+        assert res.backs == RunLengthList([(0, bg_code(GREEN)),
+                                           (3, bg_code(BLACK))])
+        assert ml.fores == RunLengthList([(0, fg_code(WHITE, False))])
+
+    def test_substitute(self):
+        self.rules.extend([Substitute(r'(\w+) tells you', r'\1 says')])
+        ml = simpleml('Bob tells you, "hi"', fg_code(WHITE, False),
+                      bg_code(BLACK))
+        assert self.rules.apply(ml).line == 'Bob says, "hi"'
+        assert ml.line == 'Bob tells you, "hi"'
+
+    def test_highlight_sees_substituted_text(self):
+        self.rules.extend([Highlight('says', fg_code(RED, False)),
+                           Substitute('tells you', 'says')])
+        ml = simpleml('Bob tells you', fg_code(WHITE, False), bg_code(BLACK))
+        res = self.rules.apply(ml)
+        assert res.line == 'Bob says'
+        assert res.fores == RunLengthList([(0, fg_code(WHITE, False)),
+                                           (4, fg_code(RED, False)),
+                                           (8, fg_code(WHITE, False))])
+
+    def test_clear(self):
+        self.rules.extend([Gag('^$')])
+        self.rules.clear()
+        ml = simpleml('', None, None)
+        assert self.rules.apply(ml) is ml
+
+    def test_not_a_rule(self):
+        try:
+            self.rules.extend([object()])
+        except TypeError:
+            pass
+        else:
+            assert False
+
+class FakeRoot(object):
+
+    tracing = False
+    profiler = None
+
+    def __init__(self):
+        self.root = self
+        self.triggers = []
+        self.trigger_index = MatcherIndex(self.triggers)
+        self.line_rules = LineRules()
+        self.written = []
+
+    def write(self, line, soft_line_start = False):
+        self.written.append(line.line)
+
+def test_rules_are_applied_to_displayed_lines():
+    root = FakeRoot()
+    root.line_rules.extend([Gag('^$'), Substitute('spam', 'eggs')])
+    for line in ['', 'spam']:
+        TriggerMatchingRealm(simpleml(line, fg_code(WHITE, False),
+                                      bg_code(BLACK)),
+                             root, root, True).process()
+    assert root.written == ['eggs']
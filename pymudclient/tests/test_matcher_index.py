@@ -0,0 +1,237 @@
+from pymudclient import matcher_index
+from pymudclient.matcher_index import MatcherIndex, required_literal, \
+                                    AhoCorasick, _literal_cache, \
+                                    leading_literal, _leading_cache
+from pymudclient.triggers import RegexTrigger, non_binding_trigger
+from pymudclient.aliases import Alias
+from pymudclient.metaline import simpleml
+import re
+
+def test_required_literal_simple():
+    assert required_literal('^You may drink another healing elixir\.$') == \
+           'You may drink another healing elixir.'
+
+def test_required_literal_picks_longest_run():
+    assert required_literal(r'^H:\d+ M:\d+ Endurance') == ' Endurance'
+
+def test_required_literal_runs_through_groups():
+    assert required_literal(r'foo(bar)baz\d') == 'foobarbaz'
+
+def test_required_literal_repeated_at_least_once():
+    assert required_literal(r'\d+(spam)+\d') == 'spam'
+
+def test_required_literal_skips_optional_bits():
+    assert required_literal(r'\d(spam)?\d') is None
+
+def test_required_literal_skips_alternation():
+    assert required_literal(r'(?:foo|bar)') is None
+
+def test_required_literal_none_for_case_insensitive():
+    assert required_literal(re.compile('foo', re.IGNORECASE)) is None
+
+def test_required_literal_none_for_catch_all():
+    assert required_literal('^.*$') is None
+
+def test_leading_literal_simple():
+    assert leading_literal(r'^H:\d+ M:\d+') == 'H:'
+
+def test_leading_literal_through_groups():
+    assert leading_literal(r'^(You (see))\b') == 'You see'
+
+def test_leading_literal_none_if_not_anchored():
+    assert leading_literal(r'H:\d+') is None
+
+def test_leading_literal_none_if_multiline():
+    assert leading_literal(re.compile('^foo', re.MULTILINE)) is None
+
+def test_leading_literal_none_if_nothing_literal_at_the_start():
+    assert leading_literal(r'^\w+ tells you') is None
+
+def test_decorating_works_out_the_literal():
+    non_binding_trigger('^You see a fish\.$')(None)
+    assert _literal_cache[('^You see a fish\.$', 0)] == 'You see a fish.'
+
+def test_literal_cache_is_bounded():
+    for ind in range(matcher_index.MAX_CACHED + 1):
+        required_literal('^%d tells you' % ind)
+    assert len(_literal_cache) <= matcher_index.MAX_CACHED
+    assert required_literal('^foo tells you') == 'foo tells you'
+
+def test_leading_cache_is_bounded():
+    for ind in range(matcher_index.MAX_CACHED + 1):
+        leading_literal('^%d tells you' % ind)
+    assert len(_leading_cache) <= matcher_index.MAX_CACHED
+    assert leading_literal('^foo tells you') == 'foo tells you'
+
+def test_AhoCorasick_finds_overlapping_words():
+    ac = AhoCorasick({'he': [1], 'she': [2], 'hers': [3], 'his': [4]})
+    assert ac.search('ushers') == set([1, 2, 3])
+
+def test_AhoCorasick_finds_nothing():
+    ac = AhoCorasick({'foo': [1]})
+    assert ac.search('fofoxf') == set()
+
+def test_AhoCorasick_word_inside_another():
+    ac = AhoCorasick({'elixir': [1], 'lix': [2]})
+    assert ac.search('an elixir') == set([1, 2])
+
+class CustomTrigger(RegexTrigger):
+    def match(self, metaline):
+        return [metaline]
+
+class Test_MatcherIndex:
+
+    def setUp(self):
+        self.spam = RegexTrigger('spam', sequence = 1)
+        self.eggs = RegexTrigger(r'eggs \d+', sequence = 2)
+        self.anything = RegexTrigger('^.*$', sequence = 3)
+        self.off = RegexTrigger(None, sequence = 4)
+        self.custom = CustomTrigger('ham', sequence = 5)
+        self.triggers = [self.spam, self.eggs, self.anything, self.off,
+                         self.custom]
+        self.index = MatcherIndex(self.triggers)
+
+    def candidates(self, text):
+        return list(self.index.candidates(self.triggers, text))
+
+    def test_skips_matchers_whose_literal_is_absent(self):
+        assert self.candidates('nothing here') == [self.anything, self.custom]
+
+    def test_keeps_order(self):
+        assert self.candidates('eggs 1 spam') == [self.spam, self.eggs,
+                                                  self.anything, self.custom]
+
+    def test_literal_prefixes_are_found(self):
+        spa = RegexTrigger('spa', sequence = 0)
+        self.triggers.insert(0, spa)
+        assert self.candidates('spam')[:2] == [spa, self.spam]
+
+    def test_regex_change_is_noticed(self):
+        self.off.regex = re.compile('toast')
+        assert self.off in self.candidates('toast')
+
+    def test_regex_cleared_is_noticed(self):
+        self.spam.regex = None
+        assert self.spam not in self.candidates('spam')
+
+    def test_list_replaced(self):
+        other = [self.eggs]
+        assert list(self.index.candidates(other, 'spam eggs 2')) == \
+               [self.eggs]
+
+    def test_list_appended_to(self):
+        toast = RegexTrigger('toast')
+        self.triggers.append(toast)
+        assert self.candidates('toast')[-1] is toast
+
+    def test_change_mid_line_falls_back_to_trying_everything(self):
+        seen = []
+        for matcher in self.index.candidates(self.triggers, 'spam'):
+            seen.append(matcher)
+            if matcher is self.spam:
+                self.eggs.regex = re.compile('spam')
+        assert seen == self.triggers[:2] + [self.anything, self.off,
+                                            self.custom], seen
+
+    def test_same_results_as_trying_everything(self):
+        line = simpleml('spam and eggs 12', None, None)
+        expected = [m for m in self.triggers if list(m.match(line))]
+        got = [m for m in self.candidates(line.line) if list(m.match(line))]
+        assert got == expected
+
+class Test_anchored_dispatch:
+
+    def setUp(self):
+        self.prompt = RegexTrigger(r'^H:\d+ M:\d+', sequence = 1)
+        self.channel = RegexTrigger([r'^\([\w ]+\): ', r'^\[\w+\]: '],
+                                    sequence = 2)
+        self.target = RegexTrigger(None, sequence = 3)
+        self.triggers = [self.prompt, self.channel, self.target]
+        self.index = MatcherIndex(self.triggers)
+
+    def candidates(self, text):
+        return list(self.index.candidates(self.triggers, text))
+
+    def test_only_tries_triggers_with_the_right_prefix(self):
+        assert self.candidates('H:100 M:100') == [self.prompt]
+        assert self.candidates('(Market): Bob says hi') == [self.channel]
+        assert self.candidates('[Ring]: hi') == [self.channel]
+
+    def test_prefix_elsewhere_in_line_doesnt_count(self):
+        assert self.candidates('You see H:100 M:100') == []
+
+    def test_reassigning_regex_moves_trigger(self):
+        self.prompt.regex = re.compile(r'^(\d+)h, (\d+)m')
+        assert self.candidates('100h, 20m') == [self.prompt]
+        self.prompt.regex = re.compile(r'^HP:(\d+)')
+        assert self.candidates('H:100 M:100') == []
+        assert self.candidates('HP:100') == [self.prompt]
+
+    def test_reassigning_to_unanchored_regex(self):
+        self.target.regex = re.compile(r"\bRat\b")
+        assert self.candidates('You see a Rat.') == [self.target]
+        self.target.regex = None
+        assert self.candidates('You see a Rat.') == []
+
+    def test_reassigning_doesnt_rebuild(self):
+        automaton = self.index._automaton
+        self.target.regex = re.compile(r'^Foo')
+        assert self.index._automaton is automaton
+        assert self.candidates('Foo') == [self.target]
+
+def test_literal_trigger_reassigned_is_withdrawn_from_automaton():
+    spam = RegexTrigger('spam')
+    index = MatcherIndex([spam])
+    spam.regex = re.compile('^eggs')
+    assert list(index.candidates(index._source, 'spam')) == []
+    assert list(index.candidates(index._source, 'eggs')) == [spam]
+
+def test_aliases_are_indexed():
+    aliases = [Alias('^k (.*)$'), Alias('^drh$')]
+    index = MatcherIndex(aliases)
+    assert list(index.candidates(aliases, 'k rat')) == aliases[:1]
+
+class Test_disabling:
+
+    def setUp(self):
+        self.spam = RegexTrigger('spam', sequence = 1)
+        self.prompt = RegexTrigger(r'^H:\d+', sequence = 2)
+        self.anything = RegexTrigger('^.*$', sequence = 3)
+        self.triggers = [self.spam, self.prompt, self.anything]
+        self.index = MatcherIndex(self.triggers)
+
+    def candidates(self, text):
+        return list(self.index.candidates(self.triggers, text))
+
+    def test_disabled_matchers_are_skipped(self):
+        self.index.disable(self.triggers)
+        assert self.candidates('H:100 spam') == []
+
+    def test_enabling_brings_them_back(self):
+        self.index.disable(self.triggers)
+        automaton = self.index._automaton
+        self.index.enable(self.triggers)
+        assert self.index._automaton is automaton
+        assert self.candidates('H:100 spam') == self.triggers
+
+    def test_disabled_survives_rebuild(self):
+        self.index.disable([self.spam])
+        self.index.rebuild(self.triggers)
+        assert self.candidates('spam') == [self.anything]
+        self.index.enable([self.spam])
+        assert self.candidates('spam') == [self.spam, self.anything]
+
+    def test_regex_change_while_disabled(self):
+        self.index.disable([self.prompt])
+        self.prompt.regex = re.compile('^M:')
+        assert self.candidates('M:100') == [self.anything]
+        self.index.enable([self.prompt])
+        assert self.candidates('M:100') == [self.prompt, self.anything]
+
+    def test_disabling_mid_line(self):
+        seen = []
+        for matcher in self.index.candidates(self.triggers, 'H:100 spam'):
+            seen.append(matcher)
+            if matcher is self.spam:
+                self.index.disable([self.prompt])
+        assert seen == [self.spam, self.anything]
@@ -71,6 +71,9 @@ def test_Metaline_line_end_is_defaultly_hard():
     m = Metaline("foo", None, None)
     assert m.line_end == 'hard'
 
+def test_Metaline_has_no_dict():
+    assert not hasattr(Metaline("foo", None, None), '__dict__')
+
 def test_equality_simple():
     a = Metaline('foo', RunLengthList([(0, 'foo')]),
                  RunLengthList([(0, 'bar')]))
@@ -328,4 +331,61 @@ class TestTaggedML(unittest.TestCase):
         weapon_name='battleaxe'
         weapon_number='123'
         ml=taggedml('Weapon <red*>%s<white> set to <red*>%s'%(weapon_name,weapon_number))
-        print(ml.line)
\ No newline at end of file
+        print(ml.line)
+
+
+def test_RunLengthList_setitem_doesnt_normalise():
+    rll = RunLengthList({})
+    rll[3] = 'foo'
+    rll[0] = 'foo'
+    assert rll.items() == [(0, 'foo'), (3, 'foo')]
+    assert rll.get_at(4) == 'foo'
+    assert rll.get_at(-1) is None
+
+def test_RunLengthList_is_dict_like():
+    rll = RunLengthList([(0, 'foo'), (3, 'bar')])
+    assert len(rll) == 2
+    assert 3 in rll and 2 not in rll
+    assert rll[3] == 'bar'
+    assert list(rll) == [0, 3]
+    assert rll == {0: 'foo', 3: 'bar'}
+    del rll[3]
+    assert rll.items() == [(0, 'foo')]
+
+def test_RunLengthList_index_adjust_squashes_onto_start():
+    rll = RunLengthList([(0, 'a'), (2, 'b'), (3, 'c'), (4, 'a'), (9, 'd')])
+    rll.index_adjust(1, -4)
+    assert rll.items() == [(0, 'a'), (5, 'd')], rll.items()
+
+def test_RunLengthList_copy_shares_until_changed():
+    r = RunLengthList([(0, 'foo'), (3, 'bar')])
+    c = r.copy()
+    assert c._values is r._values
+    c.add_change(1, 'baz')
+    assert c._values is not r._values
+    assert r.items() == [(0, 'foo'), (3, 'bar')]
+    assert c.items() == [(0, 'foo'), (1, 'baz'), (3, 'bar')]
+
+def test_RunLengthList_original_changing_leaves_copy_alone():
+    r = RunLengthList([(0, 'foo'), (3, 'bar')])
+    c = r.copy()
+    r.index_adjust(1, 2)
+    assert c.items() == [(0, 'foo'), (3, 'bar')]
+
+def test_RunLengthList_normalises_everything_after_setitem():
+    r = RunLengthList([(0, 'foo'), (5, 'bar')])
+    r[2] = 'foo'
+    r.add_change(7, 'baz')
+    assert r.items() == [(0, 'foo'), (5, 'bar'), (7, 'baz')]
+
+from pymudclient.triggers import LineAlterer
+
+def test_colour_change_leaves_other_colours_shared():
+    ml = Metaline('foo bar', RunLengthList([(0, 'foo')]),
+                  RunLengthList([(0, 'bar')]))
+    alterer = LineAlterer()
+    alterer.change_fore(0, 3, 'baz')
+    res = alterer.apply(ml)
+    assert res.backs._values is ml.backs._values
+    assert ml.fores.items() == [(0, 'foo')]
+    assert res.fores.items() == [(0, 'baz'), (3, 'foo')]
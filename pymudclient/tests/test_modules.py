@@ -1,4 +1,8 @@
-from pymudclient.modules import load_file, EarlyInitialisingModule, BaseModule
+from pymudclient.modules import load_file, EarlyInitialisingModule, BaseModule, \
+                                MatcherGroups
+from pymudclient.matcher_index import MatcherIndex
+from pymudclient.triggers import RegexTrigger
+from pymudclient.aliases import Alias
 import sys
 from mock import patch, sentinel, Mock
 
@@ -77,3 +81,70 @@ class TestEarlyInitialisingModule(_ModuleTest):
         assert manager.aliases[0] is Module.alias
         assert len(manager.macros) == 1
         assert manager.macros['f'] is Module.macro
+
+class FakeManager(object):
+
+    def __init__(self):
+        self.triggers = []
+        self.aliases = []
+        self.macros = {}
+        self.gmcp_events = []
+        self.trigger_index = MatcherIndex(self.triggers)
+        self.alias_index = MatcherIndex(self.aliases)
+        self.groups = MatcherGroups(self.trigger_index, self.alias_index)
+
+class TestGroups:
+
+    def setUp(self):
+        self.fishing = RegexTrigger('You feel a tug on your line')
+        self.reel = Alias('^reel$')
+        self.combat = RegexTrigger('hits you')
+
+        class Module(BaseModule):
+            trigger_groups = {'fishing': [self.fishing],
+                              'combat': [self.combat]}
+            alias_groups = {'fishing': [self.reel]}
+            disabled_groups = ['fishing']
+
+        self.manager = FakeManager()
+        Module(self.manager)
+        self.groups = self.manager.groups
+
+    def triggers_for(self, text):
+        return list(self.manager.trigger_index.candidates(
+                                                self.manager.triggers, text))
+
+    def test_members_are_added(self):
+        assert self.fishing in self.manager.triggers
+        assert self.combat in self.manager.triggers
+        assert self.manager.aliases == [self.reel]
+
+    def test_disabled_groups_start_off(self):
+        assert not self.groups.is_enabled('fishing')
+        assert self.groups.is_enabled('combat')
+        assert self.triggers_for('You feel a tug on your line') == []
+        assert list(self.manager.alias_index.candidates(
+                                        self.manager.aliases, 'reel')) == []
+
+    def test_enable(self):
+        self.groups.enable('fishing')
+        assert self.triggers_for('You feel a tug on your line') == \
+               [self.fishing]
+
+    def test_disable(self):
+        self.groups.disable('combat')
+        assert self.triggers_for('A rat hits you') == []
+
+    def test_unknown_group(self):
+        try:
+            self.groups.enable('knitting')
+        except KeyError:
+            pass
+        else:
+            assert False
+
+    def test_clear_enables_everything(self):
+        self.groups.clear()
+        assert self.groups.names() == []
+        assert self.triggers_for('You feel a tug on your line') == \
+               [self.fishing]
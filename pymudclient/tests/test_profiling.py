@@ -0,0 +1,73 @@
+from pymudclient.profiling import MatcherProfiler
+from pymudclient.matchers import BaseMatchingRealm
+from pymudclient.triggers import RegexTrigger
+from pymudclient.metaline import Metaline
+
+class FakeRoot:
+    tracing = False
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.root = self
+
+def test_top_sorts_by_metric():
+    p = MatcherProfiler()
+    p.record_match('a', 0.5, 1)
+    p.record_match('b', 0.1, 3)
+    p.record_match('b', 0.1, 0)
+    assert [s[0] for s in p.top('hits')] == ['b', 'a']
+    assert [s[0] for s in p.top('match_time')] == ['a', 'b']
+    assert p.top('attempts', 1) == [('b', 2, 3, 0.2, 0.0)]
+
+def test_top_unknown_metric():
+    try:
+        MatcherProfiler().top('flavour')
+    except ValueError:
+        pass
+    else:
+        assert False
+
+def test_reset():
+    p = MatcherProfiler()
+    p.record_callback('a', 1.0)
+    p.reset()
+    assert p.top('callback_time') == []
+
+def test_report_mentions_matchers():
+    p = MatcherProfiler()
+    p.record_match('spam trigger', 0.002, 1)
+    lines = p.report(5, ['match_time'])
+    assert lines[0] == 'Top 5 by match time:'
+    assert lines[2].endswith('spam trigger')
+
+class Test_profiled_matching:
+
+    def setUp(self):
+        self.profiler = MatcherProfiler()
+        self.root = FakeRoot(self.profiler)
+        self.realm = BaseMatchingRealm(self.root, self.root)
+        self.calls = []
+        self.spam = RegexTrigger('spam', self.func)
+        self.eggs = RegexTrigger('eggs', self.func)
+
+    def func(self, match, realm):
+        self.calls.append(match)
+
+    def test_counts_attempts_and_hits(self):
+        line = Metaline('spam spam', None, None)
+        self.realm._match_generic(line, [self.spam, self.eggs])
+        assert len(self.calls) == 2
+        by_matcher = dict((s[0], s[1:3]) for s in
+                          self.profiler.top('attempts'))
+        assert by_matcher == {self.spam: (1, 2), self.eggs: (1, 0)}
+
+    def test_records_callback_time(self):
+        self.realm._match_generic(Metaline('eggs', None, None), [self.eggs])
+        (stats,) = self.profiler.top('callback_time')
+        assert stats[0] is self.eggs
+        assert stats[4] >= 0.0
+
+    def test_nothing_recorded_when_off(self):
+        self.root.profiler = None
+        self.realm._match_generic(Metaline('eggs', None, None), [self.eggs])
+        assert self.calls
+        assert self.profiler.top('attempts') == []
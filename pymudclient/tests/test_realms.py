@@ -714,10 +714,12 @@ class Test_write_wrapping:
 
     def test_with_wrap(self):
         ml = simpleml("bar", sentinel.fore1, sentinel.fore2)
-        ml.wrapped = Mock()
-        ml.wrapped.return_value = ml2 = simpleml("foo", sentinel.fore,
-                                                 sentinel.back)
-        self.realm.write(ml)
-        assert ml.wrapped.called
+        ml2 = simpleml("foo", sentinel.fore, sentinel.back)
+        #metalines have __slots__, so the method has to be patched on the
+        #class.
+        with patch.object(Metaline, 'wrapped') as wrapped:
+            wrapped.return_value = ml2
+            self.realm.write(ml)
+        assert wrapped.called
         rcvd = [ml for ((ml,), _) in self.p.metalineReceived.call_args_list]
         assert rcvd == [ml2]
@@ -21,6 +21,12 @@ class Test_LineAlterer:
                                           (4, 'F')]))
                            
 
+    def test_reset_forgets_changes(self):
+        self.la.delete(1, 2)
+        self.la.apply(self.ml)
+        self.la.reset()
+        assert self.la.apply(self.ml) is self.ml
+
     def test_delete_deletes_text(self):
         self.la.delete(1, 2)
         res = self.la.apply(self.ml)
@@ -169,6 +175,50 @@ class Test_LineAlterer:
         res = self.la.apply(simpleml('baz', None, None))
         assert res.line == "bfooabarz", res.line
 
+from pymudclient import triggers
+
+class Test_LineAlterer_batched(Test_LineAlterer):
+    """All the same again, but with every set of changes done in one go."""
+
+    def setUp(self):
+        Test_LineAlterer.setUp(self)
+        self.threshold = triggers.BATCH_THRESHOLD
+        triggers.BATCH_THRESHOLD = 0
+
+    def tearDown(self):
+        triggers.BATCH_THRESHOLD = self.threshold
+
+    def test_empty_span_recolours_until_the_colour_changes(self):
+        self.la.insert(0, 'x')
+        self.la.change_fore(3, 3, 'Z')
+        res = self.la.apply(self.ml)
+        assert res.fores.items() == [(0, 'A'), (3, 'B'), (4, 'Z'),
+                                     (5, 'C')], res.fores
+
+    def test_off_the_end_is_done_one_at_a_time(self):
+        self.la.insert(20, 'foo')
+        self.la.delete(0, 1)
+        res = self.la.apply(self.ml)
+        assert res.line == 'pam eggs hamfoo', res.line
+
+    def test_many_changes(self):
+        for ind in range(0, 13, 2):
+            self.la.insert(ind, '|')
+            self.la.change_back(ind, ind + 1, 'Z')
+        self.la.delete(4, 6)
+        res = self.la.apply(self.ml)
+        #the deletion takes the insertion at its end with it, but not the
+        #one at its start.
+        assert res.line == '|sp|am|gg|s |ha|m', res.line
+        assert res.fores.items() == [(0, 'A'), (4, 'B'), (7, 'C')], \
+               res.fores
+        #inserted text takes on the colour before it, and the changes after
+        #each insertion are moved along past it.
+        assert res.backs.items() == [(0, 'D'), (1, 'Z'), (2, 'D'), (4, 'Z'),
+                                     (5, 'E'), (7, 'Z'), (8, 'F'), (10, 'Z'),
+                                     (11, 'F'), (13, 'Z'), (14, 'F'),
+                                     (16, 'Z'), (17, 'F')], res.backs
+
 from pymudclient.triggers import non_binding_trigger
 
 def test_non_binding_trigger():
@@ -299,4 +349,313 @@ class TestRuneguardTriggers(unittest.TestCase):
         self.realm.metalineReceived(simpleml('Iniar\'s aura of weapons rebounding disappears.',None,None))
         
         #print([l.line for l in self.lines_gotten])
-        #print([l for l in self.telnet_lines_gotten])
\ No newline at end of file
+        #print([l for l in self.telnet_lines_gotten])
+
+
+from pymudclient.triggers import RegexTrigger
+from pymudclient import matcher_index
+import re
+
+class Test_list_triggers:
+
+    def setUp(self):
+        self.trigger = RegexTrigger([r'^\(([\w ]+)\): ',
+                                     r'^(?P<who>\w+) tells you, "(.*)"$'])
+
+    def matches(self, line):
+        return list(self.trigger.match(Metaline(line, None, None)))
+
+    def test_first_alternative(self):
+        (match,) = self.matches('(Market): Bob sells fish')
+        assert match.group(0) == '(Market): '
+        assert match.group(1) == 'Market'
+        assert match.groups() == ('Market',)
+        assert match.span(1) == (1, 7)
+
+    def test_second_alternative_sees_its_own_groups(self):
+        (match,) = self.matches('Bob tells you, "hi"')
+        assert match.group(1) == 'Bob'
+        assert match.group('who') == 'Bob'
+        assert match.group(2) == 'hi'
+        assert match.groups() == ('Bob', 'hi')
+        assert match.groupdict() == {'who': 'Bob'}
+        assert match.start(2) == 16
+        assert match.expand(r'\g<who> said \2') == 'Bob said hi'
+        assert match.lastindex == 2
+        assert match.re.pattern.startswith('^(?P<who>')
+
+    def test_no_such_group(self):
+        (match,) = self.matches('(Market): Bob sells fish')
+        try:
+            match.group(2)
+        except IndexError:
+            pass
+        else:
+            assert False
+
+    def test_only_matches_at_start(self):
+        assert not self.matches('Oh, (Market): Bob sells fish')
+
+    def test_rest_of_matches_follow_on(self):
+        trigger = RegexTrigger([r'x', r'a'])
+        res = list(trigger.match(Metaline('a a a', None, None)))
+        assert [match.start() for match in res] == [0, 2, 4]
+
+    def test_same_as_matching_individually(self):
+        trigger = RegexTrigger([re.compile(r'(\w)(\w)'),
+                                re.compile(r'(\d)')])
+        res = list(trigger.match(Metaline('ab cd', None, None)))
+        assert [m.groups() for m in res] == [('a', 'b'), ('c', 'd')]
+
+    def test_backreferences_still_work(self):
+        trigger = RegexTrigger([r'(a)\1', r'(b)\1'])
+        res = list(trigger.match(Metaline('bb', None, None)))
+        assert [m.group() for m in res] == ['bb']
+
+    def test_empty_matches_dont_repeat(self):
+        trigger = RegexTrigger([r'x*'])
+        res = list(trigger.match(Metaline('ab', None, None)))
+        assert [m.span() for m in res] == [(0, 0), (1, 1), (2, 2)]
+
+    def test_combined_patterns_remembered_by_their_text(self):
+        first = triggers._alternation([re.compile('foo'), re.compile('bar')])
+        again = triggers._alternation([re.compile('foo'), re.compile('bar')])
+        assert again is first
+        for ind in range(matcher_index.MAX_CACHED + 1):
+            triggers._alternation(['%d' % ind, 'x'])
+        assert len(triggers._alternations) <= matcher_index.MAX_CACHED
+
+from pymudclient.triggers import MultilineTrigger, TriggerBlockMatchingRealm
+from pymudclient.matcher_index import MatcherIndex
+from pymudclient.line_rules import LineRules
+
+class Test_multiline_triggers:
+
+    def setUp(self):
+        self.trigger = MultilineTrigger([r'^You see (\w+) here\.$',
+                                         r'^(\w+) is wielding (.*)\.$'])
+
+    def feed(self, *lines):
+        res = []
+        for line in lines:
+            res.extend(self.trigger.match(Metaline(line, None, None)))
+        return res
+
+    def test_matches_consecutive_lines(self):
+        (match,) = self.feed('You see Bob here.', 'Bob is wielding a sword.')
+        assert match.groups() == ('Bob', 'Bob', 'a sword')
+        assert match.group(3) == 'a sword'
+        assert match.group(0) == 'You see Bob here.\nBob is wielding a sword.'
+        assert match.lines == ['You see Bob here.',
+                               'Bob is wielding a sword.']
+
+    def test_positions_are_in_the_last_line(self):
+        (match,) = self.feed('You see Bob here.', 'Bob is wielding a sword.')
+        assert match.span() == (0, 24)
+        assert match.span(2) == (0, 3)
+        assert match.start(3) == 16 and match.end(3) == 23
+        assert match.span(1) == (-1, -1)
+
+    def test_named_groups(self):
+        self.trigger.regex = [r'^You see (?P<who>\w+) here\.$',
+                              r'^\w+ is wielding (?P<weapon>.*)\.$']
+        (match,) = self.feed('You see Bob here.', 'Bob is wielding a sword.')
+        assert match.groupdict() == {'who': 'Bob', 'weapon': 'a sword'}
+        assert match.group('who') == 'Bob'
+        assert match.span('weapon') == (16, 23)
+        assert match.start('who') == -1
+
+    def test_no_such_group(self):
+        (match,) = self.feed('You see Bob here.', 'Bob is wielding a sword.')
+        for group in (4, -1, 'nope'):
+            try:
+                match.span(group)
+            except IndexError:
+                pass
+            else:
+                assert False, group
+
+    def test_lines_must_be_consecutive(self):
+        assert self.feed('You see Bob here.', 'It is raining.',
+                         'Bob is wielding a sword.') == []
+
+    def test_partial_matches_overlap(self):
+        trigger = MultilineTrigger(['a', 'a', 'b'])
+        res = []
+        for line in ['a', 'a', 'a', 'b']:
+            res.extend(trigger.match(Metaline(line, None, None)))
+        assert len(res) == 1
+        assert res[0].lines == ['a', 'a', 'b']
+
+    def test_start_block_forgets_partials(self):
+        self.feed('You see Bob here.')
+        self.trigger.start_block()
+        assert self.feed('Bob is wielding a sword.') == []
+
+    def test_new_regex_forgets_partials(self):
+        self.feed('You see Bob here.')
+        self.trigger.regex = [r'^You see (\w+) here\.$', 'Bob']
+        assert self.feed('Bob is wielding a sword.') == []
+
+    def test_single_line_is_searched_once_per_stage(self):
+        trigger = MultilineTrigger(['a', 'a', 'a'])
+        res = []
+        for line in ['a'] * 4:
+            res.extend(trigger.match(Metaline(line, None, None)))
+        assert len(res) == 2
+
+class FakeBlockRoot(object):
+
+    tracing = False
+    profiler = None
+    active_channels = ['main']
+
+    def __init__(self, triggers):
+        self.root = self
+        self.triggers = triggers
+        self.trigger_index = MatcherIndex(triggers)
+        self.line_rules = LineRules()
+        self.written = []
+
+    def setActiveChannels(self, channels):
+        self.active_channels = channels
+
+    def write(self, line, soft_line_start = False):
+        self.written.append(line.line)
+
+class Test_multiline_triggers_in_blocks:
+
+    def setUp(self):
+        self.seen = []
+        self.trigger = MultilineTrigger(['^spam$', '^eggs$'], self.func)
+        self.root = FakeBlockRoot([self.trigger])
+
+    def func(self, match, realm):
+        self.seen.append((match.lines, realm.line_index))
+
+    def process(self, *lines):
+        block = [Metaline(line, None, None) for line in lines]
+        TriggerBlockMatchingRealm(block, self.root, self.root).process()
+
+    def test_matches_within_a_block(self):
+        self.process('foo', 'spam', 'eggs')
+        assert self.seen == [(['spam', 'eggs'], 2)]
+
+    def test_doesnt_match_across_blocks(self):
+        self.process('foo', 'spam')
+        self.process('eggs')
+        assert self.seen == []
+
+from pymudclient.triggers import TriggerChain
+
+class Test_TriggerChain:
+
+    def setUp(self):
+        self.fired = []
+        self.now = 0
+        self.chain = TriggerChain()
+        self.chain.clock = lambda: self.now
+        self.chain.add('start', RegexTrigger('^You cast a line\.$',
+                                             self.func), goto = 'fishing')
+        self.chain.add('fishing', RegexTrigger('^You feel a tug\.$',
+                                               self.func), goto = 'start')
+        self.chain.set_timeout('fishing', 30)
+        self.root = FakeBlockRoot([self.chain])
+
+    def func(self, match, realm):
+        self.fired.append(match.group())
+
+    def feed(self, *lines):
+        for line in lines:
+            TriggerBlockMatchingRealm([Metaline(line, None, None)], self.root,
+                                      self.root).process()
+
+    def test_only_current_state_is_tried(self):
+        self.feed('You feel a tug.')
+        assert self.fired == []
+        assert self.chain.state == 'start'
+
+    def test_transitions(self):
+        self.feed('You cast a line.')
+        assert self.chain.state == 'fishing'
+        self.feed('You cast a line.', 'You feel a tug.')
+        assert self.fired == ['You cast a line.', 'You feel a tug.']
+        assert self.chain.state == 'start'
+
+    def test_timeout(self):
+        self.feed('You cast a line.')
+        self.now = 31
+        self.feed('You feel a tug.')
+        assert self.chain.state == 'start'
+        assert self.fired == ['You cast a line.']
+
+    def test_timeout_on_the_current_state(self):
+        self.chain.add('idle', RegexTrigger('^You cast a line\.$',
+                                            self.func))
+        self.chain.set_timeout('start', 10, 'idle')
+        self.now = 11
+        self.feed('You feel a tug.')
+        assert self.chain.state == 'idle'
+
+    def test_goto_from_a_callback(self):
+        @self.chain.on('start', '^Reset$')
+        def reset(match, realm):
+            self.chain.goto('elsewhere')
+        self.feed('Reset')
+        assert self.chain.state == 'elsewhere'
+        self.chain.reset()
+        assert self.chain.state == 'start'
+
+    def test_regex_changes_are_noticed(self):
+        (trigger,) = self.chain._states['start'][0]
+        trigger.regex = re.compile('^Cast!$')
+        self.feed('Cast!')
+        assert self.chain.state == 'fishing'
+
+from pymudclient.triggers import TriggerMatchingRealm
+
+class Test_realm_reuse:
+
+    def setUp(self):
+        self.realms = []
+        self.trigger = RegexTrigger('spam', self.func)
+        self.root = FakeBlockRoot([self.trigger])
+
+    def func(self, match, realm):
+        self.realms.append(realm)
+        realm.alterer.change_fore(0, 4, 'red')
+        realm.write(simpleml('written', None, None))
+
+    def test_realms_are_reused(self):
+        for line in ['spam', 'spam']:
+            TriggerMatchingRealm.match_line(simpleml(line, 'white', None),
+                                            self.root, self.root)
+        assert self.realms[0] is self.realms[1]
+
+    def test_reused_realms_start_afresh(self):
+        TriggerMatchingRealm.match_line(simpleml('spam', 'white', None),
+                                        self.root, self.root)
+        TriggerMatchingRealm.match_line(simpleml('eggs', 'white', None),
+                                        self.root, self.root, False)
+        TriggerMatchingRealm.match_line(simpleml('ham', 'white', None),
+                                        self.root, self.root)
+        assert self.root.written == ['spam', 'written', 'ham']
+
+    def test_nested_matching_uses_another_realm(self):
+        def func(match, realm):
+            self.realms.append(realm)
+            TriggerMatchingRealm.match_line(simpleml('inner', None, None),
+                                            realm.root, realm.root)
+        self.trigger.func = func
+        TriggerMatchingRealm.match_line(simpleml('spam', None, None),
+                                        self.root, self.root)
+        assert self.root.written == ['inner', 'spam']
+
+    def test_block_lines_get_their_own_alterers(self):
+        block = [simpleml(line, 'white', None)
+                 for line in ['spam', 'eggs', 'spam']]
+        realm = TriggerBlockMatchingRealm(block, self.root, self.root)
+        assert len(set(id(alterer) for alterer in realm.alterers)) == 3
+        realm.process()
+        assert self.root.written == ['spam', 'written', 'eggs', 'spam',
+                                     'written']
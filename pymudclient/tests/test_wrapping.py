@@ -0,0 +1,73 @@
+from pymudclient.wrapping import LineWrapper
+from pymudclient.metaline import Metaline, RunLengthList
+from textwrap import TextWrapper
+
+def test_breaks_like_TextWrapper():
+    lines = ['foo bar baz quuxfoobarbaz foobarbazquux foo',
+             'a well-known long-winded hyphen-y sentence -- with dashes',
+             'short',
+             'spaces          in the middle',
+             '']
+    for width in (1, 4, 10, 25):
+        wrapper = TextWrapper(width = width, drop_whitespace = False)
+        for line in lines:
+            assert LineWrapper(width).fill(line) == wrapper.fill(line), \
+                   (line, width)
+
+def test_unicode_breaks_like_TextWrapper():
+    lines = [u'caf\xe9-cr\xe8me na\xefve-ish',
+             u'\xfcber stra\xdfe \u65e5\u672c\u8a9e text',
+             u'foo\xa0bar\xa0baz quux',
+             u'na\xefve caf\xe9 cr\xe8me br\xfbl\xe9e']
+    for width in (1, 4, 6, 14, 25):
+        wrapper = TextWrapper(width = width, drop_whitespace = False)
+        for line in lines:
+            assert LineWrapper(width).fill(line) == wrapper.fill(line), \
+                   (line, width)
+
+def test_unicode_words_not_split_at_NBSP():
+    res = LineWrapper(6).fill(u'foo\xa0bar\xa0baz')
+    assert res == u'foo\xa0\nbar\xa0\nbaz', repr(res)
+
+def test_width_must_be_positive():
+    try:
+        LineWrapper(0)
+    except ValueError:
+        pass
+    else:
+        assert False
+
+class Test_wrap_metaline:
+
+    def setUp(self):
+        self.wrapper = LineWrapper(width = 10)
+        self.ml = Metaline('foo bar baz quux', RunLengthList([(0, 'A'),
+                                                               (8, 'B')]),
+                           RunLengthList([(0, 'C')]), wrap = True)
+
+    def test_colours_are_moved_along(self):
+        res = self.ml.wrapped(self.wrapper)
+        assert res.line == 'foo bar \nbaz quux', repr(res.line)
+        assert res.fores.items() == [(0, 'A'), (9, 'B')], res.fores
+        assert res.backs.items() == [(0, 'C')], res.backs
+
+    def test_original_is_left_alone(self):
+        self.ml.wrapped(self.wrapper)
+        assert self.ml.line == 'foo bar baz quux'
+        assert self.ml.fores.items() == [(0, 'A'), (8, 'B')]
+
+    def test_short_lines_are_still_copied(self):
+        ml = Metaline('foo', RunLengthList([(0, 'A')]),
+                      RunLengthList([(0, 'C')]), wrap = True)
+        res = ml.wrapped(self.wrapper)
+        assert res == ml and res is not ml
+
+    def test_breaks_are_cached(self):
+        self.ml.wrapped(self.wrapper)
+        assert self.wrapper._cache == {'foo bar baz quux': (8,)}
+
+    def test_changing_width_forgets_the_cache(self):
+        self.ml.wrapped(self.wrapper)
+        self.wrapper.width = 5
+        assert self.wrapper._cache == {}
+        assert self.ml.wrapped(self.wrapper).line == 'foo \nbar \nbaz \nquux'
@@ -2,41 +2,533 @@
 criteria.
 """
 from collections import deque
+from bisect import bisect_left, bisect_right
 from pymudclient.matchers import BindingPlaceholder, NonbindingPlaceholder, \
                             make_decorator, ProtoMatcher, BaseMatchingRealm
-from pymudclient.metaline import iadjust
+from pymudclient.metaline import iadjust, RunLengthList
 from pymudclient.aliases import AliasMatchingRealm
+from pymudclient.matcher_index import mark_indexable, MatcherIndex, remember
+from operator import attrgetter
 import re
+import time
+import sre_parse
+from sre_constants import GROUPREF, GROUPREF_EXISTS
 from pymudclient.tagged_ml_parser import taggedml
 
+def _refers_back(parsed):
+    """Does a parsed pattern contain any backreferences?"""
+    for item in parsed:
+        if isinstance(item, tuple) and len(item) == 2 and \
+           item[0] in (GROUPREF, GROUPREF_EXISTS):
+            return True
+        if isinstance(item, (tuple, list, sre_parse.SubPattern)) and \
+           _refers_back(item):
+            return True
+    return False
+
+class _AlternativeMatch(object):
+    """One alternative's view of a match of a combined pattern.
+
+    Group numbers and names work as if the alternative had matched on its
+    own, so callbacks can't tell the difference.
+    """
+
+    __slots__ = ['_match', '_offset', 're', 'string', 'pos', 'endpos']
+
+    def __init__(self, match, offset, pattern):
+        self._match = match
+        self._offset = offset
+        self.re = pattern
+        self.string = match.string
+        self.pos = match.pos
+        self.endpos = match.endpos
+
+    def _index(self, group):
+        """Translate a group number or name into the combined pattern's."""
+        if isinstance(group, basestring):
+            if group not in self.re.groupindex:
+                raise IndexError("no such group")
+            group = self.re.groupindex[group]
+        elif not 0 <= group <= self.re.groups:
+            raise IndexError("no such group")
+        return self._offset + group
+
+    def group(self, *groups):
+        if not groups:
+            groups = (0,)
+        res = tuple(self._match.group(self._index(group)) for group in groups)
+        if len(res) == 1:
+            return res[0]
+        return res
+
+    def groups(self, default = None):
+        res = self._match.groups(default)
+        return res[self._offset:self._offset + self.re.groups]
+
+    def groupdict(self, default = None):
+        return dict((name, self._match.group(self._offset + ind)
+                           if self._match.start(self._offset + ind) != -1
+                           else default)
+                    for name, ind in self.re.groupindex.iteritems())
+
+    def start(self, group = 0):
+        return self._match.start(self._index(group))
+
+    def end(self, group = 0):
+        return self._match.end(self._index(group))
+
+    def span(self, group = 0):
+        return self._match.span(self._index(group))
+
+    def expand(self, template):
+        template = sre_parse.parse_template(template, self.re)
+        return sre_parse.expand_template(template, self)
+
+    @property
+    def lastindex(self):
+        #these are rarely wanted, and awkward to work out from the combined
+        #match, so just ask the pattern itself.
+        return self.re.match(self.string, self.start()).lastindex
+
+    @property
+    def lastgroup(self):
+        return self.re.match(self.string, self.start()).lastgroup
+
+_alternations = {}
+def _alternation(patterns):
+    """Compile a list of patterns into one alternation, each wrapped in its
+    own named group.
+
+    Returns the combined pattern and a list of (group number, pattern) for
+    each alternative, or None if the patterns can't be combined safely.
+    """
+    #compiled patterns hash by identity, so go by what's in them instead.
+    key = tuple((pattern, 0) if isinstance(pattern, basestring)
+                else (pattern.pattern, pattern.flags) for pattern in patterns)
+    if key in _alternations:
+        return _alternations[key]
+    patterns = [re.compile(pattern) if isinstance(pattern, basestring)
+                else pattern for pattern in patterns]
+    res = None
+    flags = set(pattern.flags for pattern in patterns)
+    if len(flags) == 1:
+        try:
+            #backreferences would point at the wrong groups once combined
+            if not any(_refers_back(sre_parse.parse(pattern.pattern,
+                                                    pattern.flags))
+                       for pattern in patterns):
+                combined = re.compile('|'.join('(?P<_alt%d>%s)' %
+                                               (ind, pattern.pattern)
+                                               for ind, pattern
+                                               in enumerate(patterns)),
+                                      flags.pop())
+                res = (combined,
+                       [(combined.groupindex['_alt%d' % ind], pattern)
+                        for ind, pattern in enumerate(patterns)])
+        except (re.error, AssertionError, OverflowError):
+            #clashing group names, too many groups, and so on.
+            res = None
+    return remember(_alternations, key, res)
+
+def _matches_after(first, pattern, line):
+    """Yield a match, and then the rest of pattern's matches in line, carrying
+    on from where it left off.
+    """
+    yield first
+    pos = first.end()
+    if pos == first.start():
+        #don't find the same empty match again
+        pos += 1
+    if pos <= len(line):
+        for match in pattern.finditer(line, pos):
+            yield match
+
+def _match_list(patterns, line):
+    """Find the first of patterns that matches at the start of the line, and
+    return all its matches in the line.
+
+    This is done with one pass of a combined pattern if possible.
+    """
+    combined = _alternation(patterns)
+    if combined is None:
+        for pattern in patterns:
+            if isinstance(pattern, basestring):
+                pattern = re.compile(pattern)
+            match = pattern.match(line)
+            if match:
+                return _matches_after(match, pattern, line)
+        return []
+    combined, alternatives = combined
+    match = combined.match(line)
+    if match is None:
+        return []
+    for offset, pattern in alternatives:
+        if match.start(offset) != -1:
+            return _matches_after(_AlternativeMatch(match, offset, pattern),
+                                  pattern, line)
+
 class RegexTrigger(ProtoMatcher):
-    """A single trigger, that matches simply on a regex."""
+    """A single trigger, that matches simply on a regex.
+
+    The regex may also be a list of them, in which case the first one in the
+    list that matches at the start of the line is used.
+    """
 
+    @mark_indexable
     def match(self, metaline):
         """Test to see if the trigger's regex matches."""
-        if self.regex is not None:
-            if isinstance(self.regex, list):
-                for r in self.regex:
-                    if re.match(r, metaline.line):
-                        return re.finditer(r, metaline.line)
-                
-                return []
-            else:
-                return re.finditer(self.regex, metaline.line)
-        else:
+        regex = self.regex
+        if regex is None:
             return []
+        if isinstance(regex, list):
+            return _match_list(regex, metaline.line)
+        if isinstance(regex, basestring):
+            return re.finditer(regex, metaline.line)
+        return regex.finditer(metaline.line)
 
 binding_trigger = make_decorator(RegexTrigger, BindingPlaceholder,True)
 non_binding_trigger = make_decorator(RegexTrigger, NonbindingPlaceholder,True)
 
+class MultilineMatch(object):
+    """The matches of each line of a multiline trigger, in order.
+
+    Groups are numbered straight through the lines, so if the first line's
+    pattern has two groups, the second line's first group is group 3. Group 0
+    is all the lines' matched text, joined with newlines. Named groups are
+    looked up from the last line back, so a later line's wins.
+
+    start, end and span are positions in the last line, as that's the one
+    the realm's alterer is working on: group 0 is the last line's match, and
+    groups on earlier lines are -1, like groups that didn't take part.
+    """
+
+    def __init__(self, matches):
+        self.matches = matches
+
+    def _locate(self, group):
+        """Return the match of the line group is on, and its number there."""
+        if isinstance(group, basestring):
+            for match in reversed(self.matches):
+                if group in match.re.groupindex:
+                    return match, match.re.groupindex[group]
+            raise IndexError("no such group")
+        if group == 0:
+            return self.matches[-1], 0
+        if group > 0:
+            for match in self.matches:
+                if group <= match.re.groups:
+                    return match, group
+                group -= match.re.groups
+        raise IndexError("no such group")
+
+    @property
+    def lines(self):
+        """The text of each line that was matched."""
+        return [match.string for match in self.matches]
+
+    def groups(self, default = None):
+        res = ()
+        for match in self.matches:
+            res += match.groups(default)
+        return res
+
+    def group(self, *groups):
+        if not groups:
+            groups = (0,)
+        all_groups = self.groups()
+        res = []
+        for group in groups:
+            if group == 0:
+                res.append('\n'.join(match.group() for match in self.matches))
+            elif isinstance(group, basestring):
+                match, group = self._locate(group)
+                res.append(match.group(group))
+            elif 0 < group <= len(all_groups):
+                res.append(all_groups[group - 1])
+            else:
+                raise IndexError("no such group")
+        if len(res) == 1:
+            return res[0]
+        return tuple(res)
+
+    def groupdict(self, default = None):
+        res = {}
+        for match in self.matches:
+            res.update(match.groupdict(default))
+        return res
+
+    def span(self, group = 0):
+        match, group = self._locate(group)
+        if match is not self.matches[-1]:
+            return (-1, -1)
+        return match.span(group)
+
+    def start(self, group = 0):
+        return self.span(group)[0]
+
+    def end(self, group = 0):
+        return self.span(group)[1]
+
+class MultilineTrigger(ProtoMatcher):
+    """A trigger that matches over several consecutive lines.
+
+    The regex is a list of patterns, one for each line, which are searched
+    for like an ordinary trigger's. The trigger fires when the last one
+    matches, with a MultilineMatch of the lot.
+
+    Lines are fed in one at a time, and we keep hold of the partial matches
+    that are still going, so every line is only looked at once for each
+    pattern it could be the next line of. When the MUD's text comes in
+    blocks, partial matches are dropped at the start of each block; when it
+    doesn't, a partial match lasts as long as the lines keep matching.
+    """
+
+    def __init__(self, regex = None, func = None, sequence = 0):
+        self._source = None
+        self._patterns = []
+        self._partials = []
+        ProtoMatcher.__init__(self, regex, func, sequence)
+
+    def start_block(self):
+        """A new block is starting, so forget any partial matches."""
+        self._partials = []
+
+    def match(self, metaline):
+        """Take the next line, and return a MultilineMatch if it finishes
+        off a match.
+        """
+        if self.regex is not self._source:
+            #new patterns, so the old partial matches mean nothing.
+            self._source = self.regex
+            self._patterns = [re.compile(pattern)
+                              if isinstance(pattern, basestring) else pattern
+                              for pattern in self.regex or ()]
+            self._partials = []
+        patterns = self._patterns
+        if not patterns:
+            return []
+        line = metaline.line
+        #partials that have got equally far all want the same pattern, so
+        #only search for it once.
+        searched = {}
+        partials = []
+        done = []
+        for matched in self._partials + [[]]:
+            stage = len(matched)
+            if stage not in searched:
+                searched[stage] = patterns[stage].search(line)
+            match = searched[stage]
+            if match is None:
+                continue
+            matched = matched + [match]
+            if len(matched) == len(patterns):
+                done.append(MultilineMatch(matched))
+            else:
+                partials.append(matched)
+        self._partials = partials
+        return done
+
+binding_multiline_trigger = make_decorator(MultilineTrigger,
+                                           BindingPlaceholder, True)
+non_binding_multiline_trigger = make_decorator(MultilineTrigger,
+                                               NonbindingPlaceholder, True)
+
+class TriggerChain(object):
+    """A state machine of triggers, for when a trigger should only fire once
+    some other one has.
+
+    Each state has its own triggers, and only the current state's triggers
+    are tried against a line; the rest cost nothing. A trigger can be added
+    with a state to go to once it's fired, and a state can have a timeout,
+    after which the chain goes back to another state (the initial one, by
+    default) if it's still there. Callbacks can also move the chain along
+    themselves with goto().
+
+    The chain goes in a module's triggers like any single trigger, and is
+    sorted along with the rest by its sequence.
+    """
+
+    def __init__(self, initial = 'start', sequence = 0):
+        self.initial = initial
+        self.sequence = sequence
+        self.clock = time.time
+        self._states = {}
+        self._timeouts = {}
+        self._deadline = None
+        self.goto(initial)
+
+    def _triggers_in(self, state):
+        if state not in self._states:
+            #each state's triggers, and its own index over them.
+            triggers = []
+            self._states[state] = (triggers, MatcherIndex(triggers), {})
+        return self._states[state]
+
+    def add(self, state, trigger, goto = None):
+        """Add a trigger to a state, optionally moving to the state named by
+        goto once the trigger's fired.
+        """
+        triggers, index, gotos = self._triggers_in(state)
+        triggers.append(trigger)
+        triggers.sort(key = attrgetter('sequence'))
+        index.rebuild(triggers)
+        gotos[id(trigger)] = goto
+        return trigger
+
+    def on(self, state, regex, goto = None, sequence = 0):
+        """Decorator: make the function into a trigger in the given state."""
+        def fngrabber(func):
+            return self.add(state, RegexTrigger(regex, func, sequence), goto)
+        return fngrabber
+
+    def set_timeout(self, state, seconds, goto = None):
+        """Leave state for goto (or the initial state) if we're still in it
+        after this many seconds.
+        """
+        if goto is None:
+            goto = self.initial
+        self._timeouts[state] = (seconds, goto)
+        if state == self.state:
+            #we're already in it, so start counting from now.
+            self._deadline = self.clock() + seconds
+
+    def goto(self, state):
+        """Move to another state."""
+        self.state = state
+        if state in self._timeouts:
+            self._deadline = self.clock() + self._timeouts[state][0]
+        else:
+            self._deadline = None
+
+    def reset(self):
+        """Go back to the initial state."""
+        self.goto(self.initial)
+
+    def match(self, metaline):
+        """Try the current state's triggers, and return a (trigger, match,
+        goto) triple for each match.
+        """
+        if self._deadline is not None and self.clock() >= self._deadline:
+            #timeouts are only checked when a line turns up, which is the
+            #only time they'd make any difference anyway.
+            self.goto(self._timeouts[self.state][1])
+        if self.state not in self._states:
+            return []
+        triggers, index, gotos = self._states[self.state]
+        res = []
+        for trigger in index.candidates(triggers, metaline.line):
+            goto = gotos[id(trigger)]
+            for match in trigger.match(metaline):
+                res.append((trigger, match, goto))
+        return res
+
+    def __call__(self, match, realm):
+        trigger, match, goto = match
+        trigger(match, realm)
+        if goto is not None:
+            self.goto(goto)
+
+    def __str__(self):
+        return '<TriggerChain in %r%s>' % (self.state,
+                                           ' sequence = %d' % self.sequence
+                                           if self.sequence else '')
+
+class _Unbatchable(Exception):
+    """The changes can't be worked out in one go, and have to be made one at
+    a time instead.
+    """
+
+class _Piece(object):
+    """A stretch of a line that's being altered: either some of the original
+    text, or something that's been inserted.
+
+    Every index a change refers to is the start of one of these, so they're
+    only ever deleted or recoloured whole. Deleted pieces remember which piece
+    took their place, so indices that pointed at them can be followed along.
+    """
+
+    __slots__ = ['text', 'fores', 'backs', 'prev', 'next', 'replaced_by']
+
+    def __init__(self, text, fores, backs):
+        self.text = text
+        #lists of (offset, colour), the first always at offset 0.
+        self.fores = fores
+        self.backs = backs
+        self.prev = self.next = self.replaced_by = None
+
+    def link_before(self, other):
+        """Put ourselves into the line just before other."""
+        self.prev = other.prev
+        self.next = other
+        other.prev.next = self
+        other.prev = self
+
+def _runs_between(positions, values, start, end):
+    """Cut the colour runs from start to end out of a RunLengthList's
+    positions and values, with the offsets made relative to start.
+    """
+    lo = bisect_right(positions, start)
+    hi = bisect_left(positions, end, lo)
+    res = [(0, values[lo - 1])]
+    res.extend((positions[ind] - start, values[ind])
+               for ind in xrange(lo, hi))
+    return res
+
+def _join_runs(runs, piece_runs, offset):
+    """Add a piece's runs onto the line's, dropping any that don't change the
+    colour.
+    """
+    for ind, colour in piece_runs:
+        if not runs or runs[-1][1] != colour:
+            runs.append((ind + offset, colour))
+
+def _recolour_run(piece, attr, colour):
+    """Change the colour of the run that starts at the start of piece, going
+    through as many pieces as that run does.
+    """
+    old = getattr(piece, attr)[0][1]
+    while piece is not None:
+        runs = getattr(piece, attr)
+        ind = 0
+        while ind < len(runs) and runs[ind][1] == old:
+            ind += 1
+        if ind == 0:
+            break
+        setattr(piece, attr, [(0, colour)] + runs[ind:])
+        if ind < len(runs):
+            break
+        piece = piece.next
+
+def _colour_lists(rll, length):
+    """Get at the start points and values of a RunLengthList, if they cover
+    a line of the given length and nothing more.
+    """
+    positions = rll.keys()
+    if not positions or positions[0] != 0 or positions[-1] > length:
+        raise _Unbatchable()
+    return positions, rll.values()
+
+_TEXT_CHANGES = frozenset(['delete', 'insert', 'insert_metaline'])
+#with fewer changes than this, it's quicker to just make them one at a time.
+BATCH_THRESHOLD = 8
+
 class LineAlterer(object):
     """Caches the changes made to a Metaline so triggers don't step on each
     others' feet.
+
+    Each change is given in terms of the original line; earlier insertions and
+    deletions move the later changes along to match.
     """
 
+    __slots__ = ['_changes']
+
     def __init__(self):
         self._changes = deque()
 
+    def reset(self):
+        """Forget all our changes, so we can be used for another line."""
+        self._changes.clear()
+
     def delete(self, start, end):
         """Delete a span of text."""
         self._changes.append(('delete', start, end))
@@ -75,11 +567,27 @@ class LineAlterer(object):
     def apply(self, metaline):
         """Apply our changes to a metaline.
 
-        This LineAlterer is no good after doing this, so copy it if it needs
-        to be reused. The metaline passed in, however, is left pristine.
+        This LineAlterer is no good after doing this until it's been reset.
+        The metaline passed in, however, is left pristine.
+        """
+        if not self._changes:
+            return metaline
+        if len(self._changes) >= BATCH_THRESHOLD and \
+           any(change[0] in _TEXT_CHANGES for change in self._changes):
+            try:
+                return self._apply_batched(metaline)
+            except _Unbatchable:
+                pass
+        return self._apply_in_order(metaline)
+
+    def _apply_in_order(self, metaline):
+        """Make the changes one by one, moving the rest along after each
+        insertion or deletion.
+
+        This is quadratic in the number of changes, but copes with anything,
+        even indices that are off the end of the line.
         """
-        if self._changes:
-            metaline = metaline.copy()
+        metaline = metaline.copy()
         for change in self._changes:
             meth = change[0]
             args = change[1:]
@@ -96,13 +604,158 @@ class LineAlterer(object):
             getattr(metaline, meth)(*args)
         return metaline
 
+    def _apply_batched(self, metaline):
+        """Work out the result of all the changes in one go.
+
+        The line is cut up into pieces at every index the changes mention.
+        The changes are then made to the chain of pieces, in order, without
+        any of the text or colours being touched until the very end, when the
+        new line and its colours are put together in one pass.
+
+        This gives exactly the same result as _apply_in_order, but raises
+        _Unbatchable for the odd cases that only that can handle.
+        """
+        line = metaline.line
+        length = len(line)
+        fore_lists = _colour_lists(metaline.fores, length)
+        back_lists = _colour_lists(metaline.backs, length)
+        points = set([0, length])
+        for change in self._changes:
+            if change[0] in ('insert', 'insert_metaline'):
+                start = change[1]
+                if not 0 <= start <= length:
+                    raise _Unbatchable()
+            else:
+                start, end = change[1:3]
+                if not 0 <= start <= end <= length:
+                    raise _Unbatchable()
+                points.add(end)
+            points.add(start)
+        points = sorted(points)
+
+        #the head's only there so there's always something before a piece.
+        head = _Piece('', None, None)
+        end_piece = _Piece('', _runs_between(fore_lists[0], fore_lists[1],
+                                             length, length),
+                           _runs_between(back_lists[0], back_lists[1],
+                                         length, length))
+        head.next = end_piece
+        end_piece.prev = head
+        anchors = {length: end_piece}
+        for start, end in zip(points, points[1:]):
+            piece = _Piece(line[start:end],
+                           _runs_between(fore_lists[0], fore_lists[1],
+                                         start, end),
+                           _runs_between(back_lists[0], back_lists[1],
+                                         start, end))
+            piece.link_before(end_piece)
+            anchors[start] = piece
+
+        def find(ind):
+            """Find the piece that's now at the original index ind."""
+            piece = anchors[ind]
+            while piece.replaced_by is not None:
+                piece = piece.replaced_by
+            return piece
+
+        for change in self._changes:
+            meth = change[0]
+            if meth == 'insert':
+                start, text = change[1:]
+                if not text:
+                    continue
+                after = find(start)
+                #inserted text takes on the colour of the text before it.
+                if after.prev is head:
+                    fore, back = after.fores[0][1], after.backs[0][1]
+                else:
+                    fore = after.prev.fores[-1][1]
+                    back = after.prev.backs[-1][1]
+                _Piece(text, [(0, fore)], [(0, back)]).link_before(after)
+            elif meth == 'insert_metaline':
+                start, ins_metaline = change[1:]
+                text = ins_metaline.line
+                if text:
+                    fores = _colour_lists(ins_metaline.fores, len(text))
+                    backs = _colour_lists(ins_metaline.backs, len(text))
+                    piece = _Piece(text,
+                                   _runs_between(fores[0], fores[1],
+                                                 0, len(text)),
+                                   _runs_between(backs[0], backs[1],
+                                                 0, len(text)))
+                    piece.link_before(find(start))
+                #Metaline.insert_metaline gets rid of any colours at the very
+                #end of the line, which it can't do for an empty line.
+                last = end_piece.prev
+                if last is head:
+                    raise _Unbatchable()
+                end_piece.fores = [(0, last.fores[-1][1])]
+                end_piece.backs = [(0, last.backs[-1][1])]
+            elif meth == 'delete':
+                first, after = find(change[1]), find(change[2])
+                piece = first
+                while piece is not after:
+                    piece.replaced_by = after
+                    piece = piece.next
+                first.prev.next = after
+                after.prev = first.prev
+            else:
+                start, end, colour = change[1:]
+                attr = 'fores' if meth == 'change_fore' else 'backs'
+                piece, after = find(start), find(end)
+                if piece is after:
+                    #RunLengthList.change_between still sets the colour at
+                    #the start of an empty span, which lasts until the colour
+                    #would have changed anyway.
+                    _recolour_run(after, attr, colour)
+                while piece is not after:
+                    setattr(piece, attr, [(0, colour)])
+                    piece = piece.next
+
+        texts = []
+        fores = []
+        backs = []
+        offset = 0
+        piece = head.next
+        while piece is not None:
+            texts.append(piece.text)
+            _join_runs(fores, piece.fores, offset)
+            _join_runs(backs, piece.backs, offset)
+            offset += len(piece.text)
+            piece = piece.next
+        metaline = metaline.copy()
+        metaline.line = line[:0].join(texts)
+        metaline.fores = RunLengthList(fores, _normalised = True)
+        metaline.backs = RunLengthList(backs, _normalised = True)
+        return metaline
+
+
+#alterers that have been finished with, ready for reuse.
+_spare_alterers = []
+MAX_SPARE = 256
+
+def _get_alterer():
+    """Return a blank LineAlterer, reusing an old one if we can."""
+    if _spare_alterers:
+        return _spare_alterers.pop()
+    return LineAlterer()
+
+def _put_alterers(alterers):
+    """Done with these alterers, so reset them and keep them for later."""
+    for alterer in alterers:
+        if len(_spare_alterers) >= MAX_SPARE:
+            break
+        alterer.reset()
+        _spare_alterers.append(alterer)
 
 class TriggerBlockMatchingRealm(BaseMatchingRealm):
     """This is like trigger matching realm, but it operates on an entire block"""
     def __init__(self, block, root, parent, display_group=True):
         BaseMatchingRealm.__init__(self, root, parent)
         self.block=block
-        self.alterers=[LineAlterer()]*len(self.block)
+        #each line needs its own alterer, or one line's changes would be made
+        #to every line.
+        self.alterers=[_get_alterer() for _ in xrange(len(self.block))]
         self.display_lines = [display_group]*len(self.block)
         self.display_group = True
         
@@ -133,8 +786,12 @@ class TriggerBlockMatchingRealm(BaseMatchingRealm):
     def process(self):
         """Do our main thing."""
         channels=[]
+        triggers = self.root.triggers
+        for trigger in self.root.trigger_index.block_watchers:
+            trigger.start_block()
         for ml in self.block:
-            self._match_generic(ml, self.root.triggers)
+            self._match_generic(ml, self.root.trigger_index.candidates(
+                                                            triggers, ml.line))
             '''triggers can set a different channel to write the text to, and we need to respect that'''
             channels.append(self.root.active_channels)
             self.line_index+=1
@@ -147,8 +804,9 @@ class TriggerBlockMatchingRealm(BaseMatchingRealm):
             '''Apply the channels that were set when actually writing'''
             self.root.setActiveChannels(channels[indx])
             if self.display_lines[indx] and self.display_group:
-                self.parent.write(metaline)
+                self._display(metaline)
             self._write_after(indx)
+        _put_alterers(self.alterers)
           
     def _write_after(self, indx):
         """Write everything we've been waiting to."""
@@ -191,8 +849,17 @@ class TriggerMatchingRealm(BaseMatchingRealm):
     .root, which is the RootRealm.
     
     .parent, which is the Realm up one level from this one.
+
+    Realms are reused from line to line, so don't hang on to one after the
+    trigger's returned; use .root instead.
     """
 
+    __slots__ = ['metaline', 'alterer', 'display_line', 'display_group',
+                 'block', 'line_index']
+
+    #realms that have been finished with, ready for reuse.
+    _spare = []
+
     def __init__(self, metaline, root, parent, display_line):
         BaseMatchingRealm.__init__(self, root, parent)
         self.metaline = metaline
@@ -201,12 +868,45 @@ class TriggerMatchingRealm(BaseMatchingRealm):
         self.display_group = True
         self.block=[metaline]
         self.line_index=0
+
+    def _reset(self, metaline, root, parent, display_line):
+        """Get ready to match another line."""
+        self.root = root
+        self.parent = parent
+        del self._writing_after[:]
+        self.metaline = metaline
+        self.alterer.reset()
+        self.display_line = display_line
+        self.display_group = True
+        self.block[:] = [metaline]
+        self.line_index = 0
+
+    @classmethod
+    def match_line(cls, metaline, root, parent, display_line = True):
+        """Match a line against the triggers and display it, using a spare
+        realm if there is one.
+        """
+        if cls._spare:
+            realm = cls._spare.pop()
+            realm._reset(metaline, root, parent, display_line)
+        else:
+            realm = cls(metaline, root, parent, display_line)
+        try:
+            realm.process()
+        finally:
+            #don't keep the line alive while we're waiting to be reused.
+            realm.metaline = None
+            del realm.block[:]
+            if len(cls._spare) < MAX_SPARE:
+                cls._spare.append(realm)
+
     def process(self):
         """Do our main thing."""
-        self._match_generic(self.metaline, self.root.triggers)
+        self._match_generic(self.metaline, self.root.trigger_index.candidates(
+                                      self.root.triggers, self.metaline.line))
         metaline = self.alterer.apply(self.metaline)
         if self.display_line:
-            self.parent.write(metaline)
+            self._display(metaline)
         self._write_after()
 
     def send(self, line, echo = False):
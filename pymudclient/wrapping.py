@@ -0,0 +1,119 @@
+"""Word wrapping for metalines.
+
+This breaks lines in the same places as textwrap.TextWrapper does with
+drop_whitespace off, but works out the break positions in one pass over the
+words, and puts the newlines and shifted colours into the metaline in one go
+instead of inserting them one by one. Tabs count as one column, as they
+aren't expanded.
+
+The same lines (prompts, mostly) come up again and again, so the break
+positions for recent lines are remembered.
+"""
+import re
+from textwrap import TextWrapper
+from bisect import bisect_right
+from pymudclient.metaline import RunLengthList
+
+_whitespace_re = re.compile(r'\s+')
+_whitespace_re_uni = re.compile(r'\s+', re.U)
+
+#how many lines' break positions to remember.
+MAX_CACHED = 512
+
+def _spread(rll, breaks):
+    """Return a copy of rll with everything moved along one for each break
+    at or before it, as if a newline had been inserted at each break.
+    """
+    res = []
+    ind = 0
+    for pos, value in rll.items():
+        while ind < len(breaks) and breaks[ind] <= pos:
+            ind += 1
+        res.append((pos + ind, value))
+    return RunLengthList(res, _normalised = True)
+
+def _break_up(text, breaks):
+    """Put newlines into text at the breaks."""
+    if not breaks:
+        return text
+    bounds = zip((0,) + breaks, breaks + (len(text),))
+    return '\n'.join(text[start:end] for start, end in bounds)
+
+class LineWrapper(object):
+    """Wraps metalines to a given width."""
+
+    wordsep_re = TextWrapper.wordsep_re
+    wordsep_re_uni = re.compile(TextWrapper.wordsep_re.pattern, re.U)
+
+    def __init__(self, width = 100):
+        self._cache = {}
+        self.width = width
+
+    @property
+    def width(self):
+        return self._width
+
+    @width.setter
+    def width(self, width):
+        if width <= 0:
+            raise ValueError("Invalid width %r (must be > 0)" % (width,))
+        self._width = width
+        self._cache.clear()
+
+    def breaks(self, text):
+        """Return a tuple of where newlines need to go in text."""
+        width = self._width
+        if len(text) <= width:
+            return ()
+        try:
+            return self._cache[text]
+        except KeyError:
+            pass
+        #where the chunks (words, runs of whitespace and hyphenated bits)
+        #start and end. Lines are broken between chunks if possible.
+        bounds = [0]
+        #without hyphens, only the whitespace matters, and that's much
+        #quicker to find. As with TextWrapper, unicode text is split on
+        #unicode whitespace.
+        if isinstance(text, unicode):
+            splitter = self.wordsep_re_uni if '-' in text \
+                       else _whitespace_re_uni
+        else:
+            splitter = self.wordsep_re if '-' in text else _whitespace_re
+        for match in splitter.finditer(text):
+            bounds.append(match.start())
+            bounds.append(match.end())
+        bounds.append(len(text))
+        res = []
+        start = 0
+        while len(text) - start > width:
+            ind = bisect_right(bounds, start + width) - 1
+            end = bounds[ind]
+            if end <= start or bounds[ind + 1] - end > width:
+                #the next chunk will never fit on a line by itself, so fill
+                #this line up with as much of it as will go.
+                end = start + width
+            res.append(end)
+            start = end
+        res = tuple(res)
+        if len(self._cache) >= MAX_CACHED:
+            self._cache.clear()
+        self._cache[text] = res
+        return res
+
+    def fill(self, text):
+        """Return text, wrapped."""
+        return _break_up(text, self.breaks(text))
+
+    def wrap_metaline(self, metaline):
+        """Return a wrapped copy of metaline.
+
+        The newlines take on the colour of the text before them.
+        """
+        res = metaline.copy()
+        breaks = self.breaks(metaline.line)
+        if breaks:
+            res.line = _break_up(metaline.line, breaks)
+            res.fores = _spread(metaline.fores, breaks)
+            res.backs = _spread(metaline.backs, breaks)
+        return res